@@ -0,0 +1,2 @@
+# Lets pytest import the app packages (llm, memory, knowledge_base, ...)
+# from the repo root, the same way ChatBot.py runs them.
@@ -2,11 +2,19 @@ from pygments import lex
 from pygments.lexers import guess_lexer, PythonLexer, JsonLexer
 from pygments.token import Token
 
+CODE_BLOCK_START = "------- CODE BLOCK START -------\n"
+CODE_BLOCK_END = "\n------- CODE BLOCK END -------\n"
+
 def insert_code_block(text_widget, code: str):
     """Insert syntax-highlighted code into a Tkinter Text widget."""
     # Add visible separators ABOVE and BELOW
-    text_widget.insert("end", "------- CODE BLOCK START -------\n", "code_separator")
+    text_widget.insert("end", CODE_BLOCK_START, "code_separator")
+    insert_code_tokens(text_widget, code)
+    text_widget.insert("end", CODE_BLOCK_END, "code_separator")
+
 
+def insert_code_tokens(text_widget, code: str):
+    """Insert just the highlighted code (no separators) at the end of the widget."""
     try:
         lexer = guess_lexer(code)
     except Exception:
@@ -26,8 +34,6 @@ def insert_code_block(text_widget, code: str):
 
         text_widget.insert("end", token_value, tag)
 
-    text_widget.insert("end", "\n------- CODE BLOCK END -------\n", "code_separator")
-
 
 def classify_token(tok):
     """Return the Tkinter tag name for a Pygments token."""
@@ -1,4 +1,7 @@
-from llm.executor import run_ollama
+from llm.executor import run_ollama, stop_generation
+from llm.models import MODELS, AUTO_MODEL, ROUTER_TIERS
+from llm.residency import get_residency
+from llm.scheduler import INTERACTIVE
 from memory.history import save_conversation, load_conversation
 from memory.conversation import clear_conversation_data
 from knowledge_base.code.indexer import index_files
@@ -6,10 +9,20 @@ from tkinter import messagebox
 
 def bind_events(root, w):
     w["run_btn"]["command"] = lambda: run_ollama(root, w)
+    w["stop_btn"]["command"] = lambda: stop_generation(w["output_text"])
     w["save_btn"]["command"] = lambda: save_conversation(w["output_text"])
     w["load_btn"]["command"] = lambda: load_conversation(w["output_text"])
     w["clear_btn"]["command"] = lambda: clear_conversation(root, w)
     w["man_index_btn"]["command"] = lambda: index_files()
+    w["model_menu"].bind("<<ComboboxSelected>>", lambda e: warm_selected_model(w))
+
+
+def warm_selected_model(w):
+    #start loading the chosen model while the prompt is being typed
+    name = w["model_var"].get()
+    if name == AUTO_MODEL:
+        name = ROUTER_TIERS["fast"]  #where most Auto turns go
+    get_residency().warm(MODELS[name], priority=INTERACTIVE)
 
 
 def clear_conversation(root, w):
@@ -1,8 +1,14 @@
 import tkinter as tk
 from gui.widgets import create_widgets
 from gui.events import bind_events
+from knowledge_base.code.retriever import get_resident_index
+from llm.models import MODELS, WARM_ON_STARTUP
+from llm.residency import warm_on_startup
 
 def run_app():
+    # load the retrieval index off the Tk thread while the window comes up
+    get_resident_index().start_background_load()
+
     root = tk.Tk()
     root.title("ChatBot Application")
     root.minsize(700, 500)
@@ -10,6 +16,10 @@ def run_app():
     widgets = create_widgets(root)
     bind_events(root, widgets)
 
+    # preload the default model and the summarizer; queued, so nothing blocks here
+    if WARM_ON_STARTUP:
+        warm_on_startup(MODELS[widgets["model_var"].get()])
+
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+import time
+import threading
+import tkinter as tk
+
+from gui.code_highlight import CODE_BLOCK_START, CODE_BLOCK_END, insert_code_tokens
+from llm.stream_parser import FenceParser
+
+# Widget updates are batched to roughly one per frame (ms)
+FRAME_MS = 33
+
+#==============================================================================
+#Streamed reply renderer
+#==============================================================================
+class StreamRenderer:
+    """
+    Shows a streamed model reply in the output pane.
+
+    push() / close() can be called from the model thread. They only queue
+    text; a root.after tick drains the queue once per frame, runs it through
+    the fence parser and inserts the result, so a fast stream turns into a
+    few widget inserts per frame and the Tk loop stays responsive.
+    Code streams in plain first and is re-inserted highlighted when its
+    block closes.
+    """
+
+    def __init__(self, root, text_widget, on_first=None, on_done=None):
+        self.root = root
+        self.text_widget = text_widget
+        self.on_first = on_first
+        self.on_done = on_done
+        self.parser = FenceParser()
+        self.parts = []
+        self.start = time.perf_counter()
+        self.first_chunk_seconds = None
+        self.frames = 0
+        self._pending = []
+        self._closed = False
+        self._started = False
+        self._lock = threading.Lock()
+        root.after(FRAME_MS, self._tick)
+
+    def push(self, text):
+        with self._lock:
+            if self.first_chunk_seconds is None:
+                self.first_chunk_seconds = time.perf_counter() - self.start
+            self._pending.append(text)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+
+    def text(self):
+        return "".join(self.parts)
+
+    def _tick(self):
+        with self._lock:
+            chunk = "".join(self._pending)
+            self._pending.clear()
+            closed = self._closed
+
+        if chunk or closed:
+            if not self._started:
+                self._started = True
+                if self.on_first:
+                    self.on_first()
+        if chunk:
+            self.parts.append(chunk)
+            self._render(self.parser.feed(chunk))
+            self.frames += 1
+
+        if closed:
+            self._render(self.parser.finish())
+            if self.on_done:
+                self.on_done(self.text())
+            return
+        self.root.after(FRAME_MS, self._tick)
+
+    def _render(self, events):
+        w = self.text_widget
+        for kind, value in events:
+            if kind == "text":
+                w.insert(tk.END, value, "assistant_text")
+            elif kind == "code_start":
+                w.insert(tk.END, CODE_BLOCK_START, "code_separator")
+                # left gravity: the mark stays before the code streamed after it
+                w.mark_set("stream_code_start", "end-1c")
+                w.mark_gravity("stream_code_start", "left")
+            elif kind == "code":
+                w.insert(tk.END, value, "code_plain")
+            elif kind == "code_end":
+                w.delete("stream_code_start", "end-1c")
+                insert_code_tokens(w, value)
+                w.insert(tk.END, CODE_BLOCK_END, "code_separator")
+                w.insert(tk.END, "\n")
+        if events:
+            w.see(tk.END)
@@ -5,7 +5,7 @@ import tkinter as tk
 #==============================================================================
 def start_thinking_timer(root, output_text):
     """Start the 'Thinking...' timer and return state control container."""
-    state = {"running": True, "id": None, "start": time.time()}
+    state = {"running": True, "id": None, "start": time.time(), "label": "Thinking"}
 
     def update():
         if not state["running"]:
@@ -20,7 +20,8 @@ def start_thinking_timer(root, output_text):
                 pass
 
         elapsed = int(time.time() - state["start"])
-        output_text.insert(tk.END, f"Thinking... {elapsed} seconds\n", "thinking")
+        # the model thread may swap the label, e.g. "Queued (#2)" while waiting its turn
+        output_text.insert(tk.END, f"{state['label']}... {elapsed} seconds\n", "thinking")
         output_text.see(tk.END)
 
         state["id"] = root.after(1000, update)
@@ -1,6 +1,6 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, font
-from llm.models import MODELS, DEFAULT_MAX_MESSAGES, AUTO_SUMMARIZE
+from llm.models import MODELS, DEFAULT_MAX_MESSAGES, AUTO_SUMMARIZE, RESPONSE_CACHE, AUTO_ROUTING, AUTO_MODEL
 
 def create_widgets(root) -> dict:
     widgets = {}
@@ -16,8 +16,10 @@ def create_widgets(root) -> dict:
 
     tk.Label(top_frame, text = "Select Model:").pack(side="left")
     model_var = tk.StringVar(value=list(MODELS.keys())[0])
+    #"Auto" lets the router pick the model per prompt
+    model_names = ([AUTO_MODEL] if AUTO_ROUTING else []) + list(MODELS.keys())
     model_menu = ttk.Combobox(top_frame, textvariable=model_var,
-                              values=list(MODELS.keys()), state="readonly", width=30)
+                              values=model_names, state="readonly", width=30)
     model_menu.pack(side="left", padx=(6,20))
     #pass into widgets dict
     widgets["model_var"] = model_var
@@ -40,6 +42,13 @@ def create_widgets(root) -> dict:
     #pass into widgets dict
     widgets["auto_summarize_var"] = auto_var
 
+    #Response cache checkbox (opt-in: repeated prompts are answered from the cache)
+    cache_var = tk.BooleanVar(value=RESPONSE_CACHE)
+    cache_chk = tk.Checkbutton(top_frame, text="Cache replies", variable=cache_var)
+    cache_chk.pack(side="left", padx=6)
+    #pass into widgets dict
+    widgets["cache_replies_var"] = cache_var
+
 
 
 
@@ -64,6 +73,10 @@ def create_widgets(root) -> dict:
     widgets["run_btn"] = tk.Button(btn_row, text="Run Prompt")
     widgets["run_btn"].pack(side="left")
 
+    #Stop the running generation / summarization
+    widgets["stop_btn"] = tk.Button(btn_row, text = "Stop")
+    widgets["stop_btn"].pack(side="left", padx = 6)
+
     widgets["save_btn"] = tk.Button(btn_row, text = "Save Conversation")
     widgets["save_btn"].pack(side="left", padx = 6)
 
@@ -102,6 +115,7 @@ def create_widgets(root) -> dict:
     # Assistant Message tags
     output_text.tag_config("assistant_header", font=header_font, foreground="#34a853")
     output_text.tag_config("assistant_text", font=assistant_font, foreground="#2d7d46")
+    output_text.tag_config("cached_marker", foreground="#8a8a8a", font=("Helvetica", 10, "italic"))
     # Thinking text tag
     output_text.tag_config("thinking", font=user_font, foreground="gray")
     
@@ -0,0 +1,232 @@
+# ann.py
+import os
+import sys
+import time
+from math import sqrt
+from pathlib import Path
+from typing import List, Dict, Any, Tuple, Optional
+
+from knowledge_base.code.embedding_store import STORE_BASE, store_paths
+from knowledge_base.code.scoring import ScoringEngine, np
+
+#Below this many chunks brute force is already fast, don't bother with IVF
+ANN_MIN_CHUNKS = 2000
+
+#How many inverted lists to scan per query. Higher = better recall, slower.
+DEFAULT_NPROBE = 8
+
+#k-means settings
+KMEANS_ITERS = 12
+KMEANS_SAMPLE_PER_LIST = 256
+
+#============================================================
+#IVF index (k-means centroids + inverted lists of rows)
+#============================================================
+class IVFIndex:
+    """
+    Inverted-file index over a ScoringEngine's normalized matrix.
+
+    Chunks are clustered with spherical k-means. A query scores the
+    centroids, scans the 'nprobe' closest lists only and does the exact
+    dot product on those candidates.
+    """
+
+    def __init__(self, centroids, list_offsets, list_rows, generation: int = 0):
+        self.centroids = centroids          # (n_lists, dim) float32, unit rows
+        self.list_offsets = list_offsets    # (n_lists + 1,) int64, CSR style
+        self.list_rows = list_rows          # (n_chunks,) int64 engine row positions
+        self.generation = generation
+
+    @property
+    def n_lists(self) -> int:
+        return int(self.centroids.shape[0])
+
+    def candidates(self, q, nprobe: int):
+        """Engine row positions living in the nprobe lists closest to q."""
+        nprobe = max(1, min(nprobe, self.n_lists))
+        centroid_scores = self.centroids @ q
+        if nprobe < self.n_lists:
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.n_lists)
+        parts = [self.list_rows[self.list_offsets[l]:self.list_offsets[l + 1]] for l in probe]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def search(self, engine: ScoringEngine, query_emb: List[float],
+               top_k: int = 5, nprobe: int = DEFAULT_NPROBE) -> List[Tuple[float, Dict[str, Any]]]:
+        q = engine.normalize_query(query_emb)
+        if q is None:
+            return []
+        cand = self.candidates(q, nprobe)
+        if cand.shape[0] == 0:
+            return []
+        return engine.search(query_emb, top_k, positions=cand)
+
+    def memory_bytes(self) -> int:
+        return int(self.centroids.nbytes + self.list_offsets.nbytes + self.list_rows.nbytes)
+
+#============================================================
+#Build
+#============================================================
+def _assign(matrix, centroids, batch: int = 65536):
+    """Nearest centroid for every row, in batches to cap the temp score matrix."""
+    out = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], batch):
+        out[start:start + batch] = np.argmax(matrix[start:start + batch] @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(matrix, n_lists: int, iters: int = KMEANS_ITERS, seed: int = 0):
+    """Spherical k-means on (a sample of) unit rows. Returns unit centroids."""
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    sample_size = min(n, n_lists * KMEANS_SAMPLE_PER_LIST)
+    sample = matrix[rng.choice(n, size=sample_size, replace=False)]
+
+    centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+    for _ in range(iters):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=n_lists)
+
+        # re-seed empty lists from random sample points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-15)).astype(np.float32)
+    return centroids
+
+
+def build_ivf(engine: ScoringEngine, n_lists: Optional[int] = None,
+              generation: int = 0, seed: int = 0) -> IVFIndex:
+    """Cluster the engine's matrix and build the inverted lists."""
+    if np is None:
+        raise RuntimeError("The ANN index needs NumPy")
+    n = len(engine)
+    if n_lists is None:
+        n_lists = max(1, int(round(sqrt(n))))
+    n_lists = max(1, min(n_lists, n))
+
+    centroids = kmeans(engine.matrix, n_lists, seed=seed)
+    labels = _assign(engine.matrix, centroids)
+
+    order = np.argsort(labels, kind="stable")
+    counts = np.bincount(labels, minlength=n_lists)
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return IVFIndex(centroids, offsets, order.astype(np.int64), generation)
+
+#============================================================
+#Persistence (index.ivf.npz next to the store)
+#============================================================
+def ivf_path(base: Path = STORE_BASE) -> Path:
+    return store_paths(base)["ivf"]
+
+
+def save_ivf(ivf: IVFIndex, base: Path = STORE_BASE) -> None:
+    path = ivf_path(base)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez(f, centroids=ivf.centroids, list_offsets=ivf.list_offsets,
+                 list_rows=ivf.list_rows, generation=np.int64(ivf.generation))
+    os.replace(tmp, path)
+
+
+def load_ivf(base: Path = STORE_BASE, generation: Optional[int] = None) -> Optional[IVFIndex]:
+    """
+    Load the IVF sidecar if there is one. Returns None when it's missing,
+    NumPy isn't installed, or it was built for another store generation.
+    """
+    path = ivf_path(base)
+    if np is None or not path.exists():
+        return None
+    with np.load(path) as data:
+        ivf = IVFIndex(data["centroids"], data["list_offsets"],
+                       data["list_rows"], int(data["generation"]))
+    if generation is not None and ivf.generation != generation:
+        print(f"Ignoring stale ANN index {path} (generation {ivf.generation} != {generation})")
+        return None
+    return ivf
+
+
+def remove_ivf(base: Path = STORE_BASE) -> None:
+    path = ivf_path(base)
+    if path.exists():
+        path.unlink()
+
+
+def build_and_save_ivf(store, base: Path = STORE_BASE,
+                       min_chunks: int = ANN_MIN_CHUNKS) -> Optional[IVFIndex]:
+    """
+    Called by the indexer after the store is written. Small indexes (or no
+    NumPy) get no IVF file so the retriever stays on the exact path.
+    """
+    if np is None or len(store) < min_chunks:
+        remove_ivf(base)
+        return None
+    start = time.perf_counter()
+    ivf = build_ivf(ScoringEngine(store), generation=store.generation)
+    save_ivf(ivf, base)
+    print(f"ANN index: {ivf.n_lists} lists over {len(store)} chunks "
+          f"in {time.perf_counter() - start:.2f}s")
+    return ivf
+
+#============================================================
+#Recall check against the exact path
+#============================================================
+def recall_at_k(engine: ScoringEngine, ivf: IVFIndex, queries: List[List[float]],
+                k: int = 5, nprobe: int = DEFAULT_NPROBE) -> Dict[str, float]:
+    """
+    Fraction of the exact top-k ids the IVF search also returns, averaged
+    over 'queries', plus mean latency of both paths in milliseconds.
+    """
+    hits = 0
+    total = 0
+    exact_s = ann_s = 0.0
+    for q in queries:
+        t0 = time.perf_counter()
+        exact = engine.search(q, k)
+        t1 = time.perf_counter()
+        approx = ivf.search(engine, q, k, nprobe=nprobe)
+        t2 = time.perf_counter()
+        exact_s += t1 - t0
+        ann_s += t2 - t1
+
+        exact_ids = {c["id"] for _, c in exact}
+        hits += len(exact_ids & {c["id"] for _, c in approx})
+        total += len(exact_ids)
+
+    n = max(1, len(queries))
+    return {
+        "nprobe": nprobe,
+        "recall": hits / total if total else 1.0,
+        "exact_ms": 1000 * exact_s / n,
+        "ann_ms": 1000 * ann_s / n,
+    }
+
+
+def sample_queries(engine: ScoringEngine, count: int = 100, noise: float = 0.05, seed: int = 0):
+    """Perturbed copies of random chunk embeddings, a stand-in for real queries."""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(engine), size=min(count, len(engine)), replace=False)
+    q = engine.matrix[picks] + rng.normal(0, noise, (len(picks), engine.dim)).astype(np.float32)
+    return [row.tolist() for row in q]
+
+
+if __name__ == "__main__":
+    #python -m knowledge_base.code.ann [nprobe ...]  -> recall@5 table for the current index
+    from knowledge_base.code.embedding_store import EmbeddingStore
+
+    store = EmbeddingStore(STORE_BASE)
+    engine = ScoringEngine(store)
+    ivf = load_ivf(STORE_BASE, store.generation) or build_ivf(engine, generation=store.generation)
+    probes = [int(a) for a in sys.argv[1:]] or [1, 2, 4, 8, 16, 32]
+    queries = sample_queries(engine)
+    print(f"{len(engine)} chunks, {ivf.n_lists} lists")
+    for nprobe in probes:
+        r = recall_at_k(engine, ivf, queries, k=5, nprobe=nprobe)
+        print(f"nprobe={nprobe:<4} recall@5={r['recall']:.3f} "
+              f"exact={r['exact_ms']:.2f}ms ann={r['ann_ms']:.2f}ms")
@@ -0,0 +1,183 @@
+# chunker.py
+import ast
+import re
+from pathlib import Path
+from typing import List, Tuple
+
+#Window chunker settings (the original indexer behaviour)
+WINDOW_MAX_CHARS = 800
+WINDOW_OVERLAP = 200
+
+#Syntax-aware chunks can be bigger: they don't overlap and don't cut mid-body
+SYNTAX_MAX_CHARS = 1500
+
+#Bump when the chunk boundaries change, so the indexer re-chunks files it
+#already indexed the old way (stored in each manifest entry)
+CHUNKER_VERSION = 2
+
+_HEADING_RE = re.compile(r"^#{1,6}\s")
+
+Span = Tuple[int, int]
+
+#============================================================
+#Window chunker (fallback for everything else)
+#============================================================
+def window_spans(text: str, max_chars: int = WINDOW_MAX_CHARS,
+                 overlap: int = WINDOW_OVERLAP) -> List[Span]:
+    """Fixed-size (start, end) windows with overlap, same cuts as the old chunk_text."""
+    spans = []
+    start = 0
+    while start < len(text):
+        spans.append((start, min(start + max_chars, len(text))))
+        start += max_chars - overlap
+    return spans
+
+
+def window_stats(text_len: int, max_chars: int = WINDOW_MAX_CHARS,
+                 overlap: int = WINDOW_OVERLAP) -> Tuple[int, int]:
+    """(chunk count, chars embedded) the window chunker would produce, without chunking."""
+    step = max_chars - overlap
+    starts = range(0, max(text_len, 0), step)
+    return len(starts), sum(min(max_chars, text_len - s) for s in starts)
+
+#============================================================
+#Shared helpers
+#============================================================
+def _line_offsets(text: str) -> List[int]:
+    """Char offset of the start of every line (1-based line -> offsets[line - 1])."""
+    return [0] + [m.end() for m in re.finditer("\n", text)]
+
+
+def _pack(spans: List[Span], max_chars: int) -> List[Span]:
+    """
+    Merge neighbouring small spans up to max_chars and window-split any span
+    that is too big on its own.
+    """
+    out = []
+    cur = None
+    for start, end in spans:
+        if end <= start:
+            continue
+        if end - start > max_chars:
+            if cur:
+                out.append(cur)
+                cur = None
+            out.extend(_window_range(start, end, max_chars))
+            continue
+        if cur and end - cur[0] <= max_chars:
+            cur = (cur[0], end)
+        else:
+            if cur:
+                out.append(cur)
+            cur = (start, end)
+    if cur:
+        out.append(cur)
+    return out
+
+
+def _window_range(start: int, end: int, max_chars: int) -> List[Span]:
+    """Window-split the [start, end) range of a file (no redundant tail window)."""
+    spans = []
+    pos = start
+    step = max_chars - min(WINDOW_OVERLAP, max_chars // 4)
+    while pos < end:
+        spans.append((pos, min(pos + max_chars, end)))
+        if pos + max_chars >= end:
+            break
+        pos += step
+    return spans
+
+
+def _split_at(starts: List[int], begin: int, end: int) -> List[Span]:
+    """Cut [begin, end) at the given offsets (each piece runs to the next start)."""
+    cuts = [begin] + [s for s in starts if begin < s < end] + [end]
+    return list(zip(cuts, cuts[1:]))
+
+#============================================================
+#Python: module-level functions, classes, methods
+#============================================================
+def _node_start(node) -> int:
+    """First line of a node, including its decorators."""
+    decorators = getattr(node, "decorator_list", [])
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def _node_starts(nodes, after_line: int, off) -> List[int]:
+    """
+    Char offset where each node's piece begins: right after the previous
+    node's last line, so the comments and blank lines in between go with
+    the node they precede. The first piece begins after 'after_line'.
+    """
+    starts = []
+    prev_end = after_line
+    for node in nodes:
+        starts.append(off(min(_node_start(node), prev_end + 1)))
+        prev_end = node.end_lineno
+    return starts
+
+
+def python_spans(text: str, max_chars: int = SYNTAX_MAX_CHARS) -> List[Span]:
+    """
+    Split Python source on top-level statement boundaries. Comments and
+    blank lines stay with the definition that follows them. A class that
+    doesn't fit is split again on its methods. Raises SyntaxError.
+    """
+    tree = ast.parse(text)
+    offsets = _line_offsets(text)
+
+    def off(line):
+        return offsets[min(line, len(offsets)) - 1]
+
+    nodes = tree.body
+    pieces = _split_at(_node_starts(nodes, 0, off), 0, len(text))
+    if len(pieces) > len(nodes):
+        nodes = [None] + nodes  # a file of only comments / blank lines
+
+    spans = []
+    for (begin, end), node in zip(pieces, nodes):
+        if isinstance(node, ast.ClassDef) and end - begin > max_chars and len(node.body) > 1:
+            method_starts = _node_starts(node.body[1:], node.body[0].end_lineno, off)
+            spans.extend(_split_at(method_starts, begin, end))
+        else:
+            spans.append((begin, end))
+    return _pack(spans, max_chars)
+
+#============================================================
+#Markdown: headings
+#============================================================
+def markdown_spans(text: str, max_chars: int = SYNTAX_MAX_CHARS) -> List[Span]:
+    """Split markdown before every heading line that isn't inside a ``` fence."""
+    starts = []
+    in_fence = False
+    for pos, line in zip(_line_offsets(text), text.split("\n")):
+        stripped = line.lstrip()
+        if stripped.startswith("```"):
+            in_fence = not in_fence
+        elif not in_fence and _HEADING_RE.match(stripped):
+            starts.append(pos)
+    return _pack(_split_at(starts, 0, len(text)), max_chars)
+
+#============================================================
+#Dispatch
+#============================================================
+def chunk_spans(path, text: str) -> List[Span]:
+    """(start, end) char spans for a file, picking the chunker by extension."""
+    ext = Path(path).suffix.lower()
+    if ext == ".py":
+        try:
+            return python_spans(text)
+        except (SyntaxError, ValueError):
+            pass  # not valid python (or null bytes), use windows
+    elif ext == ".md":
+        return markdown_spans(text)
+    return window_spans(text)
+
+
+def chunk_file(path, text: str) -> List[str]:
+    """Chunk texts for a file. Whitespace-only chunks are dropped."""
+    return [chunk for _, chunk in chunk_file_spans(path, text)]
+
+
+def chunk_file_spans(path, text: str) -> List[Tuple[Span, str]]:
+    """Like chunk_file, but each chunk comes with its (start, end) span."""
+    return [((s, e), text[s:e]) for s, e in chunk_spans(path, text) if text[s:e].strip()]
@@ -0,0 +1,393 @@
+# embedding_store.py
+import os
+import sys
+import json
+import mmap
+from array import array
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Tuple
+
+#Default store location (files are index.vec / index.txt / index.meta.json)
+STORE_BASE = Path("knowledge_base/embeddings/index")
+
+#Old pretty-printed JSON index, kept around for the converter
+LEGACY_INDEX_PATH = Path("knowledge_base/embeddings/index.json")
+
+STORE_FORMAT = 1
+
+#Approximate Python heap cost of one metadata dict (used for footprint stats)
+_META_BYTES_PER_CHUNK = 400
+
+#============================================================
+#File layout helpers
+#============================================================
+def store_paths(base: Path = STORE_BASE) -> Dict[str, Path]:
+    """
+    Return the files that make up a store:
+        vec  - contiguous little-endian float32 matrix, one row per chunk
+        text - utf-8 chunk texts back to back
+        meta - JSON sidecar with dim and per-chunk row / text offsets
+        ivf  - optional ANN index built from the vectors (see ann.py)
+        quant - optional float16 / int8 copy of the vectors (see quantize.py)
+        manifest - per-file size / mtime / hash used for incremental indexing
+    """
+    base = Path(base)
+    return {
+        "vec": base.with_name(base.name + ".vec"),
+        "text": base.with_name(base.name + ".txt"),
+        "meta": base.with_name(base.name + ".meta.json"),
+        "ivf": base.with_name(base.name + ".ivf.npz"),
+        "quant": base.with_name(base.name + ".quant.npz"),
+        "manifest": base.with_name(base.name + ".manifest.json"),
+    }
+
+
+def store_exists(base: Path = STORE_BASE) -> bool:
+    return store_paths(base)["meta"].exists()
+
+
+def read_generation(base: Path = STORE_BASE) -> int:
+    """Generation counter of the store on disk (0 if there is none yet)."""
+    meta_path = store_paths(base)["meta"]
+    if not meta_path.exists():
+        return 0
+    try:
+        with meta_path.open("r", encoding="utf-8") as f:
+            return int(json.load(f).get("generation", 0))
+    except Exception:
+        return 0
+
+
+def _to_float32_bytes(values) -> bytes:
+    arr = array("f", values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def write_json_atomic(path: Path, data) -> None:
+    """Write JSON to a temp file and rename it over 'path'."""
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+#============================================================
+#Writer
+#============================================================
+class StoreWriter:
+    """
+    Write a store. Vectors and texts go straight to disk as they are
+    added, only the small metadata list is kept in memory.
+
+        with StoreWriter(base) as w:
+            w.add(chunk_id, file, text, embedding)
+
+    append=False builds a fresh store in temp files and swaps it in on close.
+    append=True patches the existing store in place: new rows are appended
+    to index.vec / index.txt, remove_file() drops a file's chunks from the
+    metadata (their rows become dead space until compact_store runs), and
+    the metadata is rewritten last so readers never see a half-written row.
+    """
+
+    def __init__(self, base: Path = STORE_BASE, append: bool = False):
+        self.base = Path(base)
+        self.paths = store_paths(base)
+        self.paths["meta"].parent.mkdir(parents=True, exist_ok=True)
+        self.generation = read_generation(base) + 1
+        self.append = append
+
+        if append and store_exists(base):
+            with self.paths["meta"].open("r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim = int(meta.get("dim", 0)) or None
+            self.chunks = meta.get("chunks", [])
+            self._vec_path = self.paths["vec"]
+            self._text_path = self.paths["text"]
+            self._trim_partial_rows()
+            # rows/offsets continue from the real file ends, which may be past
+            # what the metadata references if an earlier run was interrupted
+            self.rows = self._vec_path.stat().st_size // (4 * self.dim) if self.dim else 0
+            self._text_offset = self._text_path.stat().st_size if self._text_path.exists() else 0
+            mode = "ab"
+        else:
+            self.dim = None
+            self.chunks = []
+            self.rows = 0
+            self._text_offset = 0
+            if append:
+                #no store yet: start an empty one in place so flush() can checkpoint it
+                self._vec_path = self.paths["vec"]
+                self._text_path = self.paths["text"]
+            else:
+                #write to temp files, swapped in on close so readers never see half a store
+                self._vec_path = self.paths["vec"].with_name(self.paths["vec"].name + ".tmp")
+                self._text_path = self.paths["text"].with_name(self.paths["text"].name + ".tmp")
+            mode = "wb"
+
+        self._vec_f = self._vec_path.open(mode)
+        self._text_f = self._text_path.open(mode)
+
+    def _trim_partial_rows(self) -> None:
+        """Cut a half-written trailing row left behind by a crash."""
+        if not self.dim or not self._vec_path.exists():
+            return
+        size = self._vec_path.stat().st_size
+        row_bytes = 4 * self.dim
+        if size % row_bytes:
+            with self._vec_path.open("r+b") as f:
+                f.truncate(size - size % row_bytes)
+
+    def add(self, chunk_id: str, file: str, text: str, embedding: List[float],
+            span: Optional[Tuple[int, int]] = None) -> bool:
+        """
+        Append one chunk. 'span' is the chunk's (start, end) char range in its
+        source file, kept so neighbouring hits can be merged later.
+        Returns False (and skips it) on a dimension mismatch.
+        """
+        if self.dim is None:
+            self.dim = len(embedding)
+        if len(embedding) != self.dim:
+            print(f"Skipping {chunk_id}: embedding dim {len(embedding)} != {self.dim}")
+            return False
+
+        raw = text.encode("utf-8")
+        self._vec_f.write(_to_float32_bytes(embedding))
+        self._text_f.write(raw)
+
+        entry = {
+            "id": chunk_id,
+            "file": file,
+            "row": self.rows,
+            "offset": self._text_offset,
+            "length": len(raw),
+        }
+        if span is not None:
+            entry["start"], entry["end"] = span
+        self.chunks.append(entry)
+        self.rows += 1
+        self._text_offset += len(raw)
+        return True
+
+    def remove_all(self) -> int:
+        """Drop every chunk (rows stay on disk as dead space until compaction)."""
+        dropped = len(self.chunks)
+        self.chunks = []
+        return dropped
+
+    def remove_file(self, file: str) -> int:
+        """Drop every chunk that came from 'file'. Returns how many were dropped."""
+        before = len(self.chunks)
+        self.chunks = [c for c in self.chunks if c["file"] != file]
+        return before - len(self.chunks)
+
+    @property
+    def dead_rows(self) -> int:
+        return self.rows - len(self.chunks)
+
+    def flush(self) -> None:
+        """
+        Checkpoint: push appended rows to disk and publish the metadata
+        (append mode only). Rows added after the last flush are invisible to
+        readers and are simply dead space if the process dies before the next.
+        """
+        self._vec_f.flush()
+        self._text_f.flush()
+        if self.append:
+            write_json_atomic(self.paths["meta"], self._meta())
+
+    def _meta(self) -> Dict[str, Any]:
+        return {
+            "format": STORE_FORMAT,
+            "dtype": "float32",
+            "dim": self.dim or 0,
+            "rows": self.rows,
+            "generation": self.generation,
+            "chunks": self.chunks,
+        }
+
+    def close(self) -> None:
+        self._vec_f.close()
+        self._text_f.close()
+        if not self.append:
+            os.replace(self._vec_path, self.paths["vec"])
+            os.replace(self._text_path, self.paths["text"])
+        write_json_atomic(self.paths["meta"], self._meta())
+
+    def discard(self) -> None:
+        """
+        Abandon the write: a fresh store's temp files are deleted, an appended
+        store keeps the metadata of its last flush() (later rows are dead space).
+        """
+        self._vec_f.close()
+        self._text_f.close()
+        if not self.append:
+            for path in (self._vec_path, self._text_path):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def compact_store(base: Path = STORE_BASE) -> int:
+    """Rewrite the store without dead rows. Returns the number of live chunks."""
+    store = EmbeddingStore(base)
+    writer = StoreWriter(base)
+    try:
+        for i in range(len(store)):
+            c = store.chunks[i]
+            span = (c["start"], c["end"]) if "start" in c else None
+            writer.add(c["id"], c["file"], store.text(i), store.vector(i), span)
+    except BaseException:
+        writer.discard()
+        raise
+    finally:
+        # unmap before the new files are swapped in over the old ones
+        store.close()
+    writer.close()
+    return len(writer.chunks)
+
+#============================================================
+#Reader
+#============================================================
+def _map_file(path: Path):
+    """mmap a file read-only. Empty files can't be mapped, so return None."""
+    if not path.exists() or path.stat().st_size == 0:
+        return None
+    with path.open("rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class EmbeddingStore:
+    """
+    Read-only view over a store on disk. The vector and text files are mmap'd
+    so only the pages a query actually touches get read in.
+    """
+
+    def __init__(self, base: Path = STORE_BASE):
+        self.paths = store_paths(base)
+        if not self.paths["meta"].exists():
+            raise FileNotFoundError(f"Index store not found: {self.paths['meta']}")
+
+        with self.paths["meta"].open("r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        if meta.get("dtype", "float32") != "float32":
+            raise ValueError(f"Unsupported store dtype: {meta.get('dtype')}")
+
+        self.meta = meta
+        self.dim = int(meta.get("dim", 0))
+        self.generation = int(meta.get("generation", 0))
+        self.chunks = meta.get("chunks", [])
+
+        self._vec_map = _map_file(self.paths["vec"])
+        self._text_map = _map_file(self.paths["text"])
+
+        #native float view straight over the mmap, no copy
+        if self._vec_map is not None and sys.byteorder == "little":
+            self._vectors = memoryview(self._vec_map).cast("f")
+        else:
+            self._vectors = None
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def vector(self, i: int) -> List[float]:
+        """Embedding of the i-th chunk as a list of floats."""
+        row = self.chunks[i]["row"]
+        start = row * self.dim
+        if self._vectors is not None:
+            return self._vectors[start:start + self.dim].tolist()
+
+        #big-endian host: decode the row by hand
+        arr = array("f")
+        arr.frombytes(self._vec_map[start * 4:(start + self.dim) * 4])
+        arr.byteswap()
+        return arr.tolist()
+
+    def text(self, i: int) -> str:
+        c = self.chunks[i]
+        if self._text_map is None:
+            return ""
+        raw = self._text_map[c["offset"]:c["offset"] + c["length"]]
+        return raw.decode("utf-8", errors="ignore")
+
+    def chunk(self, i: int) -> Dict[str, Any]:
+        """
+        Chunk dict in the same shape the old JSON loader produced (minus the
+        embedding), plus its position 'pos' and source span when known.
+        """
+        c = self.chunks[i]
+        chunk = {"id": c["id"], "file": c["file"], "text": self.text(i), "pos": i}
+        if "start" in c:
+            chunk["start"], chunk["end"] = c["start"], c["end"]
+        return chunk
+
+    def memory_bytes(self) -> int:
+        """Rough footprint: mapped vector/text pages plus the metadata list."""
+        mapped = sum(len(m) for m in (self._vec_map, self._text_map) if m is not None)
+        return mapped + len(self.chunks) * _META_BYTES_PER_CHUNK
+
+    def close(self) -> None:
+        if self._vectors is not None:
+            self._vectors.release()
+            self._vectors = None
+        for m in (self._vec_map, self._text_map):
+            if m is not None:
+                m.close()
+        self._vec_map = self._text_map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+#============================================================
+#One-shot converter from the old JSON index
+#============================================================
+def convert_json_index(json_path: Path = LEGACY_INDEX_PATH,
+                       base: Path = STORE_BASE) -> int:
+    """
+    Convert an old index.json (list of {id, source/file, text, embedding})
+    into the binary store. Returns the number of chunks written.
+    """
+    json_path = Path(json_path)
+    with json_path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    if not isinstance(data, list):
+        raise ValueError("Index file must contain a JSON list of chunks")
+
+    written = 0
+    with StoreWriter(base) as writer:
+        for i, entry in enumerate(data):
+            if not isinstance(entry, dict):
+                continue
+            emb = entry.get("embedding")
+            if isinstance(emb, dict) and "embedding" in emb:
+                emb = emb["embedding"]
+            if not isinstance(emb, list) or not emb:
+                continue
+            file = entry.get("file") or entry.get("source") or "unknown"
+            chunk_id = entry.get("id", f"{file}:{i}")
+            if writer.add(chunk_id, file, entry.get("text", ""), [float(x) for x in emb]):
+                written += 1
+    return written
+
+
+if __name__ == "__main__":
+    #python -m knowledge_base.code.embedding_store [index.json] [out_base]
+    src = Path(sys.argv[1]) if len(sys.argv) > 1 else LEGACY_INDEX_PATH
+    dst = Path(sys.argv[2]) if len(sys.argv) > 2 else STORE_BASE
+    count = convert_json_index(src, dst)
+    print(f"Converted {count} chunks from {src} -> {store_paths(dst)['meta'].parent}")
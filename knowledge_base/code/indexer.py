@@ -1,8 +1,24 @@
 import os
 import json
+import time
+import queue
+import hashlib
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from knowledge_base.code.embedding_store import (
+    StoreWriter, EmbeddingStore, STORE_BASE, store_paths, store_exists,
+    compact_store, write_json_atomic
+)
+from knowledge_base.code.ann import build_and_save_ivf
+from knowledge_base.code.quantize import build_and_save_quantized, QUANTIZATION
+from knowledge_base.code.chunker import chunk_file_spans, window_stats, CHUNKER_VERSION
+from llm.models import EMBED_BACKEND, EMBED_BATCH_SIZE
+from llm.ollama_client import get_client, OllamaError
+from llm.scheduler import get_scheduler, INDEXING
+
 PROJECT_ROOT = Path(".")  # index everything in your repo
 
 SKIP_FOLDERS = [
@@ -15,7 +31,19 @@ SKIP_FOLDERS = [
     "embeddings"
 ]
 
-INDEX_PATH = "knowledge_base/embeddings/index.json"
+EMBEDDING_MODEL = "embeddinggemma:300m"
+
+INDEX_PATH = STORE_BASE  # writes index.vec / index.txt / index.meta.json
+
+#Rewrite the store once dead rows outnumber live ones (and at least this many)
+COMPACT_MIN_DEAD_ROWS = 1000
+
+#Embedding pipeline: parallel embedding calls, files waiting on the writer,
+#and how often the writer checkpoints store + manifest
+EMBED_WORKERS = 4
+PIPELINE_QUEUE_SIZE = 16
+CHECKPOINT_EVERY_FILES = 25
+CHECKPOINT_EVERY_SECONDS = 10
 
 #clarifying which extensions are allowed
 ALLOWED_EXTENSIONS = {
@@ -29,7 +57,7 @@ ALLOWED_EXTENSIONS = {
 def embed_text(text):
     """Send text to Ollama and return an embedding vector."""
     result = subprocess.run(
-        ["ollama", "run", "embeddinggemma:300m"],
+        ["ollama", "run", EMBEDDING_MODEL],
         input=text.encode("utf-8"),
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE
@@ -41,11 +69,31 @@ def embed_text(text):
         print("Embedding parse error:", e)
         return None
 
+def embed_texts(texts):
+    """
+    Embed a batch of chunks in one go. Uses the pooled HTTP client when
+    EMBED_BACKEND is "http" and falls back to one `ollama run` per text.
+    Returns a list with None for texts that failed.
+    """
+    if not texts:
+        return []
+    scheduler = get_scheduler()
+    if EMBED_BACKEND == "http":
+        try:
+            return scheduler.run(get_client().embed, texts, EMBEDDING_MODEL,
+                                 model=EMBEDDING_MODEL, priority=INDEXING, label="index-embed")
+        except OllamaError as e:
+            print("HTTP embedding failed, falling back to ollama run:", e)
+    return scheduler.run(lambda: [embed_text(t) for t in texts],
+                         model=EMBEDDING_MODEL, priority=INDEXING, label="index-embed")
+
 #=============================================================
 #Auto chunker with chunk size
 #=============================================================
 def chunk_text(text, max_chars=800, chunk_overlap = 200):
-    """Simple fixed-size chunking with overlap to include context"""
+    """Simple fixed-size chunking with overlap to include context
+    (index_files goes through chunker.chunk_file, which falls back to this
+    windowing for file types it can't split on syntax)"""
     chunks = []
     start = 0
     while start < len(text):
@@ -54,13 +102,26 @@ def chunk_text(text, max_chars=800, chunk_overlap = 200):
     return chunks
 
 #=============================================================
-#Main indexer function
+#Manifest of what is already indexed (path -> size, mtime, hash)
 #=============================================================
-def index_files():
-    all_chunks = []
+def load_manifest():
+    path = store_paths(INDEX_PATH)["manifest"]
+    if not path.exists() or not store_exists(INDEX_PATH):
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print("Manifest unreadable, doing a full re-index:", e)
+        return {}
+
+
+def save_manifest(manifest):
+    write_json_atomic(store_paths(INDEX_PATH)["manifest"], manifest)
 
-    print("Walking project folders...\n")
 
+def iter_project_files():
+    """Yield every indexable file path under PROJECT_ROOT."""
     for root, dirs, files in os.walk(PROJECT_ROOT):
 
         # skip unwanted folders
@@ -71,35 +132,223 @@ def index_files():
             ext = os.path.splitext(filename)[1].lower()
             if ext not in ALLOWED_EXTENSIONS:
                 continue  # skip binary, images, etc.
+            yield Path(root) / filename
+
+#=============================================================
+#Main indexer function
+#=============================================================
+def index_files(workers=None):
+    """
+    Bring the index up to date with the project folder.
+
+    Files whose size and mtime match the manifest (and that the current
+    CHUNKER_VERSION chunked) are skipped without being read; files that were
+    touched but hash the same only get their manifest entry refreshed. Only new / changed files are re-embedded and chunks of
+    deleted files are dropped, patching the existing store in place.
+
+    Runs as a pipeline: this thread walks and chunks files and hands
+    embedding batches to a pool of 'workers' threads, a single writer thread
+    appends finished files to the store in order. Bounded queues keep memory
+    flat, and the writer checkpoints store + manifest every few files so an
+    interrupted run picks up where it stopped.
+    """
+    workers = workers or EMBED_WORKERS
+    start_time = time.perf_counter()
+    manifest = load_manifest()
+    fresh = not manifest
+    seen = set()
+    stats = {"files": 0, "added": 0, "removed": 0, "failed": 0,
+             "chunks": 0, "chunk_bytes": 0, "window_chunks": 0, "window_bytes": 0}
+    state = {"writer": None, "error": None}
+
+    # back-pressure: at most this many files waiting on the writer,
+    # and this many embedding batches in flight at once
+    pending = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    in_flight = threading.BoundedSemaphore(workers * 2)
+
+    def open_writer():
+        if state["writer"] is None:
+            # vectors and texts stream straight to disk, nothing is held until the end
+            state["writer"] = StoreWriter(INDEX_PATH, append=True)
+            if fresh:
+                # any store already there predates the manifest, start over
+                stats["removed"] += state["writer"].remove_all()
+        return state["writer"]
+
+    def checkpoint():
+        state["writer"].flush()
+        save_manifest(manifest)
+
+    def write_file(job):
+        writer = open_writer()
+        key = job["key"]
+        stats["removed"] += writer.remove_file(key)
 
-            filepath = Path(root) / filename
-            print(f"Indexing: {filepath}")
+        embeds = []
+        for size, future in job["futures"]:
+            try:
+                embeds.extend(future.result())
+            except Exception as e:
+                print(f"Embedding failed for {key}: {e}")
+                embeds.extend([None] * size)
+
+        count = 0
+        for i, (chunk, embed, span) in enumerate(zip(job["chunks"], embeds, job["spans"])):
+            if embed and writer.add(f"{key}:{i}", key, chunk, embed, span):
+                count += 1
+        stats["added"] += count
+        stats["files"] += 1
+
+        st = job["stat"]
+        manifest[key] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                         "sha256": job["digest"], "chunks": count,
+                         "chunker": CHUNKER_VERSION}
+        if count != len(job["chunks"]):
+            # keep it in the manifest (its rows are in the store, and a later
+            # delete must find them) but flagged so the next run retries it
+            manifest[key]["partial"] = True
+            stats["failed"] += 1
 
+    def writer_loop():
+        since_checkpoint = 0
+        last_checkpoint = time.perf_counter()
+        while True:
+            job = pending.get()
+            if job is None:
+                return
+            if state["error"] is not None:
+                continue  # keep draining so the producer never blocks
             try:
-                text = filepath.read_text(errors="ignore")
-            except:
-                print(f"Could not read file: {filepath}")
-                continue
-
-            chunks = chunk_text(text)
-
-            for i, chunk in enumerate(chunks):
-                embed = embed_text(chunk)
-                if embed:
-                    all_chunks.append({
-                        "id": f"{filepath}:{i}",
-                        "source": filename,
-                        "text": chunk,
-                        "embedding": embed
-                    })
-
-    # save output
-    os.makedirs("knowledge_base/embeddings", exist_ok=True)
-    with open(INDEX_PATH, "w") as f:
-        json.dump(all_chunks, f, indent=2)
+                if "futures" not in job:
+                    st = job["stat"]  # touched, same content
+                    manifest[job["key"]].update(size=st.st_size, mtime_ns=st.st_mtime_ns)
+                    continue
+                write_file(job)
+                since_checkpoint += 1
+                if (since_checkpoint >= CHECKPOINT_EVERY_FILES
+                        or time.perf_counter() - last_checkpoint >= CHECKPOINT_EVERY_SECONDS):
+                    checkpoint()
+                    since_checkpoint = 0
+                    last_checkpoint = time.perf_counter()
+            except Exception as e:
+                state["error"] = e
+
+    print("Walking project folders...\n")
+
+    writer_thread = threading.Thread(target=writer_loop, daemon=True)
+    writer_thread.start()
+
+    walked = False
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for filepath in iter_project_files():
+                if state["error"] is not None:
+                    break
+                key = str(filepath)
+                seen.add(key)
+
+                try:
+                    st = filepath.stat()
+                except OSError:
+                    continue
+
+                entry = manifest.get(key)
+                if entry and (entry.get("chunker") != CHUNKER_VERSION or entry.get("partial")):
+                    entry = None  # older chunker or only partly embedded, redo it
+                if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+                    continue  # untouched since last run
+
+                try:
+                    raw = filepath.read_bytes()
+                except:
+                    print(f"Could not read file: {filepath}")
+                    continue
+
+                digest = hashlib.sha256(raw).hexdigest()
+                if entry and entry["sha256"] == digest:
+                    pending.put({"key": key, "stat": st})
+                    continue
+
+                print(f"Indexing: {filepath}")
+                text = raw.decode("utf-8", errors="ignore")
+                pieces = chunk_file_spans(filepath, text)
+                spans = [span for span, _ in pieces]
+                chunks = [chunk for _, chunk in pieces]
+
+                # what the plain window chunker would have sent, for the report
+                window_count, window_bytes = window_stats(len(text))
+                stats["window_chunks"] += window_count
+                stats["window_bytes"] += window_bytes
+                stats["chunks"] += len(chunks)
+                stats["chunk_bytes"] += sum(len(c) for c in chunks)
+
+                futures = []
+                for i in range(0, len(chunks), EMBED_BATCH_SIZE):
+                    batch = chunks[i:i + EMBED_BATCH_SIZE]
+                    in_flight.acquire()
+                    future = pool.submit(embed_texts, batch)
+                    future.add_done_callback(lambda _: in_flight.release())
+                    futures.append((len(batch), future))
+
+                pending.put({"key": key, "stat": st, "digest": digest,
+                             "chunks": chunks, "spans": spans, "futures": futures})
+            walked = True
+        finally:
+            # also when walking / chunking raised: stop the writer so it can't
+            # block on the queue forever, and keep whatever it finished
+            pending.put(None)
+            writer_thread.join()
+            if not walked and state["writer"] is not None:
+                state["writer"].close()
+                save_manifest(manifest)
+
+    if state["error"] is not None:
+        if state["writer"] is not None:
+            state["writer"].close()  # keep whatever finished cleanly
+            save_manifest(manifest)
+        raise state["error"]
+
+    # drop chunks of files that no longer exist
+    deleted = [key for key in manifest if key not in seen]
+    try:
+        for key in deleted:
+            print(f"Removing: {key}")
+            stats["removed"] += open_writer().remove_file(key)
+            del manifest[key]
+    finally:
+        # save output (appends are published by rewriting the metadata last)
+        if state["writer"] is not None:
+            state["writer"].close()
+
+    writer = state["writer"]
+    if writer is None:
+        save_manifest(manifest)  # keep refreshed mtimes
+        print(f"\nIndex up to date ({time.perf_counter() - start_time:.2f}s)")
+        return
+
+    if writer.dead_rows > max(COMPACT_MIN_DEAD_ROWS, len(writer.chunks)):
+        print(f"Compacting index ({writer.dead_rows} dead rows)...")
+        compact_store(INDEX_PATH)
+    save_manifest(manifest)
+
+    # ANN index for big knowledge bases (skipped for small ones / no NumPy)
+    # and the compact float16 / int8 vectors if QUANTIZATION is turned on
+    with EmbeddingStore(INDEX_PATH) as store:
+        build_and_save_ivf(store, INDEX_PATH)
+        build_and_save_quantized(store, QUANTIZATION, INDEX_PATH)
+        total_chunks = len(store)
 
+    elapsed = time.perf_counter() - start_time
     print("\nIndexing complete!")
-    print(f"Total chunks: {len(all_chunks)}")
+    print(f"Files re-indexed: {stats['files']}, removed: {len(deleted)}, failed: {stats['failed']}")
+    print(f"Chunks added: {stats['added']}, dropped: {stats['removed']}, total: {total_chunks}")
+    if stats["window_chunks"]:
+        print(f"Chunking: {stats['chunks']} chunks / {stats['chunk_bytes']} chars embedded "
+              f"(window chunker: {stats['window_chunks']} / {stats['window_bytes']}, "
+              f"{100 * (1 - stats['chunk_bytes'] / max(1, stats['window_bytes'])):.0f}% fewer chars)")
+    print(f"Throughput ({EMBED_BACKEND}, {workers} workers): "
+          f"{stats['added'] / elapsed:.1f} chunks/sec, {stats['files'] / elapsed:.1f} files/sec")
+    print(f"Index written to: {store_paths(INDEX_PATH)['meta'].parent} ({elapsed:.2f}s)")
 
 if __name__ == "__main__":
     index_files()
@@ -0,0 +1,194 @@
+# quantize.py
+import os
+import sys
+import time
+from pathlib import Path
+from typing import List, Dict, Any, Tuple, Optional
+
+from knowledge_base.code.embedding_store import EmbeddingStore, STORE_BASE, store_paths
+from knowledge_base.code.scoring import ScoringEngine, np
+
+#Compact in-memory vectors for the retriever: None (float32), "float16" or "int8"
+QUANTIZATION = None
+
+#Candidates re-scored at full precision = top_k * RESCORE_FACTOR
+RESCORE_FACTOR = 4
+
+#Rows converted at a time, caps the float32 scratch memory
+_BLOCK_ROWS = 65536
+
+_EPS = 1e-15
+
+#============================================================
+#Quantize rows straight from the mmap'd float32 store
+#============================================================
+def _store_view(store: EmbeddingStore):
+    """(rows x dim float32 view over the mmap, live row numbers). No copy."""
+    rows = store.meta.get("rows", len(store))
+    full = np.frombuffer(store._vec_map, dtype="<f4", count=rows * store.dim)
+    live = np.fromiter((c["row"] for c in store.chunks), dtype=np.int64, count=len(store))
+    return full.reshape(rows, store.dim), live
+
+
+def _unit_rows(raw, rows):
+    block = raw[rows].astype(np.float32)
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    return block / np.maximum(norms, _EPS)
+
+
+def quantize_store(store: EmbeddingStore, kind: str):
+    """
+    Normalize and quantize every live row, a block at a time.
+        float16 -> codes float16, scales None
+        int8    -> codes int8, scales float32 (one per row, max|v| / 127)
+    """
+    if kind not in ("float16", "int8"):
+        raise ValueError(f"Unknown quantization: {kind}")
+    n, dim = len(store), store.dim
+    codes = np.empty((n, dim), dtype=np.float16 if kind == "float16" else np.int8)
+    scales = np.ones(n, dtype=np.float32) if kind == "int8" else None
+    if n == 0:
+        return codes, scales
+
+    raw, live = _store_view(store)
+    for start in range(0, n, _BLOCK_ROWS):
+        unit = _unit_rows(raw, live[start:start + _BLOCK_ROWS])
+        if kind == "float16":
+            codes[start:start + len(unit)] = unit.astype(np.float16)
+        else:
+            scale = np.maximum(np.abs(unit).max(axis=1), _EPS) / 127.0
+            codes[start:start + len(unit)] = np.round(unit / scale[:, None]).astype(np.int8)
+            scales[start:start + len(unit)] = scale
+    return codes, scales
+
+#============================================================
+#Scoring engine over the compact vectors
+#============================================================
+class QuantizedEngine(ScoringEngine):
+    """
+    ScoringEngine that keeps only float16 / int8 vectors in memory.
+
+    A query scores the compact matrix, takes top_k * RESCORE_FACTOR
+    candidates and re-scores those at full precision from the float32
+    rows in the mmap'd store, so only a handful of full rows are touched.
+    """
+
+    def __init__(self, store: EmbeddingStore, kind: str = "int8", codes=None, scales=None):
+        if np is None:
+            raise RuntimeError("QuantizedEngine needs NumPy")
+        # deliberately not calling ScoringEngine.__init__: no float32 matrix
+        self.index = store
+        self.kind = kind
+        self.skipped = 0
+        self.dim = store.dim
+        self.rows = list(range(len(store)))
+        self.matrix = None
+        if codes is None:
+            codes, scales = quantize_store(store, kind)
+        self.codes = codes
+        self.scales = scales
+        if len(store):
+            self._raw, self._live = _store_view(store)
+
+    def memory_bytes(self) -> int:
+        return int(self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def score_rows(self, q, positions=None):
+        """Approximate scores from the compact vectors (blocked to bound scratch memory)."""
+        codes = self.codes if positions is None else self.codes[positions]
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], _BLOCK_ROWS):
+            out[start:start + _BLOCK_ROWS] = codes[start:start + _BLOCK_ROWS].astype(np.float32) @ q
+        if self.scales is not None:
+            out *= self.scales if positions is None else self.scales[positions]
+        return out
+
+    def exact_scores(self, q, positions):
+        """Full-precision cosine for a few rows, read from the float32 store."""
+        return _unit_rows(self._raw, self._live[positions]) @ q
+
+    def search(self, query_emb: List[float], top_k: int = 5,
+               positions=None, rescore: int = RESCORE_FACTOR) -> List[Tuple[float, Dict[str, Any]]]:
+        q = self.normalize_query(query_emb)
+        if q is None or len(self) == 0:
+            return []
+        approx = self.score_rows(q, positions)
+        cand = self.top_positions(approx, top_k * max(1, rescore))
+        if positions is not None:
+            cand = positions[cand]
+        exact = self.exact_scores(q, cand)
+        best = self.top_positions(exact, top_k)
+        return [(float(exact[b]), self.chunk(int(cand[b]))) for b in best]
+
+#============================================================
+#Persistence (index.quant.npz next to the store)
+#============================================================
+def save_quantized(engine: QuantizedEngine, base: Path = STORE_BASE) -> None:
+    path = store_paths(base)["quant"]
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        np.savez(f, codes=engine.codes,
+                 scales=engine.scales if engine.scales is not None else np.zeros(0, np.float32),
+                 kind=np.array(engine.kind), generation=np.int64(engine.index.generation))
+    os.replace(tmp, path)
+
+
+def load_quantized(store: EmbeddingStore, kind: str, base: Path = STORE_BASE) -> QuantizedEngine:
+    """
+    QuantizedEngine from index.quant.npz when it matches this store and kind,
+    otherwise quantized from the store on the spot.
+    """
+    path = store_paths(base)["quant"]
+    if path.exists():
+        with np.load(path) as data:
+            if str(data["kind"]) == kind and int(data["generation"]) == store.generation:
+                scales = data["scales"] if kind == "int8" else None
+                return QuantizedEngine(store, kind, data["codes"], scales)
+    return QuantizedEngine(store, kind)
+
+
+def build_and_save_quantized(store: EmbeddingStore, kind: Optional[str],
+                             base: Path = STORE_BASE) -> None:
+    """Called by the indexer after the store is written (no-op when disabled)."""
+    path = store_paths(base)["quant"]
+    if kind is None or np is None:
+        if path.exists():
+            path.unlink()
+        return
+    save_quantized(QuantizedEngine(store, kind), base)
+
+#============================================================
+#Benchmark: memory saved vs recall lost
+#============================================================
+def bench_quantization(store: EmbeddingStore, queries: List[List[float]], k: int = 5) -> None:
+    """Compare float16 / int8 (with and without rescoring) to the float32 engine."""
+    exact = ScoringEngine(store)
+    truth = [{c["id"] for _, c in exact.search(q, k)} for q in queries]
+    python_lists = len(store) * store.dim * 32  # list of python floats per chunk
+
+    def run(engine, label, **kw):
+        hits = 0
+        start = time.perf_counter()
+        for q, ids in zip(queries, truth):
+            hits += len(ids & {c["id"] for _, c in engine.search(q, k, **kw)})
+        ms = 1000 * (time.perf_counter() - start) / max(1, len(queries))
+        recall = hits / max(1, sum(len(t) for t in truth))
+        mem = engine.memory_bytes()
+        print(f"{label:<22} {mem / 1e6:9.2f} MB  {python_lists / max(1, mem):6.1f}x smaller "
+              f"than lists  recall@{k}={recall:.3f}  {ms:.2f} ms/query")
+
+    print(f"{len(store)} chunks, dim {store.dim}, python lists ~{python_lists / 1e6:.1f} MB")
+    run(exact, "float32")
+    for kind in ("float16", "int8"):
+        engine = QuantizedEngine(store, kind)
+        run(engine, f"{kind} (no rescore)", rescore=1)
+        run(engine, f"{kind} (rescore x{RESCORE_FACTOR})")
+
+
+if __name__ == "__main__":
+    #python -m knowledge_base.code.quantize  -> memory / recall table for the current index
+    from knowledge_base.code.ann import sample_queries
+
+    store = EmbeddingStore(STORE_BASE)
+    queries = sample_queries(ScoringEngine(store), count=int(sys.argv[1]) if len(sys.argv) > 1 else 100)
+    bench_quantization(store, queries)
@@ -0,0 +1,171 @@
+# query_cache.py
+import os
+import json
+import atexit
+import base64
+import hashlib
+import threading
+from array import array
+from pathlib import Path
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+#On-disk copy of the cache (lives next to the index, which the indexer skips)
+QUERY_CACHE_PATH = Path("knowledge_base/embeddings/query_cache.json")
+
+#Max number of query embeddings kept (oldest used are evicted first)
+QUERY_CACHE_SIZE = 512
+
+#New entries are written to disk this long after the first unsaved one
+#(and at exit), so a burst of misses costs one rewrite of the file
+QUERY_CACHE_FLUSH_SECONDS = 5.0
+
+#============================================================
+#Helpers
+#============================================================
+def normalize_query_text(text: str) -> str:
+    """Case and whitespace differences shouldn't miss the cache."""
+    return " ".join(text.split()).lower()
+
+
+def cache_key(text: str, model: str) -> str:
+    raw = f"{model}\0{normalize_query_text(text)}".encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+
+def _pack(emb: List[float]) -> str:
+    """float32 + base64, about a quarter of the size of a JSON float list."""
+    return base64.b64encode(array("f", emb).tobytes()).decode("ascii")
+
+
+def _unpack(data: str) -> List[float]:
+    arr = array("f")
+    arr.frombytes(base64.b64decode(data))
+    return arr.tolist()
+
+#============================================================
+#LRU cache, in memory with a write-behind copy on disk
+#============================================================
+class QueryEmbeddingCache:
+    """
+    LRU of query embeddings keyed by normalized text + embedding model.
+    Loaded from disk on first use; new entries are written back by flush(),
+    which runs QUERY_CACHE_FLUSH_SECONDS after the first unsaved put() and
+    at exit.
+    """
+
+    def __init__(self, path: Path = QUERY_CACHE_PATH, max_entries: int = QUERY_CACHE_SIZE):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._entries = None  # OrderedDict key -> packed embedding, loaded lazily
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._timer = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saves = 0
+
+    def _ensure_loaded(self) -> None:
+        if self._entries is not None:
+            return
+        self._entries = OrderedDict()
+        if not self.path.exists():
+            return
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                for key, packed in json.load(f):
+                    self._entries[key] = packed
+        except Exception as e:
+            print("Query cache unreadable, starting empty:", e)
+            self._entries = OrderedDict()
+        self._evict()
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(list(self._entries.items()), f)
+        os.replace(tmp, self.path)
+        self.saves += 1
+
+    def flush(self) -> None:
+        """Write unsaved entries to disk now."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+            try:
+                self._save()
+            except OSError as e:
+                print("Could not save query cache:", e)
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        key = cache_key(text, model)
+        with self._lock:
+            self._ensure_loaded()
+            packed = self._entries.get(key)
+            if packed is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return _unpack(packed)
+
+    def put(self, text: str, model: str, emb: List[float]) -> None:
+        key = cache_key(text, model)
+        with self._lock:
+            self._ensure_loaded()
+            self._entries[key] = _pack(emb)
+            self._entries.move_to_end(key)
+            self._evict()
+            self._dirty = True
+            if self._timer is None:
+                self._timer = threading.Timer(QUERY_CACHE_FLUSH_SECONDS, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def clear(self) -> None:
+        """Drop every entry, in memory and on disk, and reset the counters."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._dirty = False
+            self._entries = OrderedDict()
+            self.hits = self.misses = self.evictions = 0
+            if self.path.exists():
+                self.path.unlink()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries) if self._entries is not None else 0,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "saves": self.saves,
+            }
+
+
+_cache = QueryEmbeddingCache()
+atexit.register(_cache.flush)
+
+def get_query_cache() -> QueryEmbeddingCache:
+    return _cache
+
+
+def clear_query_cache() -> None:
+    """Empty the query embedding cache (memory + disk)."""
+    _cache.clear()
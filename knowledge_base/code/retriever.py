@@ -1,25 +1,63 @@
 # retriever.py
+import os
 import json
+import time
+import threading
 import subprocess
 from pathlib import Path
 from math import sqrt
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Union
 
-#Default index path 
-INDEX_PATH = Path("knowledge_base/embeddings/index.json")
+from knowledge_base.code.embedding_store import (
+    EmbeddingStore, STORE_BASE, LEGACY_INDEX_PATH, store_exists, store_paths
+)
+from knowledge_base.code.scoring import build_engine, numpy_available
+from knowledge_base.code.ann import load_ivf, DEFAULT_NPROBE
+from knowledge_base.code.query_cache import get_query_cache
+from knowledge_base.code.quantize import QUANTIZATION, load_quantized
+from knowledge_base.code.sharded import SCORING_SHARDS, SHARD_MIN_CHUNKS, ShardedEngine
+from llm.models import EMBED_BACKEND
+from llm.ollama_client import get_client, OllamaError
+from llm.scheduler import get_scheduler, INTERACTIVE
+
+#Default index path (binary store base, see embedding_store.py)
+INDEX_PATH = STORE_BASE
 
 #Ollama embedding model to call for queries
 EMBEDDING_MODEL = "embeddinggemma:300m"
 
+#Inverted lists scanned per query when an ANN index exists (recall/latency knob)
+ANN_NPROBE = DEFAULT_NPROBE
+
 #Small epsilon to avoid division by zero
 _EPS = 1e-15
 
 #============================================================
 #Load / validate index
 #============================================================
-def load_index(path: Path = INDEX_PATH) -> List[Dict[str, Any]]:
+def load_index(path: Path = INDEX_PATH) -> Union[EmbeddingStore, List[Dict[str, Any]]]:
+    """
+    Open the index at 'path'.
+
+    A store base path (knowledge_base/embeddings/index) gives an mmap'd
+    EmbeddingStore. A .json path goes through the old loader and returns the
+    list of chunks. If the store is missing but the old index.json is still
+    there we fall back to it (run embedding_store.py once to convert).
     """
-    Load the index JSON file and validate basic structure.
+    path = Path(path)
+    if path.suffix != ".json":
+        if store_exists(path):
+            return EmbeddingStore(path)
+        if LEGACY_INDEX_PATH.exists():
+            print(f"Binary index not found, falling back to {LEGACY_INDEX_PATH}")
+            return load_json_index(LEGACY_INDEX_PATH)
+        raise FileNotFoundError(f"Index file not found: {path}")
+    return load_json_index(path)
+
+
+def load_json_index(path: Path = LEGACY_INDEX_PATH) -> List[Dict[str, Any]]:
+    """
+    Load the old index JSON file and validate basic structure.
 
     Returns unchanged list of chunks(except for normalized)
     """
@@ -64,10 +102,36 @@ def load_index(path: Path = INDEX_PATH) -> List[Dict[str, Any]]:
 def embed_query(text: str, model: str = EMBEDDING_MODEL) -> Optional[List[float]]:
     """Call ollama to produce an embedding for 'text' 
     
-    
+    Repeated questions are answered from the query cache (query_cache.py)
+    without calling ollama at all. Otherwise goes through the shared
+    keep-alive HTTP client, falling back to `ollama run` if the API isn't
+    reachable.
     returns a list of floats or None on parse error.
     """
+    cache = get_query_cache()
+    emb = cache.get(text, model)
+    if emb is not None:
+        return emb
+
+    emb = None
+    scheduler = get_scheduler()
+    if EMBED_BACKEND == "http":
+        try:
+            emb = scheduler.run(get_client().embed, [text], model,
+                                model=model, priority=INTERACTIVE, label="query-embed")[0]
+        except OllamaError as e:
+            print("HTTP query embedding failed, falling back to ollama run:", e)
+    if emb is None:
+        emb = scheduler.run(_embed_query_cli, text, model,
+                            model=model, priority=INTERACTIVE, label="query-embed")
 
+    if emb is not None:
+        cache.put(text, model, emb)
+    return emb
+
+
+def _embed_query_cli(text: str, model: str = EMBEDDING_MODEL) -> Optional[List[float]]:
+    """One `ollama run` subprocess per query (the original path)."""
     try:
         result = subprocess.run(
             ["ollama", "run", model],
@@ -131,13 +195,17 @@ def cosine_similarity(a: List[float], b: List[float]) -> float:
 
 
 def score_chunks(query_emb: List[float],
-                 chunks: List[Dict[str, Any]],
+                 chunks: Union[EmbeddingStore, List[Dict[str, Any]]],
                  top_k: int = 5) -> List[Tuple[float, Dict[str, Any]]]:
     """
     Score all chunks by cosine similarity to query_emb
+    Pure Python path, used when NumPy isn't installed (see scoring.py).
     
     returns the top_k matches as list of (score, chunk) sorted desc order.
     """
+    if isinstance(chunks, EmbeddingStore):
+        return _score_store(query_emb, chunks, top_k)
+
     scored = []
     for chunk in chunks:
         emb = chunk.get("embedding")
@@ -153,6 +221,223 @@ def score_chunks(query_emb: List[float],
     scored.sort(key=lambda x: x[0], reverse=True)
     return scored[:top_k]
 
+
+def _score_store(query_emb: List[float],
+                 store: EmbeddingStore,
+                 top_k: int) -> List[Tuple[float, Dict[str, Any]]]:
+    """Score rows of an mmap'd store; only the winners get their text read."""
+    if store.dim != len(query_emb):
+        return []
+
+    scored = []
+    for i in range(len(store)):
+        scored.append((cosine_similarity(query_emb, store.vector(i)), i))
+
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [(score, store.chunk(i)) for score, i in scored[:top_k]]
+
+#==============================================================================
+#Process-resident index shared by every retrieve() call
+#==============================================================================
+class ResidentIndex:
+    """
+    Holds one loaded index for the life of the process.
+
+    get() hands back the current index and reloads it when the files on disk
+    change (mtime / size of the metadata file, which the writer replaces last,
+    and of the ANN / quantized sidecars if there are any).
+    A reload builds the new index (and its NumPy scoring engine, when NumPy
+    is installed) first and then swaps both in one assignment, so a query
+    that already grabbed the old pair finishes against it untouched. The
+    old store (its mmaps and file handles) is closed once the last search
+    that was using it has finished.
+    """
+
+    def __init__(self, path: Path = INDEX_PATH):
+        self.path = Path(path)
+        self._state = None  # (index, engine or None, ivf or None)
+        self._signature = None
+        self._lock = threading.Lock()
+        self._readers = {}  # id(state) -> searches still using it
+        self._loader = None
+        self.load_seconds = 0.0
+        self.load_count = 0
+        self.reload_count = 0
+        self.last_error = None
+
+    def _file_signature(self):
+        if self.path.suffix == ".json":
+            watched = self.path
+        elif store_exists(self.path):
+            watched = store_paths(self.path)["meta"]
+        else:
+            watched = LEGACY_INDEX_PATH
+        try:
+            st = os.stat(watched)
+        except FileNotFoundError:
+            return None
+        signature = (str(watched), st.st_mtime_ns, st.st_size)
+
+        # sidecars are written after the store, pick them up when they land
+        paths = store_paths(self.path)
+        for sidecar in (paths["ivf"], paths["quant"]):
+            if sidecar.exists():
+                signature += (sidecar.stat().st_mtime_ns,)
+        return signature
+
+    def _load(self) -> None:
+        """Load (or reload) under the lock. Callers check the signature first."""
+        with self._lock:
+            signature = self._file_signature()
+            if self._state is not None and signature == self._signature:
+                return  # another thread already reloaded
+            start = time.perf_counter()
+            try:
+                index = load_index(self.path)
+                if QUANTIZATION and isinstance(index, EmbeddingStore) and numpy_available():
+                    engine = load_quantized(index, QUANTIZATION, self.path)
+                elif (SCORING_SHARDS is not None and numpy_available()
+                      and isinstance(index, EmbeddingStore) and len(index) >= SHARD_MIN_CHUNKS):
+                    # shards are built per store generation, a reload builds new ones
+                    engine = ShardedEngine(index, SCORING_SHARDS)
+                else:
+                    engine = build_engine(index)
+                ivf = None
+                if engine is not None and isinstance(index, EmbeddingStore):
+                    ivf = load_ivf(self.path, generation=index.generation)
+            except Exception as e:
+                self.last_error = e
+                raise
+            self.load_seconds = time.perf_counter() - start
+            if self._state is not None:
+                self.reload_count += 1
+            self.load_count += 1
+            self.last_error = None
+            old = self._state
+            self._state, self._signature = (index, engine, ivf), signature
+            if old is not None and id(old) not in self._readers:
+                _close_state(old)
+
+    def start_background_load(self) -> threading.Thread:
+        """Kick off the first load on a daemon thread (used at app startup)."""
+        def _thread():
+            try:
+                self._load()
+                st = self.stats()
+                print(f"Index loaded: {st['chunks']} chunks in {st['load_seconds']:.3f}s "
+                      f"(~{st['memory_bytes'] / 1e6:.1f} MB)")
+            except Exception as e:
+                print(f"Background index load failed: {e}")
+
+        self._loader = threading.Thread(target=_thread, daemon=True)
+        self._loader.start()
+        return self._loader
+
+    def _current(self):
+        if self._state is None or self._file_signature() != self._signature:
+            self._load()
+        return self._state
+
+    def _acquire(self):
+        """Current state, counted as in use until _release()."""
+        while True:
+            state = self._current()
+            with self._lock:
+                if state is self._state:  # else a reload swapped it meanwhile
+                    self._readers[id(state)] = self._readers.get(id(state), 0) + 1
+                    return state
+
+    def _release(self, state) -> None:
+        with self._lock:
+            left = self._readers.pop(id(state)) - 1
+            if left:
+                self._readers[id(state)] = left
+            retired = not left and state is not self._state
+        if retired:
+            _close_state(state)
+
+    def get(self):
+        """
+        Return the loaded index, loading or reloading it if needed. It stays
+        open until the next reload; use search() for queries that may overlap one.
+        """
+        return self._current()[0]
+
+    def search(self, query_emb: List[float], top_k: int = 5,
+               nprobe: Optional[int] = None,
+               with_embeddings: bool = False) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Top-k (score, chunk) pairs, vectorized when NumPy is around.
+        Uses the ANN index when one was built; nprobe=0 forces the exact path.
+        with_embeddings=True adds each hit's vector (for de-duplication).
+        """
+        state = self._acquire()
+        try:
+            index, engine, ivf = state
+            nprobe = ANN_NPROBE if nprobe is None else nprobe
+            if ivf is not None and nprobe > 0:
+                top = ivf.search(engine, query_emb, top_k, nprobe=nprobe)
+            elif engine is not None:
+                top = engine.search(query_emb, top_k)
+            else:
+                top = score_chunks(query_emb, index, top_k=top_k)
+
+            if with_embeddings and isinstance(index, EmbeddingStore):
+                # same snapshot the hits came from, so 'pos' is still valid
+                for _, chunk in top:
+                    chunk["embedding"] = index.vector(chunk["pos"])
+            return top
+        finally:
+            self._release(state)
+
+    def stats(self) -> Dict[str, Any]:
+        index, engine, ivf = self._state or (None, None, None)
+        if isinstance(index, EmbeddingStore):
+            memory = index.memory_bytes()
+            generation = index.generation
+        elif index is not None:
+            # python float (24) + list slot (8) per value, plus the dict/text
+            memory = sum(len(c["embedding"]) * 32 + len(c["text"]) + 400 for c in index)
+            generation = None
+        else:
+            memory = 0
+            generation = None
+        return {
+            "loaded": index is not None,
+            "chunks": len(index) if index is not None else 0,
+            "generation": generation,
+            "load_seconds": self.load_seconds,
+            "memory_bytes": memory + (engine.memory_bytes() if engine else 0)
+                            + (ivf.memory_bytes() if ivf else 0),
+            "engine": (f"numpy {getattr(engine, 'kind', 'float32')}" if engine else "python"),
+            "ann_lists": ivf.n_lists if ivf else 0,
+            "shards": getattr(engine, "shards", 1),
+            "load_count": self.load_count,
+            "reload_count": self.reload_count,
+            "last_error": str(self.last_error) if self.last_error else None,
+        }
+
+
+def _close_state(state) -> None:
+    """Unmap a retired store and drop its shared shard block, if any."""
+    index, engine, _ = state
+    if isinstance(engine, ShardedEngine):
+        engine.close()
+    if isinstance(index, EmbeddingStore):
+        index.close()
+
+
+_resident_indexes: Dict[str, ResidentIndex] = {}
+_resident_lock = threading.Lock()
+
+def get_resident_index(path: Path = INDEX_PATH) -> ResidentIndex:
+    """One ResidentIndex per index path, created on first use."""
+    key = str(Path(path))
+    with _resident_lock:
+        if key not in _resident_indexes:
+            _resident_indexes[key] = ResidentIndex(path)
+        return _resident_indexes[key]
+
 #==============================================================================
 #Convenience top level retrieve function
 #==============================================================================
@@ -160,13 +445,17 @@ def score_chunks(query_emb: List[float],
 def retrieve(query: str,
              index_path: Path = INDEX_PATH,
              ret_model: str = EMBEDDING_MODEL,
-             top_k_ret: int = 5) -> List[Dict[str, Any]]:
-    chunks = load_index(index_path)
+             top_k_ret: int = 5,
+             nprobe: Optional[int] = None,
+             with_embeddings: bool = False) -> List[Dict[str, Any]]:
+    # shared, already-loaded index (reloads itself if the files changed)
+    resident = get_resident_index(index_path)
     q_emb = embed_query(query, model=ret_model)
     if q_emb is None:
         raise RuntimeError("Failed to produce query embedding")
 
-    top = score_chunks(q_emb, chunks, top_k=top_k_ret)
+    top = resident.search(q_emb, top_k=top_k_ret, nprobe=nprobe,
+                          with_embeddings=with_embeddings)
     # attach score to each returned chunk for convienience
     results = []
     for score, chunk in top:
@@ -199,8 +488,9 @@ def format_for_prompt(results: List[Dict[str, Any]], char_length: int = 1000) ->
 #======================================================================
 def _test_local():
     print("Loading index:", INDEX_PATH)
-    chunks = load_index()
+    chunks = get_resident_index().get()
     print("Chunks loaded:", len(chunks))
+    print("Index stats:", get_resident_index().stats())
     query = "How do I create a Font in tkinter?"
     results = retrieve(query, top_k_ret=5)
     print("Top results:")
@@ -0,0 +1,135 @@
+# scoring.py
+from collections import Counter
+from typing import List, Dict, Any, Tuple, Optional, Union
+
+from knowledge_base.code.embedding_store import EmbeddingStore
+
+#NumPy is optional, retriever.score_chunks is the pure Python fallback
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#Small epsilon to avoid division by zero
+_EPS = 1e-15
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+#============================================================
+#Vectorized scoring engine
+#============================================================
+class ScoringEngine:
+    """
+    Chunk embeddings as one pre-normalized float32 matrix.
+
+    Everything that used to happen per chunk per query (norms, dimension
+    checks) happens once here, so a query is a single matrix-vector product
+    followed by an argpartition for the top-k.
+    """
+
+    def __init__(self, index: Union[EmbeddingStore, List[Dict[str, Any]]]):
+        if np is None:
+            raise RuntimeError("ScoringEngine needs NumPy")
+
+        self.index = index
+        self.skipped = 0
+
+        if isinstance(index, EmbeddingStore):
+            matrix = self._store_matrix(index)
+            self.rows = list(range(len(index)))
+            self.dim = index.dim
+        else:
+            matrix, self.rows, self.dim = self._list_matrix(index)
+
+        #normalize once so a dot product is the cosine similarity
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.maximum(norms, _EPS, out=norms)
+        matrix /= norms
+        self.matrix = matrix
+
+    @staticmethod
+    def _store_matrix(store: EmbeddingStore):
+        if len(store) == 0 or store._vec_map is None:
+            return np.zeros((0, store.dim), dtype=np.float32)
+        rows = store.meta.get("rows", len(store))
+        full = np.frombuffer(store._vec_map, dtype="<f4", count=rows * store.dim)
+        full = full.reshape(rows, store.dim)
+        live = np.fromiter((c["row"] for c in store.chunks), dtype=np.int64, count=len(store))
+        # fancy indexing copies, which we want: the normalized matrix is ours
+        return full[live].astype(np.float32)
+
+    def _list_matrix(self, chunks: List[Dict[str, Any]]):
+        """Keep only chunks whose embedding has the most common dimension."""
+        dims = Counter(len(c["embedding"]) for c in chunks if c.get("embedding"))
+        if not dims:
+            return np.zeros((0, 0), dtype=np.float32), [], 0
+        dim = dims.most_common(1)[0][0]
+
+        rows = [i for i, c in enumerate(chunks)
+                if c.get("embedding") and len(c["embedding"]) == dim]
+        self.skipped = len(chunks) - len(rows)
+        if self.skipped:
+            print(f"Scoring: skipped {self.skipped} chunks with mismatched embedding size")
+
+        matrix = np.array([chunks[i]["embedding"] for i in rows], dtype=np.float32)
+        return matrix.reshape(len(rows), dim), rows, dim
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def chunk(self, pos: int) -> Dict[str, Any]:
+        """Chunk dict for a matrix row."""
+        i = self.rows[pos]
+        if isinstance(self.index, EmbeddingStore):
+            return self.index.chunk(i)
+        return self.index[i]
+
+    def memory_bytes(self) -> int:
+        return int(self.matrix.nbytes)
+
+    def normalize_query(self, query_emb: List[float]):
+        """Query as a unit float32 vector, or None if it doesn't fit the matrix."""
+        q = np.asarray(query_emb, dtype=np.float32)
+        if q.ndim != 1 or q.shape[0] != self.dim:
+            return None
+        n = float(np.linalg.norm(q))
+        return q / (n if n > _EPS else _EPS)
+
+    def top_positions(self, scores, top_k: int):
+        """Indices of the top_k scores, best first, without sorting everything."""
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if k < scores.shape[0]:
+            part = np.argpartition(-scores, k - 1)[:k]
+        else:
+            part = np.arange(scores.shape[0])
+        return part[np.argsort(-scores[part], kind="stable")]
+
+    def score_rows(self, q, positions=None):
+        """Cosine scores of a unit query against all rows (or just 'positions')."""
+        matrix = self.matrix if positions is None else self.matrix[positions]
+        return matrix @ q
+
+    def search(self, query_emb: List[float], top_k: int = 5,
+               positions=None) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Return top_k (score, chunk) pairs sorted desc, same shape as score_chunks.
+        'positions' limits the search to those rows (used by the ANN index).
+        """
+        q = self.normalize_query(query_emb)
+        if q is None or len(self) == 0:
+            return []
+        scores = self.score_rows(q, positions)
+        best = self.top_positions(scores, top_k)
+        rows = best if positions is None else positions[best]
+        return [(float(scores[b]), self.chunk(int(r))) for b, r in zip(best, rows)]
+
+
+def build_engine(index) -> Optional[ScoringEngine]:
+    """ScoringEngine for 'index', or None when NumPy isn't installed."""
+    if np is None:
+        return None
+    return ScoringEngine(index)
@@ -0,0 +1,279 @@
+# sharded.py
+import os
+import sys
+import time
+import atexit
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Dict, Any, Tuple, Optional
+
+from knowledge_base.code.embedding_store import EmbeddingStore, STORE_BASE
+from knowledge_base.code.scoring import ScoringEngine, np
+
+#Worker processes that score shards of the matrix: None = off, 0 = one per core
+SCORING_SHARDS = None
+
+#Below this many rows the process round trip costs more than it saves
+SHARD_MIN_CHUNKS = 200000
+
+#Workers start from a fresh interpreter (forkserver, or spawn where there is
+#none), never a fork of the threaded GUI process
+SHARD_START_METHOD = ("forkserver" if "forkserver" in multiprocessing.get_all_start_methods()
+                      else "spawn")
+
+_EPS = 1e-15
+
+#============================================================
+#Worker side: attach the shared matrix once, score a row range
+#============================================================
+_attached: Dict[str, Any] = {}  # shm name -> (SharedMemory, matrix view), per worker
+
+
+def _worker_matrix(name: str, shape: Tuple[int, int]):
+    entry = _attached.get(name)
+    if entry is None:
+        # a new name means the index was reloaded: let go of the old block
+        for old in list(_attached):
+            shm, view = _attached.pop(old)
+            del view
+            shm.close()
+        shm = shared_memory.SharedMemory(name=name)
+        entry = (shm, np.ndarray(shape, dtype=np.float32, buffer=shm.buf))
+        _attached[name] = entry
+    return entry[1]
+
+
+def _score_shard(name: str, shape: Tuple[int, int], q, top_k: int,
+                 start: int, end: int, positions=None):
+    """Partial top-k of one shard: (global row positions, scores), unsorted."""
+    matrix = _worker_matrix(name, shape)
+    if positions is None:
+        scores = matrix[start:end] @ q
+    else:
+        scores = matrix[positions] @ q
+    k = min(top_k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    part = np.argpartition(-scores, k - 1)[:k] if k < scores.shape[0] else np.arange(scores.shape[0])
+    rows = part + start if positions is None else positions[part]
+    return rows, scores[part]
+
+#============================================================
+#Shared process pool (one per process, survives index reloads)
+#============================================================
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def shard_count(shards: Optional[int]) -> int:
+    """Resolve the SCORING_SHARDS setting to a worker count."""
+    if shards is None:
+        return 1
+    return shards if shards > 0 else (os.cpu_count() or 1)
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=True)
+            context = multiprocessing.get_context(SHARD_START_METHOD)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+#============================================================
+#Sharded engine
+#============================================================
+_owned: List[shared_memory.SharedMemory] = []
+_block_ids = itertools.count()
+
+
+class ShardedEngine(ScoringEngine):
+    """
+    ScoringEngine whose normalized matrix lives in one shared memory block.
+
+    Worker processes attach the block by name (nothing is copied into
+    them), each scores a contiguous range of rows and sends back its own
+    top-k; the parent merges those partial lists into the global top-k.
+    Small searches (few rows, e.g. IVF candidates) stay in this process.
+
+    One engine covers one store generation: the block is named after it,
+    a reload builds a new engine and close() drops the old block once the
+    searches using it are done (ResidentIndex counts them).
+    """
+
+    def __init__(self, index, shards: Optional[int] = 0):
+        super().__init__(index)
+        self.generation = getattr(index, "generation", None)
+        self._share(shards)
+
+    @classmethod
+    def from_matrix(cls, matrix, shards: Optional[int] = 0,
+                    normalized: bool = False) -> "ShardedEngine":
+        """Engine over a bare (rows x dim) float32 matrix, for benchmarks."""
+        engine = cls.__new__(cls)
+        engine.index = None
+        engine.skipped = 0
+        engine.generation = None
+        engine.rows = list(range(matrix.shape[0]))
+        engine.dim = matrix.shape[1]
+        if not normalized:
+            matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), _EPS)
+        engine.matrix = matrix.astype(np.float32, copy=False)
+        engine._share(shards)
+        return engine
+
+    def _share(self, shards: Optional[int]) -> None:
+        """Move the matrix into shared memory (the private copy is freed)."""
+        self.shards = shard_count(shards)
+        self._shm = None
+        if self.matrix.size == 0 or self.shards < 2:
+            return
+        name = f"kb_{os.getpid()}_g{self.generation or 0}_{next(_block_ids)}"
+        shm = shared_memory.SharedMemory(name=name, create=True, size=self.matrix.nbytes)
+        shared = np.ndarray(self.matrix.shape, dtype=np.float32, buffer=shm.buf)
+        shared[:] = self.matrix
+        self.matrix = shared
+        self._shm = shm
+        _owned.append(shm)
+
+    def close(self) -> None:
+        """Unlink the shared block. Workers drop their view when the next block arrives."""
+        shm, self._shm = self._shm, None
+        if shm is None:
+            return
+        if shm in _owned:
+            _owned.remove(shm)
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _bounds(self, n: int):
+        step = -(-n // self.shards)
+        return [(s, min(s + step, n)) for s in range(0, n, step)]
+
+    def _local(self, q, top_k: int, positions=None):
+        scores = self.score_rows(q, positions)
+        best = self.top_positions(scores, top_k)
+        return (best if positions is None else positions[best]), scores[best]
+
+    def top_rows(self, q, top_k: int, positions=None):
+        """(row positions, scores) of the top_k rows, best first, scored in the pool."""
+        n = len(self) if positions is None else positions.shape[0]
+        shm = self._shm
+        if self.shards < 2 or n < SHARD_MIN_CHUNKS or shm is None:
+            return self._local(q, top_k, positions)
+
+        pool = get_pool(self.shards)
+        shape = self.matrix.shape
+        try:
+            if positions is None:
+                futures = [pool.submit(_score_shard, shm.name, shape, q, top_k, s, e)
+                           for s, e in self._bounds(n)]
+            else:
+                futures = [pool.submit(_score_shard, shm.name, shape, q, top_k, 0, 0, positions[s:e])
+                           for s, e in self._bounds(n)]
+            parts = [f.result() for f in futures]
+        except Exception as e:
+            # pool broken (a worker died): score here
+            print(f"Sharded scoring failed, scoring in-process: {e}")
+            return self._local(q, top_k, positions)
+
+        rows = np.concatenate([p[0] for p in parts])
+        scores = np.concatenate([p[1] for p in parts])
+        best = self.top_positions(scores, top_k)
+        return rows[best], scores[best]
+
+    def search(self, query_emb: List[float], top_k: int = 5,
+               positions=None) -> List[Tuple[float, Dict[str, Any]]]:
+        q = self.normalize_query(query_emb)
+        if q is None or len(self) == 0:
+            return []
+        rows, scores = self.top_rows(q, top_k, positions)
+        return [(float(s), self.chunk(int(r))) for r, s in zip(rows, scores)]
+
+
+@atexit.register
+def _cleanup() -> None:
+    shutdown_pool()
+    for shm in list(_owned):
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    _owned.clear()
+
+#============================================================
+#Benchmark: single-matrix ScoringEngine vs shard counts
+#============================================================
+def _median_ms(fn, qs) -> Tuple[float, List[set]]:
+    times, hits = [], []
+    for q in qs:
+        start = time.perf_counter()
+        rows = fn(q)
+        times.append(time.perf_counter() - start)
+        hits.append(set(rows.tolist()))
+    times.sort()
+    return 1000 * times[len(times) // 2], hits
+
+
+def bench_sharding(matrix, shard_counts=(2, 4, 8), queries: int = 20, k: int = 5) -> None:
+    """
+    Median ms per query of the plain in-process ScoringEngine and of
+    ShardedEngine at each shard count, over the same matrix, plus how many
+    of the baseline's top-k each returns. 'matrix' (float32) is normalized
+    in place so only the shared block is a second copy.
+    """
+    global SHARD_MIN_CHUNKS
+    rng = np.random.default_rng(0)
+    qs = rng.standard_normal((queries, matrix.shape[1])).astype(np.float32)
+    print(f"{matrix.shape[0]} rows x {matrix.shape[1]} dims, {os.cpu_count()} cores, "
+          f"workers via {SHARD_START_METHOD}")
+
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), _EPS)
+    single = ShardedEngine.from_matrix(matrix, None, normalized=True)  # plain ScoringEngine path
+    base_ms, truth = _median_ms(lambda q: single._local(single.normalize_query(q), k)[0], qs)
+    print(f"single matrix {base_ms:8.2f} ms/query")
+
+    min_chunks, SHARD_MIN_CHUNKS = SHARD_MIN_CHUNKS, 0
+    try:
+        for shards in shard_counts:
+            engine = ShardedEngine.from_matrix(matrix, shards, normalized=True)
+            try:
+                engine.top_rows(engine.normalize_query(qs[0]), k)  # start the pool / attach
+                ms, hits = _median_ms(lambda q: engine.top_rows(engine.normalize_query(q), k)[0], qs)
+                same = sum(len(a & b) for a, b in zip(truth, hits)) / max(1, sum(len(t) for t in truth))
+                print(f"shards={shards:<4} {ms:8.2f} ms/query  x{base_ms / ms:.2f}  "
+                      f"(same top-{k}: {same:.3f})")
+            finally:
+                engine.close()
+    finally:
+        SHARD_MIN_CHUNKS = min_chunks
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    #python -m knowledge_base.code.sharded             -> current index
+    #python -m knowledge_base.code.sharded 1000000 384 -> synthetic rows x dim
+    if len(sys.argv) > 2:
+        rows, dim = int(sys.argv[1]), int(sys.argv[2])
+        matrix = np.random.default_rng(1).standard_normal((rows, dim), dtype=np.float32)
+    else:
+        matrix = ScoringEngine(EmbeddingStore(STORE_BASE)).matrix
+    counts = sorted({2, 4, os.cpu_count() or 1} - {1})
+    bench_sharding(matrix, counts)
@@ -0,0 +1,240 @@
+import sys
+import json
+import math
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from memory.conversation import detect_code_block
+from knowledge_base.code.retriever import retrieve
+from llm.context_packer import RETRIEVE_CANDIDATES
+from llm.prompt_builder import build_messages_for_model
+from llm.history_budget import plan_budget
+from llm.generation import stream_model_reply
+from llm.router import route
+from llm.scheduler import get_scheduler, INTERACTIVE
+from llm.models import MODELS, AUTO_MODEL
+
+# ============================================================
+#   HEADLESS BATCH RUNNER
+# ============================================================
+#
+# Runs a JSONL file of prompts through the same retrieval, prompt building
+# and model calls as the GUI, without Tk:
+#
+#   python -m llm.batch requests.jsonl -o results.jsonl --model Auto --parallel 4
+#
+# Each input line is a JSON object; the prompt is its "prompt" (or
+# "question" / "input") field, else "title" + "body" (the requests.jsonl
+# layout). Its "id" / "request_id" names the result. Every prompt is sent
+# on its own, without the GUI's conversation history.
+#
+# Results are appended to the output as they finish, one JSON line each,
+# so an interrupted run resumes where it stopped: items that already have
+# a result without an error are skipped.
+
+PROMPT_FIELDS = ("prompt", "question", "input")
+ID_FIELDS = ("id", "request_id")
+
+
+def read_items(path):
+    """[(id, prompt)] from a JSONL file; blank / broken lines are skipped."""
+    items = []
+    with Path(path).open("r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError:
+                print(f"[batch] skipping line {n}: not JSON")
+                continue
+            item_id = next((str(data[k]) for k in ID_FIELDS if data.get(k) is not None), f"line-{n}")
+            prompt = next((data[k] for k in PROMPT_FIELDS if data.get(k)), None)
+            if prompt is None:
+                prompt = "\n\n".join(str(data[k]) for k in ("title", "body") if data.get(k))
+            if not prompt:
+                print(f"[batch] skipping {item_id}: no prompt")
+                continue
+            items.append((item_id, prompt))
+    return items
+
+
+def finished_ids(path):
+    """Ids that already have a result without an error in 'path'."""
+    done = set()
+    if not Path(path).exists():
+        return done
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by an interrupted run
+            if rec.get("error"):
+                done.discard(rec.get("id"))
+            else:
+                done.add(rec.get("id"))
+    return done
+
+
+def configure_parallelism(parallel):
+    """Let the scheduler run 'parallel' calls at once, per model too."""
+    scheduler = get_scheduler()
+    scheduler.max_concurrent = max(scheduler.max_concurrent, parallel)
+    scheduler.default_model_limit = max(scheduler.default_model_limit, parallel)
+    for model in scheduler.model_limits:
+        scheduler.model_limits[model] = max(scheduler.model_limits[model], parallel)
+
+
+# ============================================================
+#   ONE ITEM
+# ============================================================
+
+def run_item(item_id, prompt, model_name, use_retrieval=True):
+    """Retrieve, build and generate one prompt. Returns its result record."""
+    timings = {}
+    start = time.perf_counter()
+    record = {"id": item_id, "model": None, "reply": None, "error": None, "timings": timings}
+    try:
+        results = []
+        if use_retrieval:
+            try:
+                results = retrieve(prompt, top_k_ret=RETRIEVE_CANDIDATES, with_embeddings=True)
+            except FileNotFoundError:
+                record["retrieval"] = "no index"  # answer without context, like an empty knowledge base
+        timings["retrieve"] = time.perf_counter() - start
+
+        if model_name == AUTO_MODEL:
+            decision = route(prompt, results)
+            model_name = decision["model_name"]
+            record["route"] = {"tier": decision["tier"], "reason": decision["reason"]}
+        record["model"] = MODELS[model_name]
+
+        mark = time.perf_counter()
+        conversation = [{"role": "user", "content": prompt, "is_code": detect_code_block(prompt)}]
+        messages = build_messages_for_model(prompt, results, plan_budget(model_name), conversation)
+        timings["build"] = time.perf_counter() - mark
+
+        queued = time.perf_counter()
+        started, first, reply, result = get_scheduler().run(
+            _generate, messages, model_name,
+            model=MODELS[model_name], priority=INTERACTIVE, label="batch"
+        )
+        end = time.perf_counter()
+        timings["queue"] = started - queued
+        timings["first_token"] = (first - started) if first is not None else None
+        timings["generate"] = end - started
+
+        record["reply"] = reply
+        if reply.startswith("Error:"):
+            record["error"] = reply
+        if result:
+            record["prompt_tokens"] = result["prompt_eval_count"]
+            record["reply_tokens"] = result["eval_count"]
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    timings["total"] = time.perf_counter() - start
+    return record
+
+
+def _generate(messages, model_name):
+    """Scheduler job: (start, first chunk time, reply text, server result)."""
+    started = time.perf_counter()
+    first = None
+    chunks = []
+    stream = stream_model_reply(messages, model_name, reuse_context=False)
+    while True:
+        try:
+            chunk = next(stream)
+        except StopIteration as stop:
+            return started, first, "".join(chunks).strip(), stop.value
+        if first is None:
+            first = time.perf_counter()
+        chunks.append(chunk)
+
+
+# ============================================================
+#   BATCH
+# ============================================================
+
+def run_batch(input_path, output_path, model_name, parallel=2, use_retrieval=True, limit=None):
+    """Run every unfinished item of input_path, appending results to output_path."""
+    items = read_items(input_path)
+    done = finished_ids(output_path)
+    todo = [(i, p) for i, p in items if i not in done]
+    if limit is not None:
+        todo = todo[:limit]
+    skipped = sum(1 for i, _ in items if i in done)
+    print(f"[batch] {len(items)} items, {skipped} already done, "
+          f"running {len(todo)} with {model_name} x{parallel}")
+
+    configure_parallelism(parallel)
+    records = []
+    start = time.perf_counter()
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with Path(output_path).open("a", encoding="utf-8") as out:
+        pool = ThreadPoolExecutor(max_workers=parallel)
+        try:
+            futures = [pool.submit(run_item, i, p, model_name, use_retrieval) for i, p in todo]
+            for n, future in enumerate(as_completed(futures), 1):
+                rec = future.result()
+                records.append(rec)
+                # written as each item finishes, so an interrupted batch can resume
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                out.flush()
+                status = "error" if rec["error"] else "ok"
+                print(f"[batch] {n}/{len(todo)} {rec['id']}: {status} in {rec['timings']['total']:.2f}s")
+        except KeyboardInterrupt:
+            print("[batch] interrupted; run again to resume")
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+
+    report(records, time.perf_counter() - start)
+    return records
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[max(0, math.ceil(p * len(sorted_values)) - 1)]
+
+
+def report(records, wall_seconds):
+    """Throughput and p50 / p95 latency of the finished items."""
+    ok = [r for r in records if not r["error"]]
+    totals = sorted(r["timings"]["total"] for r in ok)
+    firsts = sorted(r["timings"]["first_token"] for r in ok if r["timings"].get("first_token") is not None)
+    tokens = sum(r.get("reply_tokens", 0) for r in ok)
+
+    print(f"[batch] {len(ok)}/{len(records)} ok in {wall_seconds:.1f}s: "
+          f"{len(records) / wall_seconds if wall_seconds else 0.0:.2f} items/s, "
+          f"{tokens / wall_seconds if wall_seconds else 0.0:.1f} reply tokens/s")
+    print(f"[batch] latency p50 {_percentile(totals, 0.5):.2f}s  p95 {_percentile(totals, 0.95):.2f}s | "
+          f"first token p50 {_percentile(firsts, 0.5):.2f}s  p95 {_percentile(firsts, 0.95):.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through the chatbot pipeline.")
+    parser.add_argument("input", help="JSONL file of prompts")
+    parser.add_argument("-o", "--output", help="results JSONL (default: <input>.results.jsonl)")
+    parser.add_argument("--model", default=list(MODELS)[0],
+                        help=f"MODELS entry or '{AUTO_MODEL}' (default: %(default)s)")
+    parser.add_argument("--parallel", type=int, default=2, help="items in flight at once")
+    parser.add_argument("--limit", type=int, help="run at most this many unfinished items")
+    parser.add_argument("--no-retrieval", action="store_true", help="skip the knowledge base")
+    args = parser.parse_args(argv)
+
+    if args.model != AUTO_MODEL and args.model not in MODELS:
+        parser.error(f"unknown model {args.model!r}; choose from {[AUTO_MODEL] + list(MODELS)}")
+    output = args.output or str(Path(args.input).with_suffix(".results.jsonl"))
+    run_batch(args.input, output, args.model, max(1, args.parallel),
+              use_retrieval=not args.no_retrieval, limit=args.limit)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
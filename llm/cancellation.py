@@ -0,0 +1,118 @@
+import time
+import threading
+
+
+class Cancelled(Exception):
+    """Raised by CancelToken.check() once the token is cancelled or past its deadline."""
+
+
+# ============================================================
+#   CANCELLATION TOKEN
+# ============================================================
+
+class CancelToken:
+    """
+    Carried by one generation / summarization call.
+
+    cancel() (the Stop button) or the optional deadline (seconds from
+    creation) marks it cancelled and runs the registered callbacks right
+    away: they kill the `ollama run` process or shut the HTTP stream's
+    socket, so the call returns without waiting for the next token.
+    """
+
+    def __init__(self, deadline=None, label=""):
+        self.label = label
+        self.created = time.perf_counter()
+        self.deadline = deadline
+        self.reason = None
+        self.cancelled_at = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._timer = None
+        if deadline is not None:
+            self._timer = threading.Timer(deadline, self.cancel, args=("deadline",))
+            self._timer.daemon = True
+            self._timer.start()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="stopped"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self.cancelled_at = time.perf_counter()
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:
+                print(f"Cancel callback failed: {e}")
+
+    def on_cancel(self, fn):
+        """Run fn when cancelled (now, if it already is). Returns a remover."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return lambda: self._remove(fn)
+        fn()
+        return lambda: None
+
+    def _remove(self, fn):
+        with self._lock:
+            if fn in self._callbacks:
+                self._callbacks.remove(fn)
+
+    def check(self):
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+    def remaining(self):
+        """Seconds left before the deadline (None without one)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - (time.perf_counter() - self.created))
+
+    def wait(self, seconds):
+        """Sleep up to 'seconds', waking early if cancelled. True if cancelled."""
+        return self._event.wait(seconds)
+
+    def close(self):
+        """The call finished: stop the deadline timer."""
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+# ============================================================
+#   ACTIVE TOKENS (what the Stop button cancels)
+# ============================================================
+
+_active = set()
+_active_lock = threading.Lock()
+
+
+def new_token(deadline=None, label=""):
+    """CancelToken registered as active until release() is called."""
+    token = CancelToken(deadline, label)
+    with _active_lock:
+        _active.add(token)
+    return token
+
+
+def release(token):
+    token.close()
+    with _active_lock:
+        _active.discard(token)
+
+
+def cancel_all(reason="stopped"):
+    """Cancel every active call. Returns how many were cancelled."""
+    with _active_lock:
+        tokens = list(_active)
+    for token in tokens:
+        token.cancel(reason)
+    return len(tokens)
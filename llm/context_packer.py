@@ -0,0 +1,199 @@
+from math import sqrt
+from pathlib import Path
+
+from knowledge_base.code.retriever import format_for_prompt
+
+# Token budget for retrieved context in one prompt
+CONTEXT_TOKEN_BUDGET = 1500
+
+# How many hits to ask the retriever for before packing
+RETRIEVE_CANDIDATES = 10
+
+# Hits at least this similar to a better hit are dropped
+NEAR_DUPLICATE_SIMILARITY = 0.95
+
+# Drop a hit when this share of its lines is already in the conversation
+CONVERSATION_OVERLAP = 0.8
+
+# Don't bother pasting a truncated tail smaller than this
+MIN_TRUNCATED_TOKENS = 80
+
+# Old behaviour, used as the baseline for the "tokens saved" report
+BASELINE_TOP_K = 5
+BASELINE_CHARS = 1500
+
+
+# ============================================================
+#   TOKEN ESTIMATE
+# ============================================================
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 chars per token)."""
+    return (len(text) + 3) // 4
+
+
+# ============================================================
+#   MERGE OVERLAPPING / ADJACENT CHUNKS FROM THE SAME FILE
+# ============================================================
+
+def _text_overlap(a, b, max_check=400, min_overlap=20):
+    """Length of the longest suffix of a that is a prefix of b (0 if tiny)."""
+    for k in range(min(len(a), len(b), max_check), min_overlap - 1, -1):
+        if a.endswith(b[:k]):
+            return k
+    return 0
+
+
+def _merge_pair(first, second):
+    """Merge two hits from one file, or return None if they don't touch."""
+    if "start" in first and "start" in second:
+        if second["start"] > first["end"]:
+            return None
+        text = first["text"] + second["text"][max(0, first["end"] - second["start"]):]
+        span = {"start": first["start"], "end": max(first["end"], second["end"])}
+    else:
+        k = _text_overlap(first["text"], second["text"])
+        if not k:
+            return None
+        text = first["text"] + second["text"][k:]
+        span = {}
+
+    best = first if first.get("score", 0) >= second.get("score", 0) else second
+    merged = dict(best)
+    merged.update(span)
+    merged["text"] = text
+    return merged
+
+
+def _chunk_ordinal(r):
+    """Position of a chunk in its file, from its "<file>:<n>" id (-1 if none)."""
+    tail = str(r.get("id", "")).rpartition(":")[2]
+    return int(tail) if tail.isdigit() else -1
+
+
+def merge_neighbours(results):
+    """
+    Merge hits from the same file whose spans overlap or touch (for old
+    indexes without spans: whose texts overlap). Keeps best-score order.
+    """
+    by_file = {}
+    for r in results:
+        by_file.setdefault(r.get("file"), []).append(r)
+
+    merged = []
+    for hits in by_file.values():
+        # span start when the index has spans, else the chunk's ordinal
+        hits.sort(key=lambda r: (r.get("start", -1), _chunk_ordinal(r)))
+        cur = hits[0]
+        for nxt in hits[1:]:
+            joined = _merge_pair(cur, nxt)
+            if joined is None:
+                merged.append(cur)
+                cur = nxt
+            else:
+                cur = joined
+        merged.append(cur)
+
+    merged.sort(key=lambda r: r.get("score", 0), reverse=True)
+    return merged
+
+
+# ============================================================
+#   NEAR-DUPLICATES AND CONTEXT ALREADY IN THE CHAT
+# ============================================================
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    na = sqrt(sum(x * x for x in a))
+    nb = sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+def drop_near_duplicates(results, threshold=NEAR_DUPLICATE_SIMILARITY):
+    """Drop hits whose embedding is nearly identical to a better-scored hit."""
+    kept = []
+    for r in results:
+        emb = r.get("embedding")
+        if emb and any(k.get("embedding") and _cosine(emb, k["embedding"]) >= threshold for k in kept):
+            continue
+        kept.append(r)
+    return kept
+
+
+def _content_lines(text):
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def drop_seen_in_conversation(results, messages, loaded_history="", overlap=CONVERSATION_OVERLAP):
+    """Drop hits whose lines are (mostly) already pasted in the conversation."""
+    seen = set(_content_lines(loaded_history or ""))
+    for m in messages:
+        seen.update(_content_lines(m.get("content", "")))
+    if not seen:
+        return results
+
+    kept = []
+    for r in results:
+        lines = _content_lines(r.get("text", ""))
+        if lines and sum(line in seen for line in lines) / len(lines) >= overlap:
+            continue
+        kept.append(r)
+    return kept
+
+
+# ============================================================
+#   PACK TO A TOKEN BUDGET
+# ============================================================
+
+def _header(r):
+    return f"--- {Path(r.get('file') or 'unknown').name} (score ={r.get('score', 0):.4f})"
+
+
+def pack_context(results, messages=(), loaded_history="", budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Turn retrieval hits into a context string that fits 'budget' tokens.
+
+    Steps: merge overlapping / adjacent chunks of the same file, drop
+    near-duplicates, drop what the conversation already contains, then add
+    hits best-first until the budget runs out (the last one may be cut).
+    Returns (context, stats) where stats includes the tokens saved against
+    the old fixed top-5 x 1500 chars formatting.
+    """
+    baseline = format_for_prompt(results[:BASELINE_TOP_K], char_length=BASELINE_CHARS)
+
+    merged = merge_neighbours(results)
+    unique = drop_near_duplicates(merged)
+    fresh = drop_seen_in_conversation(unique, messages, loaded_history)
+
+    parts = []
+    used = 0
+    remaining = budget
+    for r in fresh:
+        header = _header(r)
+        snippet = r.get("text", "").strip()
+        cost = estimate_tokens(header) + estimate_tokens(snippet) + 1
+        if cost > remaining:
+            room = remaining - estimate_tokens(header) - 1
+            if room < MIN_TRUNCATED_TOKENS:
+                break
+            snippet = snippet[:room * 4].rstrip()
+            cost = estimate_tokens(header) + estimate_tokens(snippet) + 1
+        parts.append(header)
+        parts.append(snippet)
+        remaining -= cost
+        used += 1
+
+    context = "\n\n".join(parts)
+    tokens = estimate_tokens(context)
+    baseline_tokens = estimate_tokens(baseline)
+    stats = {
+        "candidates": len(results),
+        "merged": len(results) - len(merged),
+        "near_duplicates": len(merged) - len(unique),
+        "already_in_conversation": len(unique) - len(fresh),
+        "used": used,
+        "tokens": tokens,
+        "baseline_tokens": baseline_tokens,
+        "tokens_saved": baseline_tokens - tokens,
+    }
+    return context, stats
@@ -1,18 +1,26 @@
-import subprocess
 import threading
 import tkinter as tk
 import time
 import re
-
-from llm.prompt_builder import build_prompt_for_model
-from llm.summarizer import trim_and_summarize_if_needed
-from llm.models import MODELS, SUMMARIZER_MODEL
+import logging
+from concurrent.futures import CancelledError
+
+from llm.pipeline import run_pregeneration
+from llm.prompt_builder import messages_to_prompt
+from llm.models import MODELS, GENERATION_DEADLINE, AUTO_MODEL
+from llm.generation import stream_model_reply
+from llm.router import route, split_override, log_outcome
+from llm.cancellation import Cancelled, new_token, release, cancel_all
+from llm.scheduler import get_scheduler, INTERACTIVE
+from llm.response_cache import get_response_cache, response_key, current_options
 from gui.code_highlight import insert_code_block
+from gui.stream_view import StreamRenderer
 from memory.conversation import append_message
-from tools.weather import get_current_weather
 from gui.thinking_timer import start_thinking_timer, stop_thinking_timer
 from tools.rag.rag_search import simple_search
 
+log = logging.getLogger(__name__)
+
 # ============================================================
 #   MAIN ENTRY POINT
 # ============================================================
@@ -26,10 +34,17 @@ def run_ollama(root, widgets):
     output_text        = widgets["output_text"]
     max_messages_var   = widgets["max_messages_var"]
     auto_summarize_var = widgets["auto_summarize_var"]
+    cache_replies_var  = widgets["cache_replies_var"]
 
     model_name  = model_var.get()
     user_prompt = prompt_text.get("1.0", tk.END).strip()
 
+    # "Auto": the router picks the model after retrieval; "@fast" / "@code" /
+    # "@think" in front of the prompt force a tier
+    override = None
+    if model_name == AUTO_MODEL:
+        user_prompt, override = split_override(user_prompt)
+
     # Prevent empty prompts
     if not user_prompt:
         output_text.insert(tk.END, "Please enter a prompt.\n")
@@ -43,36 +58,40 @@ def run_ollama(root, widgets):
 
     # Parse max messages setting
     max_messages = parse_max_messages(max_messages_var)
-
-    # Summarization passes
-    run_summarization(output_text, auto_summarize_var, max_messages)
+    auto_summarize = auto_summarize_var.get()
+    use_cache = cache_replies_var.get()
 
     # Check if asking for weather
-    if "weather" in user_prompt.lower():
-        reply = get_current_weather(user_prompt)
-        output_text.insert(tk.END, f"Assistant:\n", "assistant_header")
-        output_text.insert(tk.END, reply + "\n\n", "assistant_text")
-        return
-
-    # Build final model prompt
-    #fix the double user input issue
-    prompt_for_model = build_prompt_for_model(user_prompt)
+    use_weather = "weather" in user_prompt.lower()
 
     # Show "Running" message
-    output_text.insert(tk.END, f"> Running {model_name}...\n")
-    output_text.update()
+    if not use_weather:
+        output_text.insert(tk.END, f"> Running {model_name}...\n")
+        output_text.update()
 
     # Start thinking timer
     thinking_state = start_thinking_timer(root, output_text)
 
-    # Start model call in background thread
+    # Stop (or the deadline) cancels this turn wherever it is
+    token = new_token(GENERATION_DEADLINE, label="chat")
+
+    # Summarization, retrieval and tool lookups run concurrently off the Tk
+    # thread, then the model call follows in the same background thread
     threading.Thread(
-        target=_run_model_thread,
+        target=_run_pipeline_thread,
         daemon=True,
-        args=(root, output_text, prompt_for_model, model_name, thinking_state)
+        args=(root, output_text, user_prompt, model_name, max_messages,
+              auto_summarize, use_weather, thinking_state, use_cache, token, override)
     ).start()
 
 
+def stop_generation(output_text):
+    """Stop button: cancel every running or queued model call."""
+    if cancel_all("stopped"):
+        output_text.insert(tk.END, "[Stop requested]\n")
+        output_text.see(tk.END)
+
+
 # ============================================================
 #   USER MESSAGE DISPLAY
 # ============================================================
@@ -101,59 +120,178 @@ def parse_max_messages(max_messages_var):
 
 
 # ============================================================
-#   SUMMARIZATION LOGIC
+#   PRE-GENERATION PIPELINE (BACKGROUND THREAD)
 # ============================================================
 
-def run_summarization(output_text, auto_summarize_var, max_messages):
-    """Perform auto and manual summarization steps."""
-
-    # Auto summarization (background)
-    if auto_summarize_var.get():
-        trim_and_summarize_if_needed(
-            max_messages=max_messages,
-            summarizer_model=SUMMARIZER_MODEL,
-            output_text=output_text,
-            auto=True
-        )
-
-    # Manual synchronous summarization
-    trim_and_summarize_if_needed(
-        max_messages=max_messages,
-        summarizer_model=SUMMARIZER_MODEL,
-        output_text=output_text,
-        auto=False
-    )
+def _run_pipeline_thread(root, output_text, user_prompt, model_name, max_messages,
+                         auto_summarize, use_weather, thinking_state, use_cache=False, token=None,
+                         override=None):
+    """Run the pre-generation graph, then the tool reply or the model call."""
+    try:
+        try:
+            pre = run_pregeneration(
+                user_prompt, max_messages, auto_summarize, use_weather, model_name,
+                on_auto_summary=lambda: root.after(0, lambda: log_auto_summarization(output_text))
+            )
+        except Exception as e:
+            error = f"Error: {e}"
+            root.after(0, lambda: handle_tool_reply(root, output_text, error, thinking_state))
+            return
+
+        if pre["summarized"]:
+            root.after(0, lambda: log_summarization(output_text))
+
+        if token is not None and token.cancelled:
+            marker = cancel_marker(token)
+            root.after(0, lambda: handle_tool_reply(root, output_text, marker, thinking_state))
+            return
+
+        if use_weather:
+            root.after(0, lambda: handle_tool_reply(root, output_text, pre["weather"], thinking_state))
+            return
+
+        decision = None
+        if model_name == AUTO_MODEL:
+            decision = route(user_prompt, pre["results"], override)
+            model_name = decision["model_name"]
+            root.after(0, lambda: log_route(output_text, decision))
+
+        _run_model_thread(root, output_text, pre["messages"], model_name, thinking_state,
+                          use_cache, token, decision)
+    finally:
+        if token is not None:
+            release(token)
+
+
+def log_route(output_text, decision):
+    output_text.insert(tk.END, f"> Auto: {decision['model_name']} ({decision['reason']})\n")
+    output_text.see(tk.END)
 
 
+def log_summarization(output_text):
+    output_text.insert(tk.END, "[Synchronous summarization completed]\n")
+    output_text.see(tk.END)
 
-# ============================================================
-#   MODEL CALL (BACKGROUND THREAD)
-# ============================================================
 
-def _run_model_thread(root, output_text, prompt_for_model, model_name, thinking_state):
-    """Executed in background — runs ollama and updates UI afterward."""
+def log_auto_summarization(output_text):
+    output_text.insert(tk.END, "[Automatic summarization completed]\n")
+    output_text.see(tk.END)
+
 
-    # Run model
-    model_reply = run_ollama_process(prompt_for_model, model_name)
+def handle_tool_reply(root, output_text, reply, thinking_state):
+    """Insert a tool (weather) reply, which replaces the model call."""
+    stop_thinking_timer(root, output_text, thinking_state)
+    output_text.insert(tk.END, f"Assistant:\n", "assistant_header")
+    output_text.insert(tk.END, reply + "\n\n", "assistant_text")
+    output_text.see(tk.END)
 
-    # Update GUI on main thread
-    root.after(0, lambda: handle_model_reply(root, output_text, model_reply, thinking_state))
 
 
+# ============================================================
+#   MODEL CALL (BACKGROUND THREAD)
+# ============================================================
 
-def run_ollama_process(prompt, model_name):
-    """Call the actual Ollama subprocess."""
+def _run_model_thread(root, output_text, messages, model_name, thinking_state, use_cache=False, token=None,
+                      decision=None):
+    """
+    Executed in background — streams the reply into the UI as it is generated.
+    If 'token' is cancelled the text streamed so far is kept with a marker
+    saying why it stopped; only the text is saved. A router 'decision' is logged with
+    the reply's latency.
+    """
+
+    # Opt-in response cache: a repeated prompt is answered instantly
+    cache_key = None
+    if use_cache:
+        model = MODELS[model_name]
+        cache_key = response_key(model, messages_to_prompt(messages), current_options())
+        cached = get_response_cache().get(cache_key, model)
+        if log.isEnabledFor(logging.DEBUG):
+            stats = get_response_cache().stats()["models"][model]
+            log.debug("cache %s: %s (hit rate %.0f%% of %d)", model,
+                      "hit" if cached is not None else "miss",
+                      100 * stats["hit_rate"], stats["hits"] + stats["misses"])
+        if cached is not None:
+            if decision is not None:
+                log_outcome(decision, 0.0, 0.0, len(cached), "cached")
+            root.after(0, lambda: handle_model_reply(root, output_text, cached, thinking_state, cached=True))
+            return
+
+    renderer = StreamRenderer(
+        root, output_text,
+        on_first=lambda: begin_model_reply(root, output_text, thinking_state),
+        on_done=lambda reply: finish_model_reply(output_text, reply, renderer)
+    )
+    chunks = []
+
+    def _generate():
+        for chunk in stream_model_reply(messages, model_name, cancel=token):
+            chunks.append(chunk)
+            renderer.push(chunk)
+
+    # the scheduler caps how many model calls run at once
+    scheduler = get_scheduler()
+    future = scheduler.submit(_generate, model=MODELS[model_name], priority=INTERACTIVE,
+                              label="chat", cancel=token)
+    outcome = "ok"
     try:
-        result = subprocess.run(
-            ["ollama", "run", MODELS[model_name], prompt],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return result.stdout.strip()
-
-    except subprocess.CalledProcessError as e:
-        return f"Error: {e.stderr}"
+        wait_in_queue(scheduler, future, thinking_state)
+        future.result()
+    except (Cancelled, CancelledError):
+        # Cancelled: stopped mid-stream; CancelledError: stopped while queued
+        outcome = "stopped"
+        log.debug("chat %s after %d chars, returned %.1f ms after the request", token.reason,
+                  len("".join(chunks)), 1000 * (time.perf_counter() - token.cancelled_at))
+        chunks.append(("\n" if chunks else "") + cancel_marker(token))
+        renderer.push(chunks[-1])
+    except Exception as e:
+        outcome = "error"
+        chunks.append(f"Error: {e}")
+        renderer.push(chunks[-1])
+    finally:
+        renderer.close()
+
+    reply = "".join(chunks).strip()
+    if outcome == "ok" and reply.startswith("Error:"):
+        outcome = "error"
+    if cache_key and reply and outcome == "ok":
+        get_response_cache().put(cache_key, MODELS[model_name], reply)
+    if decision is not None:
+        log_outcome(decision, renderer.first_chunk_seconds, time.perf_counter() - renderer.start,
+                    len(reply), outcome)
+
+
+
+CANCEL_MARKERS = ("[stopped]", "[timed out]")
+
+
+def cancel_marker(token):
+    """What a stopped reply ends with."""
+    return "[timed out]" if token.reason == "deadline" else "[stopped]"
+
+
+def strip_cancel_marker(reply):
+    """The reply text without the marker a stop appended (shown, not saved)."""
+    reply = reply.strip()
+    for marker in CANCEL_MARKERS:
+        if reply.endswith(marker):
+            return reply[:-len(marker)].rstrip()
+    return reply
+
+
+
+def wait_in_queue(scheduler, future, thinking_state, poll=0.25):
+    """Show the queue position in the thinking timer until the job starts."""
+    # done callbacks also run on cancel, so a stop while queued ends the wait at once
+    done = threading.Event()
+    future.add_done_callback(lambda f: done.set())
+    while True:
+        pos = scheduler.position(future)
+        if pos is None:
+            break
+        thinking_state["label"] = f"Queued (#{pos + 1})"
+        done.wait(poll)
+    thinking_state["label"] = "Thinking"
 
 
 
@@ -161,7 +299,30 @@ def run_ollama_process(prompt, model_name):
 #   FINAL ASSISTANT REPLY PROCESSING
 # ============================================================
 
-def handle_model_reply(root, output_text, model_reply, thinking_state):
+def begin_model_reply(root, output_text, thinking_state):
+    """First streamed text arrived: drop the timer, show the header."""
+    stop_thinking_timer(root, output_text, thinking_state)
+    output_text.insert(tk.END, "Assistant:\n", "assistant_header")
+
+
+
+def finish_model_reply(output_text, model_reply, renderer):
+    """Stream ended: save the reply (minus any stop marker) and close off the bubble."""
+    saved = strip_cancel_marker(model_reply)
+    if saved:
+        append_message("assistant", saved)
+
+    output_text.insert(tk.END, "\n\n", "spacer")
+    output_text.see(tk.END)
+
+    total = time.perf_counter() - renderer.start
+    first = renderer.first_chunk_seconds
+    log.info("stream: first text after %.2fs, %d chars in %.2fs, %d UI updates",
+             first if first is not None else total, len(model_reply), total, renderer.frames)
+
+
+
+def handle_model_reply(root, output_text, model_reply, thinking_state, cached=False):
     """Insert the assistant reply into the UI and stop timer."""
 
     stop_thinking_timer(root, output_text, thinking_state)
@@ -169,8 +330,11 @@ def handle_model_reply(root, output_text, model_reply, thinking_state):
     # Save memory
     append_message("assistant", model_reply)
 
-    # Display assistant header
-    output_text.insert(tk.END, "Assistant:\n", "assistant_header")
+    # Display assistant header (marked when it came from the response cache)
+    output_text.insert(tk.END, "Assistant:", "assistant_header")
+    if cached:
+        output_text.insert(tk.END, "  (cached)", "cached_marker")
+    output_text.insert(tk.END, "\n", "assistant_header")
 
     # Insert reply with code block parsing
     insert_model_reply_with_code(output_text, model_reply)
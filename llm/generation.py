@@ -0,0 +1,119 @@
+import codecs
+import logging
+import subprocess
+import threading
+
+from llm.prompt_builder import messages_to_prompt
+from llm.models import MODELS, GENERATE_BACKEND, CONTEXT_REUSE
+from llm.cancellation import Cancelled
+from llm.session import get_session
+from llm.residency import get_residency
+from llm.history_budget import record_prefill
+from llm.ollama_client import get_client, OllamaError
+
+# Per-reply session and timing lines are debug output (see PROMPT_DEBUG in llm/models.py)
+log = logging.getLogger(__name__)
+
+# ============================================================
+#   MODEL REPLY STREAMS (no Tk: shared by the GUI and llm/batch.py)
+# ============================================================
+
+def stream_model_reply(messages, model_name, cancel=None, reuse_context=CONTEXT_REUSE):
+    """
+    Yield reply text chunks from the configured backend (HTTP or CLI).
+    Raises Cancelled if 'cancel' fires mid-reply. The generator's return
+    value is the server's timing result (None on the CLI path or an error).
+    reuse_context=False skips the per-model session (for prompts that are
+    not turns of the one GUI conversation).
+    """
+    if GENERATE_BACKEND != "http":
+        yield from stream_ollama_process(messages_to_prompt(messages), model_name, cancel)
+        return
+
+    model = MODELS[model_name]
+    get_residency().touch(model)
+    session = get_session(model) if reuse_context else None
+    try:
+        if session is not None:
+            # the full prompt goes out; the server reuses the prefix it still has cached
+            session.request(messages)
+        stream = get_client().chat(messages, model, stream=True, cancel=cancel)
+        yield from stream
+    except Cancelled:
+        if session is not None:
+            session.invalidate()
+        raise
+    except OllamaError as e:
+        if session is not None:
+            session.invalidate()
+        yield f"Error: {e}"
+        return
+
+    t = stream.result
+    if session is not None:
+        session.update(t)
+        log.info("session %s: %d of %d messages shared with the last turn, "
+                 "%d prefill tokens avoided this turn, %d over %d turns",
+                 model, session.shared, len(messages), session.last_avoided,
+                 session.prefill_avoided, session.turns)
+    if t:
+        record_prefill(model, t["prompt_eval_count"], t["prompt_eval_ms"])
+        log.info("prefill %d tokens in %.0f ms, %d tokens at %.1f tok/s, load %.0f ms",
+                 t["prompt_eval_count"], t["prompt_eval_ms"], t["eval_count"],
+                 t["tokens_per_sec"], t["load_ms"])
+    return t
+
+
+
+def stream_ollama_process(prompt, model_name, cancel=None):
+    """
+    Run the Ollama subprocess and yield its stdout as it arrives.
+    Cancelling 'cancel' kills the process; that raises Cancelled here.
+    """
+    try:
+        proc = subprocess.Popen(
+            ["ollama", "run", MODELS[model_name], prompt],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+    except OSError as e:
+        yield f"Error: {e}"
+        return
+
+    remove = cancel.on_cancel(proc.kill) if cancel is not None else None
+
+    # drain stderr on the side so a chatty stderr can't block stdout
+    stderr = []
+    err_thread = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)
+    err_thread.start()
+
+    # multi-byte characters can be split across reads
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    leading = True
+    while True:
+        data = proc.stdout.read1(4096)
+        if not data:
+            break
+        text = decoder.decode(data)
+        if leading:
+            text = text.lstrip()
+            leading = not text
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+    proc.wait()
+    err_thread.join()
+    if remove is not None:
+        remove()
+        cancel.check()
+    if proc.returncode != 0:
+        yield f"Error: {stderr[0].decode('utf-8', errors='replace') if stderr else proc.returncode}"
+
+
+
+def run_ollama_process(prompt, model_name):
+    """Call the Ollama subprocess and return the whole reply."""
+    return "".join(stream_ollama_process(prompt, model_name)).strip()
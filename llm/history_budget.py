@@ -0,0 +1,157 @@
+import threading
+
+import memory.conversation as mem
+from memory.conversation import conversation_messages
+from llm.context_packer import CONTEXT_TOKEN_BUDGET
+from llm.prompt_builder import get_segments
+from llm.models import (
+    MODELS, ROUTER_TIERS, AUTO_MODEL, GENERATION_NUM_CTX,
+    TARGET_PREFILL_SECONDS, PREFILL_TOKENS_PER_SEC, RECENT_TURN_MESSAGES,
+)
+
+# Room left in num_ctx for the reply
+REPLY_RESERVE_TOKENS = 1024
+
+# Share of the prompt budget the retrieved context / loaded history may take
+CONTEXT_SHARE = 0.2
+LOADED_HISTORY_SHARE = 0.15
+
+# Expected size of the summary that replaces summarized messages
+SUMMARY_TOKENS = 300
+
+# Smoothing of the measured prefill rate (weight of the newest sample)
+_RATE_ALPHA = 0.3
+
+# Prefills smaller than this say little about the rate
+_MIN_RATE_TOKENS = 64
+
+_rates = {}  # model -> measured prefill tokens/sec
+_rates_lock = threading.Lock()
+
+
+# ============================================================
+#   PREFILL RATE (what the latency target turns into tokens)
+# ============================================================
+
+def record_prefill(model, tokens, ms):
+    """Feed the server's prompt_eval_count / prompt_eval_ms of a reply."""
+    if tokens < _MIN_RATE_TOKENS or ms <= 0:
+        return
+    rate = 1000 * tokens / ms
+    with _rates_lock:
+        old = _rates.get(model)
+        _rates[model] = rate if old is None else (1 - _RATE_ALPHA) * old + _RATE_ALPHA * rate
+
+
+def prefill_rate(model):
+    """Prefill tokens/sec for 'model': measured if possible, else the configured guess."""
+    with _rates_lock:
+        if model in _rates:
+            return _rates[model]
+    return PREFILL_TOKENS_PER_SEC.get(model, PREFILL_TOKENS_PER_SEC["default"])
+
+
+# ============================================================
+#   BUDGETS
+# ============================================================
+
+def prompt_budget(model):
+    """
+    Prompt tokens 'model' gets: what fits num_ctx next to the reply, capped
+    by what it can prefill in TARGET_PREFILL_SECONDS.
+    """
+    fits = GENERATION_NUM_CTX - REPLY_RESERVE_TOKENS
+    if TARGET_PREFILL_SECONDS is None:
+        return fits
+    return max(1024, min(fits, int(prefill_rate(model) * TARGET_PREFILL_SECONDS)))
+
+
+def plan_budget(model_name):
+    """
+    Split the prompt budget of a MODELS entry ("Auto" takes the tightest
+    tier) into {"total", "context", "loaded_history", "conversation"}.
+    The recent turns come out of "conversation" but are never summarized.
+    """
+    if model_name == AUTO_MODEL:
+        total = min(prompt_budget(MODELS[n]) for n in ROUTER_TIERS.values())
+    else:
+        total = prompt_budget(MODELS.get(model_name, model_name))
+    context = min(CONTEXT_TOKEN_BUDGET, int(CONTEXT_SHARE * total))
+    loaded = int(LOADED_HISTORY_SHARE * total) if mem.loaded_history else 0
+    return {
+        "total": total,
+        "context": context,
+        "loaded_history": loaded,
+        "conversation": total - context - loaded,
+    }
+
+
+def history_tokens(messages=None):
+    """Estimated tokens per conversation message (cached per message)."""
+    messages = conversation_messages if messages is None else messages
+    return [seg.tokens for seg in get_segments().sync(messages)]
+
+
+def select_over_budget(budget, messages=None, recent=RECENT_TURN_MESSAGES):
+    """
+    Indices of the oldest messages to summarize so the conversation fits
+    'budget' tokens (with the summary that replaces them). The last
+    'recent' messages are never summarized; if they alone are over,
+    recent_caps() cuts them when the prompt is built.
+    """
+    messages = conversation_messages if messages is None else messages
+    tokens = history_tokens(messages)
+    total = sum(tokens)
+    if total <= budget:
+        return []
+
+    older = max(0, len(messages) - recent)
+    chosen = []
+    remaining = total
+    for i in range(older):
+        chosen.append(i)
+        remaining -= tokens[i]
+        if remaining + SUMMARY_TOKENS <= budget:
+            break
+    # summarizing one short message only to add a summary costs more than it saves
+    if sum(tokens[i] for i in chosen) <= SUMMARY_TOKENS:
+        return []
+    return chosen
+
+
+def recent_caps(budget, messages=None, recent=RECENT_TURN_MESSAGES):
+    """
+    {index: max tokens} for the last 'recent' messages so they fit 'budget'
+    (next to the summary of everything older). They are never summarized,
+    so when they alone are over (a huge paste) the biggest get cut to a
+    common cap instead. Empty when they fit.
+    """
+    messages = conversation_messages if messages is None else messages
+    tokens = history_tokens(messages)
+    first = max(0, len(messages) - recent)
+    if first:
+        budget -= SUMMARY_TOKENS
+    window = tokens[first:]
+    if sum(window) <= budget:
+        return {}
+
+    # largest cap with sum(min(t, cap)) <= budget: small messages stay whole
+    left = max(0, budget)
+    ordered = sorted(window)
+    cap = 0
+    for k, t in enumerate(ordered):
+        share = left // (len(ordered) - k)
+        if t > share:
+            cap = share
+            break
+        left -= t
+    return {first + i: cap for i, t in enumerate(window) if t > cap}
+
+
+def budget_report(model_name, messages=None):
+    """One line: where the prompt tokens go for 'model_name'."""
+    plan = plan_budget(model_name)
+    tokens = history_tokens(messages)
+    return (f"[budget] {model_name}: {sum(tokens)}/{plan['conversation']} conversation tokens "
+            f"in {len(tokens)} messages, context {plan['context']}, "
+            f"loaded history {plan['loaded_history']} of {plan['total']}")
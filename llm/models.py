@@ -1,3 +1,5 @@
+import os
+
 MODELS = {
     "Fast (Mistral 7B)": "mistral:7b",
     "Research (Qwen3 30B Thinking)": "qwen3:30b",
@@ -12,4 +14,68 @@ DEFAULT_MAX_MESSAGES = 30
 AUTO_SUMMARIZE = True
 #test commit test branch
 
+# Optional "Auto" entry in the model menu: llm/router.py picks one of these per turn
+AUTO_ROUTING = True
+AUTO_MODEL = "Auto"
+ROUTER_TIERS = {
+    "fast": "Fast (Mistral 7B)",
+    "code": "Coding (Qwen3 30B coder)",
+    "reasoning": "Research (Qwen3 30B Thinking)",
+}
+
+# History is budgeted in tokens per model (llm/history_budget.py): the prompt has
+# to fit num_ctx and prefill within TARGET_PREFILL_SECONDS (None = num_ctx only).
+# The rates are starting guesses, replaced by what the server reports.
+TARGET_PREFILL_SECONDS = 8
+PREFILL_TOKENS_PER_SEC = {"default": 800, "mistral:7b": 1500}
+# Newest messages, always sent verbatim
+RECENT_TURN_MESSAGES = 4
+
+# Local Ollama HTTP API (override with the OLLAMA_HOST env var)
+OLLAMA_URL = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+if not OLLAMA_URL.startswith("http"):
+    OLLAMA_URL = "http://" + OLLAMA_URL
+
+# "http" = pooled keep-alive client (llm/ollama_client.py), "cli" = one `ollama run` per text
+EMBED_BACKEND = "http"
+EMBED_BATCH_SIZE = 32
+
+# "http" = chat over the pooled keep-alive client, "cli" = one `ollama run` per reply
+GENERATE_BACKEND = "http"
+
+# Generation options sent with every HTTP request (None = model default)
+GENERATION_TEMPERATURE = None
+GENERATION_NUM_CTX = 8192
+# How long the server keeps a model loaded after a request
+GENERATION_KEEP_ALIVE = "10m"
+
+# Model residency (llm/residency.py): models kept warm with a longer keep-alive,
+# whether to preload the default model and these at startup, and the memory
+# loaded models may use before the least recently used one is unloaded
+# (None = 75% of physical memory)
+WARM_MODELS = [SUMMARIZER_MODEL]
+WARM_KEEP_ALIVE = "60m"
+WARM_ON_STARTUP = True
+RESIDENT_MEMORY_BUDGET_GB = None
+
+# Track how much of each turn's prompt the server reuses from its cache of the
+# previous one (llm/session.py): the prompt keeps the history as a stable prefix
+# and the retrieved context last, and the savings come from prompt_eval_count
+CONTEXT_REUSE = True
+
+# Log every assembled prompt, context-packing stats and per-turn timings (llm.* loggers)
+PROMPT_DEBUG = os.environ.get("CHATBOT_PROMPT_DEBUG") == "1"
+
+# Opt-in: answer a repeated prompt (same model, prompt and options) from the response cache
+RESPONSE_CACHE = False
+
+# Request scheduler (llm/scheduler.py): model calls running at once, overall and per model
+SCHEDULER_MAX_CONCURRENT = 2
+DEFAULT_MODEL_CONCURRENT = 1
+MODEL_MAX_CONCURRENT = {
+    "embeddinggemma:300m": 2,  # small model, lets indexing keep two batches in flight
+}
 
+# Give up on a call after this many seconds (None = no deadline); Stop cancels either at once
+GENERATION_DEADLINE = None
+SUMMARY_DEADLINE = 180
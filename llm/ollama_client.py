@@ -0,0 +1,519 @@
+import sys
+import json
+import time
+import queue
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm.cancellation import Cancelled
+from llm.models import (
+    OLLAMA_URL, EMBED_BATCH_SIZE,
+    GENERATION_TEMPERATURE, GENERATION_NUM_CTX, GENERATION_KEEP_ALIVE,
+    WARM_MODELS, WARM_KEEP_ALIVE,
+)
+
+# Markers on a GenerationStream's line queue
+_END = object()
+_CANCELLED = object()
+
+# Status codes worth retrying (server busy / loading a model / restarting)
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class OllamaError(RuntimeError):
+    """Raised when the Ollama HTTP API keeps failing after all retries."""
+
+
+# ============================================================
+#   HTTP CLIENT
+# ============================================================
+
+class OllamaClient:
+    """
+    Small client for the local Ollama HTTP API.
+
+    One requests.Session is shared by every call so connections stay
+    open (keep-alive) between requests instead of paying process start-up
+    and model attach for each text like `ollama run` does.
+    """
+
+    def __init__(self, base_url=OLLAMA_URL, timeout=120, retries=3, backoff=0.5, pool_size=8):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # running counters, read with stats()
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.retry_count = 0
+        self.embedded_count = 0
+        self.embed_seconds = 0.0
+        self.generation_count = 0
+
+    def _post(self, path, payload, stream=False, timeout=None, cancel=None):
+        """POST JSON with retries and exponential back-off. Returns the Response."""
+        url = self.base_url + path
+        last_error = None
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self._lock:
+                    self.retry_count += 1
+                delay = self.backoff * (2 ** (attempt - 1))
+                if cancel is None:
+                    time.sleep(delay)
+                elif cancel.wait(delay):
+                    raise Cancelled(cancel.reason)
+            try:
+                resp = self.session.post(url, json=payload, stream=stream,
+                                         timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+                continue
+
+            with self._lock:
+                self.request_count += 1
+            if resp.status_code in _RETRY_STATUS:
+                last_error = OllamaError(f"{url} returned {resp.status_code}: {resp.text[:200]}")
+                resp.close()
+                continue
+            if resp.status_code >= 400:
+                raise OllamaError(f"{url} returned {resp.status_code}: {resp.text[:200]}")
+            return resp
+
+        raise OllamaError(f"{url} failed after {self.retries + 1} attempts: {last_error}")
+
+    def _post_cancellable(self, path, payload, cancel):
+        """
+        Streaming _post that returns (raises Cancelled) as soon as 'cancel'
+        fires, even while the server is still prefilling and hasn't sent
+        headers: the request runs on a helper thread, which closes the
+        connection once it gets a response nobody wants any more.
+        """
+        box = {}
+        done = threading.Event()
+
+        def _request():
+            try:
+                box["resp"] = self._post(path, payload, stream=True, cancel=cancel)
+            except Exception as e:
+                box["error"] = e
+            finally:
+                done.set()
+                if cancel.cancelled and "resp" in box:
+                    box["resp"].close()
+
+        threading.Thread(target=_request, daemon=True).start()
+        remove = cancel.on_cancel(done.set)
+        done.wait()
+        remove()
+        if cancel.cancelled:
+            if "resp" in box:
+                box["resp"].close()
+            raise Cancelled(cancel.reason)
+        if "error" in box:
+            raise box["error"]
+        return box["resp"]
+
+    def _get(self, path):
+        """GET JSON (no retries: used for status queries)."""
+        url = self.base_url + path
+        try:
+            resp = self.session.get(url, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise OllamaError(f"{url} failed: {e}")
+        if resp.status_code >= 400:
+            raise OllamaError(f"{url} returned {resp.status_code}: {resp.text[:200]}")
+        return resp.json()
+
+    # --------------------------------------------------------
+    #   Embeddings
+    # --------------------------------------------------------
+
+    def embed(self, texts, model, batch_size=EMBED_BATCH_SIZE):
+        """Embed a list of texts, sending up to batch_size per request."""
+        vectors = []
+        start = time.perf_counter()
+
+        for i in range(0, len(texts), batch_size):
+            batch = texts[i:i + batch_size]
+            resp = self._post("/api/embed", {"model": model, "input": batch})
+            data = resp.json()
+            embeddings = data.get("embeddings")
+            if not isinstance(embeddings, list) or len(embeddings) != len(batch):
+                raise OllamaError(f"Unexpected /api/embed response for {len(batch)} inputs")
+            vectors.extend([float(x) for x in emb] for emb in embeddings)
+
+        with self._lock:
+            self.embedded_count += len(texts)
+            self.embed_seconds += time.perf_counter() - start
+        return vectors
+
+    # --------------------------------------------------------
+    #   Generation
+    # --------------------------------------------------------
+
+    def chat(self, messages, model, temperature=GENERATION_TEMPERATURE,
+             num_ctx=GENERATION_NUM_CTX, keep_alive=None, stream=False,
+             cancel=None):
+        """
+        /api/chat with structured messages ([{"role", "content"}, ...]).
+        stream=False returns the result dict (see _result), stream=True a
+        GenerationStream that yields text chunks as they are generated.
+        'cancel' (llm/cancellation.CancelToken) aborts the request and
+        raises Cancelled. keep_alive=None uses keep_alive_for(model).
+        """
+        payload = _generation_payload(model, temperature, num_ctx, keep_alive, stream)
+        payload["messages"] = messages
+        return self._generation("/api/chat", payload, stream, cancel)
+
+    def generate(self, prompt, model, temperature=GENERATION_TEMPERATURE,
+                 num_ctx=GENERATION_NUM_CTX, keep_alive=None,
+                 stream=False, system=None, context=None, cancel=None):
+        """
+        /api/generate with a prompt string, same return types as chat().
+        'context' is the token context a previous generate() returned: the
+        server continues from it and only prefills the new prompt.
+        """
+        payload = _generation_payload(model, temperature, num_ctx, keep_alive, stream)
+        payload["prompt"] = prompt
+        if system:
+            payload["system"] = system
+        if context:
+            payload["context"] = context
+        return self._generation("/api/generate", payload, stream, cancel)
+
+    # --------------------------------------------------------
+    #   Model residency
+    # --------------------------------------------------------
+
+    def load(self, model, keep_alive=None, num_ctx=GENERATION_NUM_CTX):
+        """
+        Load 'model' without generating anything. Returns the seconds it took.
+        num_ctx must match what generation sends, or the server reloads the
+        model on the first real request.
+        """
+        payload = _generation_payload(model, None, num_ctx, keep_alive, False)
+        start = time.perf_counter()
+        self._post("/api/generate", payload).json()
+        return time.perf_counter() - start
+
+    def unload(self, model):
+        """Ask the server to drop 'model' from memory now."""
+        self._post("/api/generate", {"model": model, "keep_alive": 0}).json()
+
+    def running(self):
+        """Loaded models: {name: {"size", "size_vram", "expires_at"}} from /api/ps."""
+        return {m["name"]: m for m in self._get("/api/ps").get("models", [])}
+
+    def installed(self):
+        """Installed models: {name: size on disk} from /api/tags."""
+        return {m["name"]: m.get("size", 0) for m in self._get("/api/tags").get("models", [])}
+
+    def _generation(self, path, payload, stream, cancel=None):
+        start = time.perf_counter()
+        if cancel is not None:
+            # always stream under a token, so a cancel can end the read early
+            payload["stream"] = True
+            resp = self._post_cancellable(path, payload, cancel)
+        else:
+            resp = self._post(path, payload, stream=stream)
+        with self._lock:
+            self.generation_count += 1
+        if stream or cancel is not None:
+            gen = GenerationStream(resp, start, cancel)
+            if stream:
+                return gen
+            for _ in gen:
+                pass
+            return gen.result
+        data = resp.json()
+        return _result(data, _text_of(data), time.perf_counter() - start)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.request_count,
+                "retries": self.retry_count,
+                "embedded": self.embedded_count,
+                "chunks_per_sec": (self.embedded_count / self.embed_seconds
+                                   if self.embed_seconds else 0.0),
+                "generations": self.generation_count,
+            }
+
+    def close(self):
+        self.session.close()
+
+
+# ============================================================
+#   GENERATION HELPERS
+# ============================================================
+
+def keep_alive_for(model):
+    """Warm models (the summarizer) stay loaded longer than the rest."""
+    return WARM_KEEP_ALIVE if model in WARM_MODELS else GENERATION_KEEP_ALIVE
+
+
+def _generation_payload(model, temperature, num_ctx, keep_alive, stream):
+    if keep_alive is None:
+        keep_alive = keep_alive_for(model)
+    options = {}
+    if temperature is not None:
+        options["temperature"] = temperature
+    if num_ctx is not None:
+        options["num_ctx"] = num_ctx
+    return {"model": model, "stream": stream, "options": options, "keep_alive": keep_alive}
+
+
+def _text_of(data):
+    """Reply text of a /api/chat or /api/generate response (or stream line)."""
+    if "message" in data:
+        return (data["message"] or {}).get("content", "")
+    return data.get("response", "")
+
+
+def _result(data, text, seconds):
+    """
+    Reply text plus the server's timing fields (nanoseconds -> ms):
+        prompt_eval_count / prompt_eval_ms   prefill of the prompt
+        eval_count / eval_ms                 generated tokens
+        load_ms, total_ms, tokens_per_sec, wall_ms (measured here)
+    """
+    def ms(key):
+        return data.get(key, 0) / 1e6
+
+    eval_ms = ms("eval_duration")
+    return {
+        "text": text,
+        "model": data.get("model"),
+        "done_reason": data.get("done_reason"),
+        "prompt_eval_count": data.get("prompt_eval_count", 0),
+        "prompt_eval_ms": ms("prompt_eval_duration"),
+        "eval_count": data.get("eval_count", 0),
+        "eval_ms": eval_ms,
+        "load_ms": ms("load_duration"),
+        "total_ms": ms("total_duration"),
+        "tokens_per_sec": data.get("eval_count", 0) / (eval_ms / 1000) if eval_ms else 0.0,
+        "wall_ms": seconds * 1000,
+        "context": data.get("context"),
+    }
+
+
+class GenerationStream:
+    """
+    Iterate to get reply text chunks as the server produces them (NDJSON).
+    After the last chunk, .result holds the same dict chat(stream=False)
+    returns. close() drops the connection early.
+
+    With a cancel token, cancelling ends iteration at once (even while
+    waiting for the next token) and it raises Cancelled; .partial keeps
+    the text received until then.
+    """
+
+    def __init__(self, resp, start, cancel=None):
+        self.resp = resp
+        self.start = start
+        self.cancel = cancel
+        self.result = None
+        self.partial = ""
+        self.first_chunk_seconds = None
+
+    def __iter__(self):
+        parts = []
+        try:
+            for line in self._lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise OllamaError(data["error"])
+                text = _text_of(data)
+                if text:
+                    if self.first_chunk_seconds is None:
+                        self.first_chunk_seconds = time.perf_counter() - self.start
+                    parts.append(text)
+                    self.partial += text
+                    yield text
+                if data.get("done"):
+                    self.result = _result(data, "".join(parts), time.perf_counter() - self.start)
+                    break
+        finally:
+            if self.cancel is None:
+                self.resp.close()
+        if self.cancel is not None and self.cancel.cancelled and self.result is None:
+            raise Cancelled(self.cancel.reason)
+
+    def _lines(self):
+        """
+        Response lines. Under a cancel token they are read on a helper
+        thread, so a cancel ends iteration at once, even while the read is
+        blocked waiting for the next token; the helper closes the response
+        as soon as its read returns (the server stops at its next write).
+        """
+        if self.cancel is None:
+            yield from self.resp.iter_lines()
+            return
+
+        lines = queue.Queue()
+        stop = threading.Event()
+        remove = self.cancel.on_cancel(lambda: lines.put(_CANCELLED))
+
+        def _pump():
+            try:
+                for line in self.resp.iter_lines():
+                    if stop.is_set() or self.cancel.cancelled:
+                        break
+                    lines.put(line)
+                lines.put(_END)
+            except Exception as e:
+                lines.put(e)
+            finally:
+                self.resp.close()
+
+        threading.Thread(target=_pump, daemon=True).start()
+        try:
+            while True:
+                item = lines.get()
+                if item is _END or item is _CANCELLED or self.cancel.cancelled:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # the helper stops at its next line if the consumer quit early
+            stop.set()
+            remove()
+
+    def close(self):
+        self.resp.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Process-wide shared client (one connection pool for the whole app)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+        return _client
+
+
+# ============================================================
+#   BENCHMARK: batched HTTP vs one subprocess per chunk
+# ============================================================
+
+def bench_embeddings(count=200, model="embeddinggemma:300m", base_url=None, include_cli=False):
+    """Print chunks/sec for the HTTP client (and optionally the `ollama run` path)."""
+    texts = [f"def function_{i}(x):\n    return x * {i}\n" for i in range(count)]
+
+    client = OllamaClient(base_url) if base_url else OllamaClient()
+    start = time.perf_counter()
+    client.embed(texts, model)
+    elapsed = time.perf_counter() - start
+    print(f"http (batch {EMBED_BATCH_SIZE}): {count / elapsed:8.1f} chunks/sec")
+
+    if include_cli:
+        from knowledge_base.code.indexer import embed_text
+        n = min(count, 20)
+        start = time.perf_counter()
+        for t in texts[:n]:
+            embed_text(t)
+        elapsed = time.perf_counter() - start
+        print(f"cli (ollama run) : {n / elapsed:8.1f} chunks/sec")
+
+
+# ============================================================
+#   BENCHMARK: pooled HTTP generation vs `ollama run` per reply
+# ============================================================
+
+def bench_generation(count=20, model="mistral:7b", base_url=None, include_cli=False):
+    """Print ms per short reply over HTTP (plus server timings) and optionally via the CLI."""
+    import subprocess
+
+    client = OllamaClient(base_url) if base_url else OllamaClient()
+    messages = [{"role": "user", "content": "Reply with one short sentence."}]
+    client.chat(messages, model)  # load / connect once
+
+    start = time.perf_counter()
+    prefill = evals = 0.0
+    for _ in range(count):
+        r = client.chat(messages, model)
+        prefill += r["prompt_eval_ms"]
+        evals += r["eval_ms"]
+    elapsed = time.perf_counter() - start
+    print(f"http chat : {1000 * elapsed / count:8.1f} ms/reply "
+          f"(prefill {prefill / count:.1f} ms, eval {evals / count:.1f} ms)")
+
+    if include_cli:
+        n = min(count, 5)
+        start = time.perf_counter()
+        for _ in range(n):
+            subprocess.run(["ollama", "run", model, messages[0]["content"]],
+                           capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        print(f"ollama run: {1000 * elapsed / n:8.1f} ms/reply")
+
+
+def bench_cancellation(count=5, model="mistral:7b", base_url=None, after=0.3):
+    """
+    Start a streamed reply, cancel it 'after' seconds in and print how long
+    the call took to return and to free its scheduler slot.
+    """
+    from llm.cancellation import CancelToken
+    from llm.scheduler import Scheduler
+
+    client = OllamaClient(base_url) if base_url else OllamaClient()
+    scheduler = Scheduler(max_concurrent=1)
+    messages = [{"role": "user", "content": "Write a long story about a lighthouse."}]
+
+    def _consume(token):
+        try:
+            for _ in client.chat(messages, model, stream=True, cancel=token):
+                pass
+        except Cancelled:
+            pass
+        return time.perf_counter()
+
+    returned = freed = 0.0
+    for _ in range(count):
+        token = CancelToken()
+        future = scheduler.submit(_consume, token, model=model)
+        time.sleep(after)
+        token.cancel()
+        done = future.result()
+        # the next job can only start once the cancelled one gave its slot back
+        started = scheduler.run(time.perf_counter, model=model)
+        returned += done - token.cancelled_at
+        freed += started - token.cancelled_at
+    print(f"cancel -> call returned : {1000 * returned / count:8.2f} ms")
+    print(f"cancel -> slot reused   : {1000 * freed / count:8.2f} ms")
+
+
+if __name__ == "__main__":
+    # python -m llm.ollama_client [--stub] [--cli] [--generate | --cancel]
+    bench = bench_embeddings
+    if "--generate" in sys.argv:
+        bench = bench_generation
+    elif "--cancel" in sys.argv:
+        bench = bench_cancellation
+    if "--stub" in sys.argv:
+        from llm.ollama_stub import start_stub_server
+        # slow tokens, so there is a generation in flight to cancel
+        server, url = start_stub_server(token_delay=0.5 if bench is bench_cancellation else 0.0)
+        bench(base_url=url)
+        server.shutdown()
+    elif bench is bench_cancellation:
+        bench()
+    else:
+        bench(include_cli="--cli" in sys.argv)
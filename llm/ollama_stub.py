@@ -0,0 +1,244 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm.models import MODELS
+
+# ============================================================
+#   LOCAL STUB OF THE OLLAMA HTTP API
+# ============================================================
+#
+# Stands in for a real Ollama server in benchmarks and manual checks
+# (/api/embed, /api/chat, /api/generate, /api/ps, /api/tags):
+#   python -m llm.ollama_stub            -> serve on localhost:11435
+#
+# Responses are deterministic (vectors come from a hash of the text) so
+# results are repeatable, and 'delay' / 'fail_first' / 'token_delay' /
+# 'load_delay' let you simulate a slow or flaky server. 'prompt_cache'
+# makes prompt_eval_count count only what differs from the model's last
+# prompt, like the real server reusing its KV cache.
+
+STUB_PORT = 11435
+
+
+def fake_embedding(text, dim=64):
+    """Deterministic unit-ish vector derived from the text."""
+    out = []
+    counter = 0
+    while len(out) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        out.extend((b - 127.5) / 127.5 for b in digest)
+        counter += 1
+    return out[:dim]
+
+
+def fake_reply(prompt, model, words=40):
+    """Deterministic reply text: a header plus an echo of the prompt's last words."""
+    tail = prompt.split()[-words:]
+    return f"[stub {model}] " + " ".join(tail)
+
+
+def _fake_tokens(text):
+    """Stand-in token ids, about one per 4 chars like the estimate elsewhere."""
+    return [hash(text[i:i + 4]) % 32000 for i in range(0, len(text), 4)]
+
+
+def fake_model_size(model):
+    """Resident bytes for a model: ~0.6 GB per billion parameters in its tag, else 4 GB."""
+    match = re.search(r"(\d+)[bB]", model or "")
+    return int((int(match.group(1)) * 0.6 if match else 4) * 1e9)
+
+
+def _prompt_of(payload):
+    if "messages" in payload:
+        return "\n".join(m.get("content", "") for m in payload["messages"])
+    return payload.get("prompt", "")
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        if self.path == "/api/ps":
+            with server.lock:
+                loaded = sorted(server.loaded)
+            self._send_json(200, {"models": [
+                {"name": m, "model": m, "size": fake_model_size(m), "size_vram": fake_model_size(m)}
+                for m in loaded
+            ]})
+        elif self.path == "/api/tags":
+            self._send_json(200, {"models": [
+                {"name": m, "model": m, "size": int(fake_model_size(m) / 1.2)}
+                for m in server.known_models
+            ]})
+        else:
+            self._send_json(404, {"error": f"stub: unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server
+
+        with server.lock:
+            server.request_count += 1
+            failing = server.request_count <= server.fail_first
+        if failing:
+            self._send_json(503, {"error": "stub: simulated failure"})
+            return
+
+        if server.delay:
+            time.sleep(server.delay)
+
+        if self.path == "/api/embed":
+            inputs = payload.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            self._send_json(200, {
+                "model": payload.get("model"),
+                "embeddings": [fake_embedding(t, server.dim) for t in inputs],
+            })
+        elif self.path in ("/api/chat", "/api/generate"):
+            self._generate(payload)
+        else:
+            self._send_json(404, {"error": f"stub: unknown endpoint {self.path}"})
+
+    def _generate(self, payload):
+        """Fake /api/chat and /api/generate, streamed as NDJSON when asked."""
+        server = self.server
+        start = time.perf_counter()
+        model = payload.get("model")
+        prompt = _prompt_of(payload)
+        chat = self.path == "/api/chat"
+
+        # a model that isn't loaded pays load_delay first; keep_alive 0 unloads
+        with server.lock:
+            cold = model not in server.loaded
+            if payload.get("keep_alive") in (0, "0", "0s"):
+                server.loaded.discard(model)
+                server.last_prompt.pop(model, None)
+                unloading = True
+            else:
+                server.loaded.add(model)
+                unloading = False
+        if unloading:
+            self._send_json(200, {"model": model, "done": True, "done_reason": "unload"})
+            return
+        load = server.load_delay if cold else 0.0
+        if load:
+            time.sleep(load)
+        if not prompt:
+            # empty request: just load the model, like the real server
+            self._send_json(200, {"model": model, "done": True, "done_reason": "load",
+                                  "load_duration": int(load * 1e9)})
+            return
+
+        tokens = [w + " " for w in fake_reply(prompt, model).split()]
+        prefilled = len(prompt)
+        if server.prompt_cache:
+            with server.lock:
+                cached = os.path.commonprefix([server.last_prompt.get(model, ""), prompt])
+                server.last_prompt[model] = prompt
+            prefilled -= len(cached)
+
+        def line(text, done):
+            data = {"model": model, "done": done}
+            if chat:
+                data["message"] = {"role": "assistant", "content": text}
+            else:
+                data["response"] = text
+            return data
+
+        def final(text):
+            data = line(text, True)
+            elapsed = int((time.perf_counter() - start) * 1e9)
+            if not chat:
+                # like the real server: prior context + prompt + reply "tokens"
+                data["context"] = (payload.get("context") or []) + _fake_tokens(prompt + "".join(tokens))
+            data.update({
+                "done_reason": "stop",
+                "total_duration": elapsed,
+                "load_duration": int(load * 1e9),
+                "prompt_eval_count": prefilled // 4,
+                "prompt_eval_duration": elapsed // 4,
+                "eval_count": len(tokens),
+                "eval_duration": max(1, elapsed - elapsed // 4),
+            })
+            return data
+
+        if not payload.get("stream", True):
+            time.sleep(server.token_delay * len(tokens))
+            self._send_json(200, final("".join(tokens)))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for tok in tokens:
+                if server.token_delay:
+                    time.sleep(server.token_delay)
+                self._send_chunk(json.dumps(line(tok, False)) + "\n")
+            self._send_chunk(json.dumps(final("")) + "\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client hung up mid-stream
+
+    def _send_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stub_server(port=0, dim=64, delay=0.0, fail_first=0, token_delay=0.0, load_delay=0.0,
+                      prompt_cache=False):
+    """
+    Start the stub on a daemon thread. port=0 picks a free port.
+    token_delay is the time per generated token on /api/chat and /api/generate,
+    load_delay the extra time the first request to a model that isn't loaded takes.
+    prompt_cache=True reports only the prompt past the model's last one as prefilled.
+    Returns (server, base_url); call server.shutdown() when done.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _StubHandler)
+    server.daemon_threads = True
+    server.dim = dim
+    server.delay = delay
+    server.fail_first = fail_first
+    server.token_delay = token_delay
+    server.load_delay = load_delay
+    server.loaded = set()
+    server.prompt_cache = prompt_cache
+    server.last_prompt = {}  # model -> last prompt, for prompt_cache
+    server.known_models = sorted(set(MODELS.values()))
+    server.request_count = 0
+    server.lock = threading.Lock()
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    server, url = start_stub_server(port=STUB_PORT)
+    print(f"Ollama stub listening on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
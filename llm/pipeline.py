@@ -0,0 +1,136 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from llm.prompt_builder import build_messages_for_model, messages_to_prompt
+from llm.summarizer import trim_and_summarize_if_needed
+from llm.context_packer import RETRIEVE_CANDIDATES
+from llm.models import SUMMARIZER_MODEL
+from llm.history_budget import plan_budget, budget_report
+from knowledge_base.code.retriever import retrieve
+from tools.weather import get_current_weather
+
+# Stage timings of the last pre-generation run (name -> seconds)
+last_timings = {}
+
+# Per-turn stage timings are debug output (see PROMPT_DEBUG in llm/models.py)
+log = logging.getLogger(__name__)
+
+
+# ============================================================
+#   SMALL DEPENDENCY GRAPH RUNNER
+# ============================================================
+
+def run_graph(stages):
+    """
+    Run stages concurrently, each as soon as its dependencies are done.
+
+        stages: {name: (fn, [dependency names])}
+
+    fn is called with the results of its dependencies as keyword args.
+    Returns (results, timings); a timing is the stage's own wall time, not
+    the time it spent waiting on dependencies. A failing stage re-raises
+    here (and in every stage that depends on it).
+    """
+    order = []
+    pending = dict(stages)
+    while pending:
+        ready = [n for n, (_, deps) in pending.items() if all(d in order for d in deps)]
+        if not ready:
+            raise ValueError(f"Unknown or cyclic stage dependencies: {sorted(pending)}")
+        for name in ready:
+            order.append(name)
+            del pending[name]
+
+    futures = {}
+    timings = {}
+
+    def run(name, fn, deps):
+        kwargs = {d: futures[d].result() for d in deps}
+        start = time.perf_counter()
+        try:
+            return fn(**kwargs)
+        finally:
+            timings[name] = time.perf_counter() - start
+
+    # one thread per stage, so a stage blocked on its dependencies never
+    # starves the ones it is waiting for
+    with ThreadPoolExecutor(max_workers=max(1, len(stages))) as pool:
+        for name in order:
+            fn, deps = stages[name]
+            futures[name] = pool.submit(run, name, fn, deps)
+        results = {name: f.result() for name, f in futures.items()}
+    return results, timings
+
+
+# ============================================================
+#   PRE-GENERATION STAGES
+# ============================================================
+
+def _summarize(max_messages, auto_summarize, model_name=None, on_auto_summary=None):
+    """
+    Summarize what doesn't fit model_name's token budget now, and what is
+    past max_messages in the background (auto_summarize) or now.
+    True if a summary was applied before the prompt is built;
+    on_auto_summary is called when a background one is applied.
+    """
+    return trim_and_summarize_if_needed(
+        max_messages=max_messages,
+        summarizer_model=SUMMARIZER_MODEL,
+        output_text=None,
+        auto=auto_summarize,
+        model_name=model_name,
+        on_done=on_auto_summary
+    )
+
+
+def run_pregeneration(user_prompt, max_messages, auto_summarize, use_weather=False, model_name=None,
+                      on_auto_summary=None):
+    """
+    Everything that has to happen before the model is called, as a graph:
+
+        summarize --------------.
+        retrieve (embed+search) -+--> messages
+        weather  (tool prompts only, replaces the model call)
+
+    Returns {"messages", "prompt", "results", "weather", "summarized", "timings"};
+    "prompt" is the messages flattened for the `ollama run` CLI path and
+    "results" the retrieval hits (the Auto router reads their scores).
+    With model_name, history, context and loaded history are fitted to
+    that model's token budget (llm/history_budget.py). on_auto_summary is
+    called from a worker thread once a background summary was applied.
+    """
+    global last_timings
+
+    plan = plan_budget(model_name) if model_name is not None else None
+    stages = {"summarize": (lambda: _summarize(max_messages, auto_summarize, model_name,
+                                               on_auto_summary), [])}
+    if use_weather:
+        stages["weather"] = (lambda: get_current_weather(user_prompt), [])
+    else:
+        stages["retrieve"] = (lambda: retrieve(user_prompt, top_k_ret=RETRIEVE_CANDIDATES,
+                                               with_embeddings=True), [])
+        # the prompt reads the conversation, so it waits for the summary
+        stages["messages"] = (lambda summarize, retrieve: build_messages_for_model(user_prompt, retrieve, plan),
+                              ["summarize", "retrieve"])
+
+    start = time.perf_counter()
+    results, timings = run_graph(stages)
+    timings["total"] = time.perf_counter() - start
+    last_timings = timings
+
+    serial = sum(t for name, t in timings.items() if name != "total")
+    log.info("%s | total %.2fs (serial %.2fs)",
+             ", ".join(f"{n} {t:.2f}s" for n, t in timings.items() if n != "total"),
+             timings["total"], serial)
+    if model_name is not None:
+        log.info("%s", budget_report(model_name))
+
+    return {
+        "messages": results.get("messages"),
+        "prompt": messages_to_prompt(results["messages"]) if "messages" in results else None,
+        "results": results.get("retrieve"),
+        "weather": results.get("weather"),
+        "summarized": bool(results["summarize"]),
+        "timings": timings,
+    }
@@ -1,6 +1,14 @@
-from memory.conversation import conversation_messages, loaded_history
+import sys
+import time
+import logging
+import threading
+
+import memory.conversation as mem
+from memory.conversation import conversation_messages
 from tools.rag.rag_search import simple_search
-from knowledge_base.code.retriever import retrieve, format_for_prompt
+from knowledge_base.code.retriever import retrieve
+from llm.context_packer import pack_context, estimate_tokens, RETRIEVE_CANDIDATES
+from llm.models import PROMPT_DEBUG
 """
 Constructs a single prompt string from loaded_history and conversation_messages.
 Formated like:
@@ -12,44 +20,252 @@ Formated like:
 Code Blocks are wrapped in ```code...  ```
 """
 
-def build_prompt_for_model(user_prompt: str):
-    parts = []
-    
-    results = retrieve(user_prompt, top_k_ret=5)
-
-    context = format_for_prompt(results, char_length=1500)
-    
-
-    parts.append(f"Use the following context to answer the question IF HELPFUL:\n {context}\n")
-
-    if loaded_history:
-        parts.append(f"[LOADED HISTORY START]\n{loaded_history}\n[LOADED HISTORY END]\n")
-
-    for m in conversation_messages:
-        role = m["role"].capitalize()
-        content = m["content"]
-        if role == "SUMMARY":
-            # keep summary short and clear for the model"
-            parts.append(f"Summary: {content}\n")
-        elif m["is_code"]:
-            #ensure code is clearly marked
-            if role == "USER":
-                parts.append(f"User:\n```code\n{content}\n```\n")
-            elif role == "ASSISTANT":
-                parts.append(f"Assistant:\n```code\n{content}\n```\n")
-            else:
-                parts.append(f"{role.capitalize()}:\n```code\n{content}\n```\n")
-        else:
-            #normal text line
-            if role == "USER":
-                parts.append(f"User: {content}\n")
-            elif role == "ASSISTANT":
-                parts.append(f"Assistant: {content}\n")
-            else:
-                parts.append(f"{role.capitalize()}: {content}\n")
-    #append user prompt and assistant queue, then join parts and return
+# Full prompts, packing stats and per-turn timings are debug output: off
+# unless PROMPT_DEBUG is set (or the "llm" loggers are configured elsewhere).
+# The handler goes on the parent "llm" logger so every llm.* module shares it.
+log = logging.getLogger(__name__)
+if PROMPT_DEBUG:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("[%(name)s] %(message)s"))
+    logging.getLogger("llm").addHandler(_handler)
+    logging.getLogger("llm").setLevel(logging.DEBUG)
+
+def build_prompt_for_model(user_prompt: str, results=None):
+    """Single prompt string for the `ollama run` CLI path."""
+    prompt = messages_to_prompt(build_messages_for_model(user_prompt, results))
+    log.debug("prompt:\n%s", prompt)
+    return prompt
+
+
+def build_messages_for_model(user_prompt: str, results=None, plan=None, conversation=None):
+    """
+    Same content as build_prompt_for_model, as chat messages for the HTTP
+    API: loaded history, the conversation (summaries as system messages),
+    then the retrieved context right before the newest user message.
+
+    The context changes every turn, so it goes last: everything before it
+    is a stable prefix the server can reuse (see llm/session.py).
+
+    'plan' (llm/history_budget.plan_budget) caps the retrieved context and
+    the loaded history in tokens. 'conversation' replaces the GUI
+    conversation (the batch runner sends each prompt on its own).
+    """
+    if conversation is None:
+        conversation = conversation_messages
+    messages = []
+
+    #results can be passed in when retrieval already ran (see llm/pipeline.py)
+    if results is None:
+        results = retrieve(user_prompt, top_k_ret=RETRIEVE_CANDIDATES, with_embeddings=True)
+
+    #merge / dedupe the hits and fit them to the context token budget
+    budget = {} if plan is None else {"budget": plan["context"]}
+    context, pack_stats = pack_context(results, conversation, mem.loaded_history, **budget)
+    log.info("[context] %d/%d chunks, ~%d tokens (%d saved vs top-5 x 1500 chars)",
+             pack_stats["used"], pack_stats["candidates"], pack_stats["tokens"], pack_stats["tokens_saved"])
+
+    if mem.loaded_history:
+        messages.append(_loaded_history_message(mem.loaded_history,
+                                                None if plan is None else plan["loaded_history"]))
+
+    #rendered once per message; only new or rewritten messages are rendered here
+    chats = [seg.chat for seg in get_segments().sync(conversation)]
+    if plan is not None:
+        #the recent turns are never summarized: cut them if they alone are over budget
+        from llm.history_budget import recent_caps  # imports this module
+        for i, cap in recent_caps(plan["conversation"], conversation).items():
+            chats[i] = _truncated_chat(chats[i], cap)
+    messages.extend(chats[:-1])
+
+    messages.append({"role": "system",
+                     "content": f"Use the following context to answer the question IF HELPFUL:\n {context}"})
+    if chats:
+        messages.append(chats[-1])
+    return messages
+
+
+_loaded_history_cache = (None, None, None)
+
+
+def _loaded_history_message(text, budget=None):
+    """System message with the loaded history, keeping its newest part within 'budget' tokens."""
+    global _loaded_history_cache
+    if _loaded_history_cache[0] is not text or _loaded_history_cache[1] != budget:
+        kept = text
+        if budget is not None and estimate_tokens(text) > budget:
+            kept = "..." + text[-4 * budget:]
+        _loaded_history_cache = (text, budget, {"role": "system",
+                                                "content": f"[LOADED HISTORY START]\n{kept}\n[LOADED HISTORY END]"})
+    return _loaded_history_cache[2]
+
+
+_TRUNCATED = "\n[... truncated to fit the prompt budget ...]\n"
+
+
+def _truncated_chat(chat, budget):
+    """Copy of a chat message cut to about 'budget' tokens, keeping its start and end."""
+    keep = max(0, 4 * budget - len(_TRUNCATED) - 16) // 2
+    content = chat["content"]
+    return dict(chat, content=content[:keep] + _TRUNCATED + content[len(content) - keep:])
+
+
+def _chat_message(m):
+    content = m["content"]
+    if m["role"] == "summary":
+        # keep summary short and clear for the model
+        return {"role": "system", "content": f"Summary: {content}"}
+    if m["is_code"]:
+        #ensure code is clearly marked
+        return {"role": m["role"], "content": f"```code\n{content}\n```"}
+    return {"role": m["role"], "content": content}
+
+
+def _render(m):
+    """One chat message as its segment of the single-string prompt."""
+    content = m["content"]
+    if m["role"] == "system":
+        return f"{content}\n"
+    if content.startswith("```code\n"):
+        return f"{m['role'].capitalize()}:\n{content}\n"
+    return f"{m['role'].capitalize()}: {content}\n"
+
+
+def messages_to_prompt(messages):
+    """Flatten chat messages into the single-string prompt format above."""
+    #conversation messages come with their segment already rendered
+    rendered = get_segments().rendered_text
+    parts = [rendered(m) for m in messages]
+    #append assistant queue, then join parts and return
     parts.append("\nAssistant:")
-    print("\n".join(parts))
     return "\n".join(parts)
 
 
+
+# ============================================================
+#   CACHED MESSAGE SEGMENTS
+# ============================================================
+
+class Segment:
+    __slots__ = ("message", "content", "chat", "text", "tokens")
+
+    def __init__(self, message):
+        self.message = message
+        self.content = message["content"]
+        self.chat = _chat_message(message)
+        self.text = _render(self.chat)
+        self.tokens = estimate_tokens(self.text)
+
+
+class SegmentCache:
+    """
+    Each conversation message's chat form, prompt segment and token count,
+    rendered once.
+
+    Entries are keyed by the message object and checked against its
+    content, so a new turn renders only the appended messages and a
+    summary renders only the message it inserted; the messages it removed
+    are dropped on the next sync after history_rewritten().
+    """
+
+    def __init__(self):
+        self._by_id = {}        # id(message) -> Segment
+        self._by_chat = {}      # id(chat message) -> Segment
+        self._generation = mem.history_generation()
+        self._last_list = None  # the list synced last time and its segments
+        self._last = []
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.reused = 0
+
+    def sync(self, messages):
+        """Segments for 'messages' (in order), rendering only what is new."""
+        with self._lock:
+            #common case: nothing rewritten since last time, messages only appended
+            last = self._last if messages is self._last_list else None
+            generation = mem.history_generation()
+            if (generation == self._generation and last and len(messages) >= len(last)
+                    and messages[len(last) - 1] is last[-1].message
+                    and messages[0] is last[0].message):
+                out = list(last)
+                start = len(last)
+                self.reused += start
+            else:
+                out = []
+                start = 0
+            for m in messages[start:]:
+                seg = self._by_id.get(id(m))
+                if seg is None or seg.message is not m or seg.content is not m["content"]:
+                    seg = Segment(m)
+                    self._by_id[id(m)] = seg
+                    self._by_chat[id(seg.chat)] = seg
+                    self.rendered += 1
+                else:
+                    self.reused += 1
+                out.append(seg)
+
+            #after a summary / clear / load, or once stale entries pile up
+            if generation != self._generation or len(self._by_id) > 2 * len(messages) + 16:
+                self._generation = generation
+                self._by_id = {id(seg.message): seg for seg in out}
+                self._by_chat = {id(seg.chat): seg for seg in out}
+            self._last_list, self._last = messages, out
+            return out
+
+    def rendered_text(self, chat):
+        """Prompt segment of a chat message, from the cache when it is one of ours."""
+        seg = self._by_chat.get(id(chat))
+        if seg is not None and seg.chat is chat:
+            return seg.text
+        return _render(chat)
+
+    def tokens(self, messages):
+        """Estimated prompt tokens of 'messages' (a conversation list)."""
+        return sum(seg.tokens for seg in self.sync(messages))
+
+    def stats(self):
+        return {"cached": len(self._by_id), "rendered": self.rendered, "reused": self.reused}
+
+
+_segments = SegmentCache()
+
+
+def get_segments():
+    return _segments
+
+
+
+# ============================================================
+#   MEASUREMENT
+# ============================================================
+
+def bench_prompt_builder(history=2000, turns=50):
+    """ms per turn to render the conversation part of the prompt: uncached vs cached."""
+    messages = []
+    for i in range(history):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append({"role": role, "content": f"message {i} " + "lorem ipsum " * 40,
+                         "is_code": i % 10 == 0})
+
+    def uncached():
+        return "\n".join(_render(_chat_message(m)) for m in messages)
+
+    cache = SegmentCache()
+
+    def cached():
+        rendered = cache.rendered_text
+        return "\n".join(rendered(seg.chat) for seg in cache.sync(messages))
+
+    assert uncached() == cached()
+    for name, fn in (("uncached", uncached), ("cached", cached)):
+        start = time.perf_counter()
+        for t in range(turns):
+            messages.append({"role": "user", "content": f"turn {t}", "is_code": False})
+            fn()
+        elapsed = time.perf_counter() - start
+        print(f"{name:9}: {1000 * elapsed / turns:7.2f} ms/turn over {len(messages)} messages")
+    print(cache.stats())
+
+
+if __name__ == "__main__":
+    # python -m llm.prompt_builder [history size]
+    bench_prompt_builder(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
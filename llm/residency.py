@@ -0,0 +1,221 @@
+import os
+import sys
+import time
+import logging
+import threading
+
+from llm.models import MODELS, WARM_MODELS, RESIDENT_MEMORY_BUDGET_GB
+from llm.ollama_client import get_client, keep_alive_for, OllamaError
+from llm.scheduler import get_scheduler, INTERACTIVE, SUMMARIZATION
+
+# Resident memory of a loaded model vs. its size on disk (weights + KV cache + buffers)
+RESIDENT_OVERHEAD = 1.2
+
+# Load times kept per model for the report
+_LOAD_SAMPLES = 20
+
+log = logging.getLogger(__name__)
+
+
+def memory_budget():
+    """Bytes the loaded models may use (RESIDENT_MEMORY_BUDGET_GB, else 75% of RAM)."""
+    if RESIDENT_MEMORY_BUDGET_GB is not None:
+        return int(RESIDENT_MEMORY_BUDGET_GB * 1e9)
+    try:
+        return int(0.75 * os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+    except (AttributeError, ValueError, OSError):
+        return None  # unknown (e.g. Windows): never evict
+
+
+# ============================================================
+#   RESIDENCY MANAGER
+# ============================================================
+
+class ResidencyManager:
+    """
+    Decides which models stay loaded in the Ollama server.
+
+    warm() preloads a model through the scheduler (so it never races a
+    generation for the same model) with the same num_ctx generation uses.
+    Before a load, models are unloaded least recently used first until the
+    new one fits the memory budget; warm models (WARM_MODELS) and models
+    with a call running are never evicted. Sizes come from /api/ps for
+    loaded models and from the size on disk for the rest.
+    """
+
+    def __init__(self, client=None, budget=None, warm_models=WARM_MODELS):
+        self._client = client
+        self.budget = memory_budget() if budget is None else budget
+        self.warm_models = set(warm_models)
+        self.last_used = {}     # model -> perf_counter of its last call / warm-up
+        self.load_times = {}    # model -> [seconds, ...]
+        self.sizes = {}         # model -> resident bytes, last seen in /api/ps
+        self.evictions = 0
+        self._pending = {}      # model -> Future of a queued / running warm-up
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        return self._client or get_client()
+
+    def touch(self, model):
+        """Record a call to 'model' (for least-recently-used eviction)."""
+        with self._lock:
+            self.last_used[model] = time.perf_counter()
+
+    def warm(self, model, priority=SUMMARIZATION):
+        """Preload 'model' in the background. Returns the Future (shared while pending)."""
+        with self._lock:
+            future = self._pending.get(model)
+            if future is not None and not future.done():
+                return future
+            future = get_scheduler().submit(self._load, model, model=model,
+                                            priority=priority, label="warm-up")
+            self._pending[model] = future
+        return future
+
+    def _load(self, model):
+        """Scheduler job: make room, then load. Returns the load seconds (0 if already loaded)."""
+        self.touch(model)
+        try:
+            running = self.client.running()
+            if model in running:
+                return 0.0
+            self._make_room(model, running)
+            seconds = self.client.load(model, keep_alive_for(model))
+            running = self.client.running()
+        except OllamaError as e:
+            log.warning("could not load %s: %s", model, e)
+            return None
+
+        with self._lock:
+            samples = self.load_times.setdefault(model, [])
+            samples.append(seconds)
+            del samples[:-_LOAD_SAMPLES]
+            for name, info in running.items():
+                self.sizes[name] = info.get("size", 0)
+        log.info("loaded %s in %.0f ms (~%.1f GB resident)",
+                 model, 1000 * seconds, self.sizes.get(model, 0) / 1e9)
+        return seconds
+
+    def estimate(self, model, running=None, installed=None):
+        """Resident bytes 'model' takes (or would take) once loaded."""
+        if running and model in running:
+            return running[model].get("size", 0)
+        if model in self.sizes:
+            return self.sizes[model]
+        if installed is None:
+            installed = self.client.installed()
+        return int(installed.get(model, 0) * RESIDENT_OVERHEAD)
+
+    def _make_room(self, model, running):
+        if self.budget is None:
+            return
+        installed = self.client.installed()
+        need = self.estimate(model, running, installed)
+        used = sum(info.get("size", 0) for info in running.values())
+        busy = get_scheduler().stats()["running_by_model"]
+
+        with self._lock:
+            candidates = sorted(
+                (m for m in running
+                 if m != model and m not in self.warm_models and not busy.get(m)),
+                key=lambda m: self.last_used.get(m, 0.0)
+            )
+        for victim in candidates:
+            if used + need <= self.budget:
+                break
+            self.client.unload(victim)
+            used -= running[victim].get("size", 0)
+            self.evictions += 1
+            log.info("unloaded %s to make room for %s", victim, model)
+        if used + need > self.budget:
+            log.warning("%s (~%.1f GB) exceeds the budget even after eviction", model, need / 1e9)
+
+    def report(self):
+        """One row per known model: loaded, resident estimate, keep-alive, load times."""
+        try:
+            running = self.client.running()
+            installed = self.client.installed()
+        except OllamaError:
+            running, installed = {}, {}
+        rows = []
+        for model in sorted(set(MODELS.values()) | set(running) | self.warm_models):
+            with self._lock:
+                loads = list(self.load_times.get(model, []))
+            rows.append({
+                "model": model,
+                "loaded": model in running,
+                "resident_gb": self.estimate(model, running, installed) / 1e9,
+                "keep_alive": keep_alive_for(model),
+                "warm": model in self.warm_models,
+                "loads": len(loads),
+                "avg_load_ms": 1000 * sum(loads) / len(loads) if loads else None,
+            })
+        return rows
+
+    def print_report(self):
+        budget = f"{self.budget / 1e9:.1f} GB" if self.budget else "unlimited"
+        print(f"[residency] budget {budget}, {self.evictions} evictions")
+        for r in self.report():
+            load = f"{r['avg_load_ms']:.0f} ms x{r['loads']}" if r["loads"] else "-"
+            print(f"  {'*' if r['loaded'] else ' '} {r['model']:<60} ~{r['resident_gb']:5.1f} GB  "
+                  f"keep {r['keep_alive']:<4} load {load}{'  (warm)' if r['warm'] else ''}")
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_residency():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ResidencyManager()
+        return _manager
+
+
+def warm_on_startup(default_model):
+    """Queue warm-ups for the default model and WARM_MODELS; returns at once."""
+    manager = get_residency()
+    futures = [manager.warm(default_model, priority=INTERACTIVE)]
+    futures += [manager.warm(m) for m in WARM_MODELS if m != default_model]
+    return futures
+
+
+# ============================================================
+#   MEASUREMENT
+# ============================================================
+
+def bench_residency(base_url=None, model="qwen3:30b"):
+    """Time to first reply with and without a warm-up, against a real server or the stub."""
+    from llm.ollama_client import OllamaClient
+
+    client = OllamaClient(base_url) if base_url else get_client()
+    manager = ResidencyManager(client=client)
+    messages = [{"role": "user", "content": "Reply with one short sentence."}]
+
+    client.unload(model)
+    start = time.perf_counter()
+    r = client.chat(messages, model)
+    print(f"cold first reply : {1000 * (time.perf_counter() - start):8.1f} ms "
+          f"(load {r['load_ms']:.0f} ms)")
+
+    client.unload(model)
+    manager.warm(model).result()
+    start = time.perf_counter()
+    r = client.chat(messages, model)
+    print(f"warm first reply : {1000 * (time.perf_counter() - start):8.1f} ms "
+          f"(load {r['load_ms']:.0f} ms)")
+    manager.print_report()
+
+
+if __name__ == "__main__":
+    # python -m llm.residency [--stub]
+    if "--stub" in sys.argv:
+        from llm.ollama_stub import start_stub_server
+        server, url = start_stub_server(load_delay=2.0)
+        bench_residency(base_url=url)
+        server.shutdown()
+    else:
+        bench_residency()
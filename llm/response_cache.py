@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+
+from llm.models import GENERATE_BACKEND, GENERATION_TEMPERATURE, GENERATION_NUM_CTX
+
+# Cached replies, one JSON file per entry (next to the other caches, which the indexer skips)
+RESPONSE_CACHE_DIR = Path("knowledge_base/embeddings/response_cache")
+
+# Entries older than this are treated as missing and removed (seconds)
+RESPONSE_CACHE_TTL = 7 * 24 * 3600
+
+# Disk budget; the least recently used entries go first
+RESPONSE_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# In-memory front tier
+RESPONSE_CACHE_MEMORY_ENTRIES = 64
+
+
+# ============================================================
+#   KEY
+# ============================================================
+
+def response_key(model, prompt, options=None):
+    """Hash of model + fully rendered prompt + generation options."""
+    raw = json.dumps({"model": model, "prompt": prompt, "options": options or {}},
+                     sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def current_options():
+    """The generation settings that can change a reply (part of the key)."""
+    return {"backend": GENERATE_BACKEND, "temperature": GENERATION_TEMPERATURE,
+            "num_ctx": GENERATION_NUM_CTX}
+
+
+# ============================================================
+#   TWO-TIER CACHE
+# ============================================================
+
+class ResponseCache:
+    """
+    Model replies keyed by response_key(): a small LRU in memory in front
+    of a directory of JSON files with TTL and total-size eviction.
+    Hit / miss counters are kept per model.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_DIR, ttl=RESPONSE_CACHE_TTL,
+                 max_bytes=RESPONSE_CACHE_MAX_BYTES, memory_entries=RESPONSE_CACHE_MEMORY_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # key -> entry
+        self._disk = None             # key -> (size, last used), scanned lazily
+        self._lock = threading.Lock()
+        self.model_stats = {}         # model -> {"hits", "misses"}
+        self.evictions = 0
+
+    # ------------------------------------------------------------
+    #   disk
+    # ------------------------------------------------------------
+    def _file(self, key):
+        return self.path / f"{key}.json"
+
+    def _scan(self):
+        if self._disk is not None:
+            return
+        self._disk = {}
+        if not self.path.exists():
+            return
+        for f in self.path.glob("*.json"):
+            st = f.stat()
+            self._disk[f.stem] = (st.st_size, st.st_mtime)
+
+    def _drop(self, key):
+        self._memory.pop(key, None)
+        self._disk.pop(key, None)
+        try:
+            self._file(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _evict_disk(self):
+        total = sum(size for size, _ in self._disk.values())
+        for key, (size, _) in sorted(self._disk.items(), key=lambda kv: kv[1][1]):
+            if total <= self.max_bytes:
+                break
+            self._drop(key)
+            total -= size
+            self.evictions += 1
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    # ------------------------------------------------------------
+    #   public
+    # ------------------------------------------------------------
+    def get(self, key, model):
+        """Cached reply text, or None."""
+        with self._lock:
+            self._scan()
+            counts = self.model_stats.setdefault(model, {"hits": 0, "misses": 0})
+            entry = self._memory.get(key)
+            if entry is None and key in self._disk:
+                try:
+                    with self._file(key).open("r", encoding="utf-8") as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    self._drop(key)
+            if entry is not None and time.time() - entry["created"] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None:
+                counts["misses"] += 1
+                return None
+
+            counts["hits"] += 1
+            self._remember(key, entry)
+            # mtime doubles as "last used" for the size eviction
+            now = time.time()
+            try:
+                os.utime(self._file(key), (now, now))
+                self._disk[key] = (self._disk[key][0], now)
+            except (OSError, KeyError):
+                pass
+            return entry["reply"]
+
+    def put(self, key, model, reply):
+        entry = {"model": model, "reply": reply, "created": time.time()}
+        with self._lock:
+            self._scan()
+            self._remember(key, entry)
+            try:
+                self.path.mkdir(parents=True, exist_ok=True)
+                tmp = self._file(key).with_suffix(".tmp")
+                with tmp.open("w", encoding="utf-8") as f:
+                    json.dump(entry, f, ensure_ascii=False)
+                os.replace(tmp, self._file(key))
+                self._disk[key] = (self._file(key).stat().st_size, entry["created"])
+                self._evict_disk()
+            except OSError as e:
+                print("Could not save response cache entry:", e)
+
+    def clear(self):
+        with self._lock:
+            self._scan()
+            for key in list(self._disk):
+                self._drop(key)
+            self._memory.clear()
+            self.model_stats = {}
+            self.evictions = 0
+
+    def stats(self):
+        """Per-model hits / misses / hit_rate plus entry counts and disk size."""
+        with self._lock:
+            self._scan()
+            models = {}
+            for model, c in self.model_stats.items():
+                lookups = c["hits"] + c["misses"]
+                models[model] = dict(c, hit_rate=c["hits"] / lookups if lookups else 0.0)
+            return {
+                "models": models,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._disk),
+                "disk_bytes": sum(size for size, _ in self._disk.values()),
+                "evictions": self.evictions,
+            }
+
+
+_cache = ResponseCache()
+
+
+def get_response_cache():
+    return _cache
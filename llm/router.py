@@ -0,0 +1,185 @@
+import re
+import sys
+import math
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+
+from memory.conversation import detect_code_block, conversation_messages
+from llm.context_packer import estimate_tokens
+from llm.models import MODELS, ROUTER_TIERS
+
+# One JSON line per routed turn: the features, the choice and how long the reply took
+ROUTER_LOG = Path("knowledge_base/embeddings/router_log.jsonl")
+
+# Per-prompt override: "@fast ...", "@code ...", "@think ..." skip the router
+OVERRIDE_PREFIXES = {"@fast": "fast", "@code": "code", "@think": "reasoning"}
+
+# A retrieval hit this close means the question is about the indexed code
+CODE_HIT_SCORE = 0.55
+
+# Prompts longer than this (estimated tokens) go to the reasoning model
+LONG_PROMPT_TOKENS = 400
+
+# Short prompts stay on the fast model even with a reasoning keyword
+SHORT_PROMPT_TOKENS = 12
+
+_CODE_WORDS = re.compile(
+    r"\b(code|function|class|method|bug|error|exception|traceback|stack ?trace|"
+    r"refactor|compile|regex|sql|api|python|javascript|typescript|rust|java|c\+\+|"
+    r"unit ?test|debug|implement|snippet)\b|\w+\(\)|[A-Za-z_]+\.(py|js|ts|rs|java|cpp)\b",
+    re.I,
+)
+_REASONING_WORDS = re.compile(
+    r"\b(why|explain|prove|proof|derive|compare|trade-?offs?|analy[sz]e|design|"
+    r"architecture|plan|evaluate|step by step|reason|pros and cons|strategy|research)\b",
+    re.I,
+)
+
+_log_lock = threading.Lock()
+
+log = logging.getLogger(__name__)
+
+
+# ============================================================
+#   FEATURES
+# ============================================================
+
+def prompt_features(prompt, results=None):
+    """Cheap features of a turn: length, code, keywords, retrieval hits."""
+    scores = [r.get("score", 0.0) for r in (results or [])]
+    recent = conversation_messages[-4:]
+    return {
+        "tokens": estimate_tokens(prompt),
+        "lines": prompt.count("\n") + 1,
+        "has_code": detect_code_block(prompt),
+        "code_words": len(_CODE_WORDS.findall(prompt)),
+        "reasoning_words": len(_REASONING_WORDS.findall(prompt)),
+        "top_hit": max(scores) if scores else 0.0,
+        "code_hits": sum(1 for s in scores if s >= CODE_HIT_SCORE),
+        "recent_code": any(m["is_code"] for m in recent),
+    }
+
+
+# ============================================================
+#   ROUTING
+# ============================================================
+
+def split_override(prompt):
+    """("@code fix this" -> ("fix this", "code")); no prefix -> (prompt, None)."""
+    head, _, rest = prompt.partition(" ")
+    tier = OVERRIDE_PREFIXES.get(head.lower())
+    if tier is None:
+        return prompt, None
+    return rest.strip(), tier
+
+
+def choose_tier(f):
+    """The policy: (tier, reason). Fast unless the turn clearly needs more."""
+    if f["has_code"]:
+        return "code", "prompt contains code"
+    if f["code_words"] >= 2 or (f["code_words"] and f["recent_code"]):
+        return "code", f"{f['code_words']} code keywords"
+    if f["code_hits"] and f["code_words"]:
+        return "code", f"about indexed code (hit {f['top_hit']:.2f})"
+    if f["tokens"] > LONG_PROMPT_TOKENS:
+        return "reasoning", f"long prompt ({f['tokens']} tokens)"
+    if f["reasoning_words"] and f["tokens"] > SHORT_PROMPT_TOKENS:
+        return "reasoning", f"{f['reasoning_words']} reasoning keywords"
+    return "fast", "short / general question"
+
+
+def route(prompt, results=None, override=None):
+    """
+    Pick the model for one turn. Returns the decision dict that
+    log_outcome() later completes: {"model_name", "tier", "reason",
+    "features", "overridden", "route_ms", ...}.
+    """
+    start = time.perf_counter()
+    features = prompt_features(prompt, results)
+    if override:
+        tier, reason = override, "override"
+    else:
+        tier, reason = choose_tier(features)
+    model_name = ROUTER_TIERS[tier]
+    return {
+        "time": time.time(),
+        "model_name": model_name,
+        "model": MODELS[model_name],
+        "tier": tier,
+        "reason": reason,
+        "overridden": bool(override),
+        "features": features,
+        "route_ms": 1000 * (time.perf_counter() - start),
+    }
+
+
+# ============================================================
+#   DECISION LOG
+# ============================================================
+
+def log_outcome(decision, first_token_s=None, total_s=None, chars=0, outcome="ok"):
+    """Append the decision plus how the reply went to ROUTER_LOG."""
+    entry = dict(decision, first_token_s=first_token_s, total_s=total_s,
+                 chars=chars, outcome=outcome)
+    log.info("%s -> %s (%s), first text %.2fs, total %.2fs, %s",
+             decision["tier"], decision["model"], decision["reason"],
+             first_token_s if first_token_s is not None else float("nan"),
+             total_s if total_s is not None else float("nan"), outcome)
+    try:
+        with _log_lock:
+            ROUTER_LOG.parent.mkdir(parents=True, exist_ok=True)
+            with ROUTER_LOG.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        log.warning("Could not write router log: %s", e)
+
+
+def read_log(path=ROUTER_LOG):
+    if not Path(path).exists():
+        return []
+    entries = []
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def summarize_log(path=ROUTER_LOG):
+    """Per-tier turn counts, overrides, stops / errors and p50 / p95 latency of completed replies."""
+    tiers = {}
+    for e in read_log(path):
+        t = tiers.setdefault(e["tier"], {"turns": 0, "overridden": 0, "stopped": 0, "errors": 0,
+                                         "totals": []})
+        t["turns"] += 1
+        t["overridden"] += bool(e.get("overridden"))
+        t["stopped"] += e.get("outcome") == "stopped"
+        t["errors"] += e.get("outcome") == "error"
+        if e.get("outcome") == "ok" and e.get("total_s") is not None:
+            t["totals"].append(e["total_s"])
+
+    print(f"{'tier':<10} {'turns':>6} {'override':>9} {'stopped':>8} {'errors':>7} {'p50 s':>7} {'p95 s':>7}")
+    for tier, t in sorted(tiers.items()):
+        s = sorted(t["totals"])
+        p50 = s[len(s) // 2] if s else float("nan")
+        p95 = s[max(0, math.ceil(0.95 * len(s)) - 1)] if s else float("nan")
+        print(f"{tier:<10} {t['turns']:>6} {t['overridden']:>9} {t['stopped']:>8} {t['errors']:>7} "
+              f"{p50:>7.2f} {p95:>7.2f}")
+    return tiers
+
+
+if __name__ == "__main__":
+    # python -m llm.router            -> summary of the decision log
+    # python -m llm.router "prompt"   -> show the decision for a prompt
+    if len(sys.argv) > 1:
+        text, forced = split_override(" ".join(sys.argv[1:]))
+        d = route(text, override=forced)
+        print(f"{d['tier']} -> {d['model_name']} ({d['reason']}, {d['route_ms']:.2f} ms)")
+        print(d["features"])
+    else:
+        summarize_log()
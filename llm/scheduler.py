@@ -0,0 +1,187 @@
+import math
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+from llm.models import SCHEDULER_MAX_CONCURRENT, MODEL_MAX_CONCURRENT, DEFAULT_MODEL_CONCURRENT
+
+# Priorities, lower runs first
+INTERACTIVE = 0
+SUMMARIZATION = 1
+INDEXING = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", SUMMARIZATION: "summarization", INDEXING: "indexing"}
+
+# Wait times kept per priority for the stats
+_WAIT_SAMPLES = 200
+
+
+# ============================================================
+#   SCHEDULER
+# ============================================================
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "model", "priority", "label", "future",
+                 "submitted", "started")
+
+    def __init__(self, fn, args, kwargs, model, priority, label):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.model = model
+        self.priority = priority
+        self.label = label
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        self.started = None
+
+
+class Scheduler:
+    """
+    Every model call goes through here.
+
+    Jobs wait in one priority queue (interactive > summarization >
+    indexing, FIFO within a priority) and start on their own thread as soon
+    as both the global cap and their model's cap have room. A job whose
+    model is full doesn't block lower-priority jobs for other models.
+    submit() returns a Future; position() tells a caller where it is in
+    the queue.
+    """
+
+    def __init__(self, max_concurrent=SCHEDULER_MAX_CONCURRENT, model_limits=None,
+                 default_model_limit=DEFAULT_MODEL_CONCURRENT):
+        self.max_concurrent = max_concurrent
+        self.model_limits = dict(MODEL_MAX_CONCURRENT if model_limits is None else model_limits)
+        self.default_model_limit = default_model_limit
+        self._queue = []            # heap of (priority, seq, job)
+        self._seq = itertools.count()
+        self._running = {}          # model -> count
+        self._running_total = 0
+        self._jobs = {}             # future -> job, while queued
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.max_depth = 0
+        self._waits = {p: [] for p in PRIORITY_NAMES}
+
+    def _limit(self, model):
+        return self.model_limits.get(model, self.default_model_limit)
+
+    def submit(self, fn, *args, model=None, priority=INTERACTIVE, label=None, cancel=None, **kwargs):
+        """
+        Queue fn(*args, **kwargs) as a call to 'model'. Returns a Future.
+        Cancelling 'cancel' while the job is still queued cancels the Future
+        and takes it out of the queue (a running job stops via the token itself).
+        """
+        job = _Job(fn, args, kwargs, model, priority, label or getattr(fn, "__name__", "job"))
+        with self._lock:
+            heapq.heappush(self._queue, (priority, next(self._seq), job))
+            self._jobs[job.future] = job
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, len(self._queue))
+        if cancel is not None:
+            cancel.on_cancel(lambda: self._cancel_queued(job.future))
+        self._dispatch()
+        return job.future
+
+    def run(self, fn, *args, model=None, priority=INTERACTIVE, label=None, cancel=None, **kwargs):
+        """submit() and wait for the result."""
+        return self.submit(fn, *args, model=model, priority=priority, label=label,
+                           cancel=cancel, **kwargs).result()
+
+    def _cancel_queued(self, future):
+        if future.cancel():
+            with self._lock:
+                self.cancelled += 1
+            self._dispatch()  # drops it from the queue
+
+    def _dispatch(self):
+        """Start every queued job that fits the caps, best priority first."""
+        to_start = []
+        with self._lock:
+            skipped = []
+            self._queue = [item for item in self._queue if not item[2].future.cancelled()]
+            heapq.heapify(self._queue)
+            for future in [f for f in self._jobs if f.cancelled()]:
+                del self._jobs[future]
+            while self._queue and self._running_total < self.max_concurrent:
+                item = heapq.heappop(self._queue)
+                job = item[2]
+                if self._running.get(job.model, 0) >= self._limit(job.model):
+                    skipped.append(item)
+                    continue
+                self._running[job.model] = self._running.get(job.model, 0) + 1
+                self._running_total += 1
+                self._jobs.pop(job.future, None)
+                job.started = time.perf_counter()
+                waits = self._waits[job.priority]
+                waits.append(job.started - job.submitted)
+                del waits[:-_WAIT_SAMPLES]
+                to_start.append(job)
+            for item in skipped:
+                heapq.heappush(self._queue, item)
+
+        for job in to_start:
+            threading.Thread(target=self._run_job, args=(job,), daemon=True,
+                             name=f"sched-{job.label}").start()
+
+    def _run_job(self, job):
+        try:
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    job.future.set_result(job.fn(*job.args, **job.kwargs))
+                except BaseException as e:
+                    job.future.set_exception(e)
+        finally:
+            with self._lock:
+                self._running[job.model] -= 1
+                self._running_total -= 1
+                self.completed += 1
+            self._dispatch()
+
+    def position(self, future):
+        """0-based place in the queue (0 = next to start), or None once started."""
+        with self._lock:
+            job = self._jobs.get(future)
+            if job is None:
+                return None
+            key = (job.priority, job.submitted)
+            return sum(1 for p, _, j in self._queue
+                       if j is not job and (p, j.submitted) < key and not j.future.cancelled())
+
+    def stats(self):
+        with self._lock:
+            waits = {}
+            for p, samples in self._waits.items():
+                s = sorted(samples)
+                waits[PRIORITY_NAMES[p]] = {
+                    "count": len(s),
+                    "avg_ms": 1000 * sum(s) / len(s) if s else 0.0,
+                    "p95_ms": 1000 * s[max(0, math.ceil(0.95 * len(s)) - 1)] if s else 0.0,
+                }
+            return {
+                "queued": len(self._queue),
+                "max_queued": self.max_depth,
+                "running": self._running_total,
+                "running_by_model": {m: n for m, n in self._running.items() if n},
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "wait": waits,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Process-wide scheduler shared by the GUI, summarizer and indexer."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+        return _scheduler
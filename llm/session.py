@@ -0,0 +1,90 @@
+import threading
+
+from llm.prompt_builder import messages_to_prompt
+from llm.context_packer import estimate_tokens
+
+
+# ============================================================
+#   PER-MODEL PROMPT PREFIX
+# ============================================================
+
+class ModelSession:
+    """
+    Prompt-prefix reuse for one model's turns.
+
+    Every turn sends the full chat to /api/chat. build_messages_for_model
+    puts the loaded history and the conversation first and the retrieved
+    context last, so consecutive turns share everything up to the previous
+    user message, and the server (which keeps the KV cache of a loaded
+    model's last prompt) only prefills what follows. A summary, clear or
+    load rewrites the history: the shared prefix shrinks and the server
+    prefills from where the prompts differ. The model always sees exactly
+    the current prompt, nothing from earlier turns is carried along.
+
+    The prefill avoided is the estimated size of the whole prompt minus
+    what the server reports it prefilled (prompt_eval_count).
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.turns = 0
+        self.prefix_turns = 0     # turns that shared a prefix with the one before
+        self.shared = 0           # messages shared with the previous request
+        self.prompt_tokens = 0    # estimated size of every prompt sent
+        self.prefilled = 0        # what the server reported prefilling
+        self.prefill_avoided = 0  # tokens, summed over turns
+        self.last_avoided = 0
+        self._last = []
+        self._pending_tokens = 0
+
+    def request(self, messages):
+        """Note this turn's messages (sent as they are, all of them)."""
+        shared = 0
+        for old, new in zip(self._last, messages):
+            if old is not new and old != new:
+                break
+            shared += 1
+        self.turns += 1
+        self.prefix_turns += shared > 0
+        self.shared = shared
+        self._last = list(messages)
+        self._pending_tokens = estimate_tokens(messages_to_prompt(messages))
+        return messages
+
+    def update(self, result):
+        """Count what the server's prompt_eval_count says this turn saved."""
+        if not result:
+            self.invalidate()
+            return
+        prefilled = result.get("prompt_eval_count", 0)
+        self.last_avoided = max(0, self._pending_tokens - prefilled)
+        self.prompt_tokens += self._pending_tokens
+        self.prefilled += prefilled
+        self.prefill_avoided += self.last_avoided
+
+    def invalidate(self):
+        """A turn failed or was cancelled: don't count on the server's cache."""
+        self._last = []
+        self.last_avoided = 0
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "turns": self.turns,
+            "prefix_turns": self.prefix_turns,
+            "prompt_tokens": self.prompt_tokens,
+            "prefilled_tokens": self.prefilled,
+            "prefill_tokens_avoided": self.prefill_avoided,
+        }
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(model):
+    """One session per model name, created on first use."""
+    with _sessions_lock:
+        if model not in _sessions:
+            _sessions[model] = ModelSession(model)
+        return _sessions[model]
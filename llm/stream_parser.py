@@ -0,0 +1,126 @@
+"""
+Incremental ``` fence parser for streamed model replies.
+
+feed() takes text as it arrives (any chunk size, lines may be split
+anywhere) and returns events in the order they should be shown:
+
+    ("text", s)         plain assistant text
+    ("code_start", lang) an opening fence was seen
+    ("code", s)         code inside the current block
+    ("code_end", code)  the block closed, with its full code for highlighting
+
+Fence lines themselves are never emitted. A line is held back only while
+it could still turn out to be a fence, so ordinary text shows up as soon
+as it is streamed.
+"""
+
+FENCE = "```"
+
+
+class FenceParser:
+
+    def __init__(self):
+        self.in_code = False
+        self._line = ""           # start of the current line, held back
+        self._committed = False   # current line already known not to be a fence
+        self._code = []
+        self._newline_pending = False
+        self._last_text = "\n"
+        self._events = []
+
+    # ------------------------------------------------------------
+    #   public
+    # ------------------------------------------------------------
+    def feed(self, text):
+        pos = 0
+        while pos < len(text):
+            nl = text.find("\n", pos)
+            if nl == -1:
+                self._partial(text[pos:])
+                break
+            self._partial(text[pos:nl])
+            self._end_line()
+            pos = nl + 1
+        return self._take()
+
+    def finish(self):
+        """Flush what's left at the end of the stream (closes an open block)."""
+        if self._line:
+            if self._line.lstrip().startswith(FENCE):
+                self._end_line()
+            else:
+                self._emit(self._line)
+                self._line = ""
+        if self.in_code:
+            self.in_code = False
+            self._events.append(("code_end", "".join(self._code)))
+        elif not self._last_text.endswith("\n"):
+            self._emit("\n")
+        return self._take()
+
+    # ------------------------------------------------------------
+    #   line handling
+    # ------------------------------------------------------------
+    def _could_be_fence(self):
+        stripped = self._line.lstrip()
+        return stripped.startswith(FENCE) or FENCE.startswith(stripped)
+
+    def _partial(self, s):
+        if self._committed:
+            self._emit(s)
+            return
+        self._line += s
+        if not self._could_be_fence():
+            self._committed = True
+            self._emit(self._line)
+            self._line = ""
+
+    def _end_line(self):
+        if not self._committed and self._line.lstrip().startswith(FENCE):
+            if self.in_code:
+                self.in_code = False
+                self._events.append(("code_end", "".join(self._code)))
+            else:
+                self.in_code = True
+                self._code = []
+                self._newline_pending = False
+                self._events.append(("code_start", self._line.lstrip()[len(FENCE):].strip()))
+        else:
+            if not self._committed:
+                self._emit(self._line)
+            if self.in_code:
+                # the newline before a closing fence is not part of the code
+                if self._newline_pending:
+                    self._emit_code("\n")
+                self._newline_pending = True
+            else:
+                self._emit("\n")
+        self._line = ""
+        self._committed = False
+
+    def _emit(self, s):
+        if not s:
+            return
+        if self.in_code:
+            if self._newline_pending:
+                self._newline_pending = False
+                self._emit_code("\n")
+            self._emit_code(s)
+        else:
+            self._events.append(("text", s))
+            self._last_text = s
+
+    def _emit_code(self, s):
+        self._code.append(s)
+        self._events.append(("code", s))
+
+    def _take(self):
+        """Return the queued events, merging runs of text / code."""
+        merged = []
+        for kind, value in self._events:
+            if merged and kind in ("text", "code") and merged[-1][0] == kind:
+                merged[-1] = (kind, merged[-1][1] + value)
+            else:
+                merged.append((kind, value))
+        self._events = []
+        return merged
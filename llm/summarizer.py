@@ -1,25 +1,41 @@
-import subprocess
 import threading
-from memory.conversation import conversation_messages
-from llm.models import MODELS
+import subprocess
+from concurrent.futures import CancelledError
+from memory.conversation import conversation_messages, history_rewritten, history_generation
+from llm.models import MODELS, GENERATE_BACKEND, SUMMARY_DEADLINE
+from llm.cancellation import Cancelled, new_token, release
+from llm.ollama_client import get_client
+from llm.scheduler import get_scheduler, SUMMARIZATION
+from llm.history_budget import plan_budget, select_over_budget
 
-# Global lock: prevents multiple parallel summarizations
+# Code is summarized from its first lines only
+SUMMARY_CODE_LINES = 30
+
+# Global lock: one background summary queued / running at a time
 _is_summarizing = False
 
+# Held while choosing messages and while applying a summary, never while the model runs
+_summary_lock = threading.Lock()
+
+# One synchronous (pre-prompt) summary at a time
+_sync_lock = threading.Lock()
+
 
 # ---------------------------
 #   Summarization helper
 # ---------------------------
-def summarize_messages(messages, summarizer_model):
+def summarize_messages(messages, summarizer_model, scheduled=True):
     """
     Summarize a list of message dicts into short bullet points.
     Returns summary text, always non-empty.
+    scheduled=False calls the model directly (caller already holds a scheduler slot).
+    Raises Cancelled when stopped or past SUMMARY_DEADLINE, so nothing is applied.
     """
     if not messages:
         return "Summary: (no content)"
 
     joined = "\n\n".join(
-        f"{m['role'].capitalize()}: {m['content']}" for m in messages
+        f"{m['role'].capitalize()}: {_summary_input(m)}" for m in messages
     )
 
     prompt = (
@@ -30,25 +46,74 @@ def summarize_messages(messages, summarizer_model):
         "\n\nSummary:"
     )
 
+    token = new_token(SUMMARY_DEADLINE, label="summary")
     try:
-        result = subprocess.run(
-            ["ollama", "run", summarizer_model, prompt],
-            capture_output=True, text=True, check=True
-        )
-        text = result.stdout.strip()
+        if scheduled:
+            text = get_scheduler().run(_generate_summary, prompt, summarizer_model, token,
+                                       model=summarizer_model, priority=SUMMARIZATION,
+                                       label="summary", cancel=token)
+        else:
+            text = _generate_summary(prompt, summarizer_model, token)
         return text or "Summary: (empty result)"
+    except (Cancelled, CancelledError):
+        raise Cancelled(token.reason)
     except Exception:
         return "Summary: (error generating summary)"
+    finally:
+        release(token)
+
+
+def _summary_input(m):
+    """Message text for the summarizer; long code is cut to its first lines."""
+    if not m["is_code"]:
+        return m["content"]
+    lines = m["content"].splitlines()
+    if len(lines) <= SUMMARY_CODE_LINES:
+        return m["content"]
+    return "\n".join(lines[:SUMMARY_CODE_LINES]) + f"\n... ({len(lines) - SUMMARY_CODE_LINES} more lines of code)"
+
+
+def _generate_summary(prompt, summarizer_model, cancel=None):
+    if GENERATE_BACKEND == "http":
+        result = get_client().chat([{"role": "user", "content": prompt}], summarizer_model,
+                                   cancel=cancel)
+        return result["text"].strip()
+    proc = subprocess.Popen(
+        ["ollama", "run", summarizer_model, prompt],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    remove = cancel.on_cancel(proc.kill) if cancel is not None else None
+    try:
+        out, err = proc.communicate()
+    finally:
+        if remove is not None:
+            remove()
+    if cancel is not None:
+        cancel.check()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, out, err)
+    return out.strip()
 
 
 # ---------------------------
 #   Core trimming logic
 # ---------------------------
-def _select_messages_to_summarize(max_messages):
+def _select_messages_to_summarize(max_messages, model_name=None):
     """
-    Determine which messages should be summarized (oldest non-code messages).
-    Returns a list of indices.
+    Determine which messages should be summarized. Returns a list of indices.
+    - with model_name: the oldest messages (code included) until the
+      conversation fits that model's token budget
+    - plus, past max_messages, the oldest non-code messages
     """
+    by_budget = _select_by_budget(model_name) if model_name is not None else []
+    return sorted(set(by_budget) | set(_select_by_count(max_messages)))
+
+
+def _select_by_budget(model_name):
+    return select_over_budget(plan_budget(model_name)["conversation"])
+
+
+def _select_by_count(max_messages):
     if len(conversation_messages) <= max_messages:
         return []
 
@@ -83,60 +148,94 @@ def _apply_summary(indices, summary_text):
     # Insert summary at earliest removed position
     first = min(indices)
     conversation_messages.insert(first, summary_msg)
+    history_rewritten()
+
+
+def _summarize_selected(select, summarizer_model, scheduled=True, generation=None):
+    """
+    Summarize the messages select() picks (indices) and apply the summary.
+    The selection is made here, not when the work was queued, and nothing
+    is applied if the history was rewritten (clear, load, another summary)
+    since 'generation' or while the summary was generated.
+    Returns True if the summary was applied.
+    """
+    with _summary_lock:
+        if generation is not None and generation != history_generation():
+            return False
+        indices = select()
+        if not indices:
+            return False
+        generation = history_generation()
+        msgs = [conversation_messages[i] for i in indices]
+
+    summary = summarize_messages(msgs, summarizer_model, scheduled=scheduled)
+
+    with _summary_lock:
+        if generation != history_generation() or any(
+                i >= len(conversation_messages) or conversation_messages[i] is not m
+                for i, m in zip(indices, msgs)):
+            print("History changed while summarizing; summary dropped")
+            return False
+        _apply_summary(indices, summary)
+    return True
 
 
 # ---------------------------
 #   Public API
 # ---------------------------
-def trim_and_summarize_if_needed(max_messages, summarizer_model, output_text=None, auto=True):
+def trim_and_summarize_if_needed(max_messages, summarizer_model, output_text=None, auto=True,
+                                 model_name=None, on_done=None):
     """
-    Reduce the length of conversation_messages by summarizing old non-code messages.
+    Reduce the length of conversation_messages by summarizing old messages.
     - max_messages: number of recent messages to keep unsummarized
     - summarizer_model: the ollama model name to call
     - output_text: UI widget (or None for CLI mode)
-    - auto: if True, summarization occurs in background; if False, synchronous
+    - auto: if True, the messages past max_messages are summarized in the
+      background; if False, synchronous
+    - model_name: MODELS entry the prompt is for. What is over its token
+      budget (see llm/history_budget.py) is always summarized synchronously,
+      auto or not: this turn's prompt has to fit.
+    - on_done: called (from the worker thread) once a background summary
+      was applied, e.g. to report it in the UI through root.after
+    Returns True when a synchronous summary was applied.
     """
     global _is_summarizing
 
-    if _is_summarizing:
-        return
-
-    indices = _select_messages_to_summarize(max_messages)
-    if not indices:
-        return
-
     # Synchronous path (executor call before sending prompt to model)
     if not auto:
-        _is_summarizing = True
-        try:
-            msgs = [conversation_messages[i] for i in indices]
-            summary = summarize_messages(msgs, summarizer_model)
-            _apply_summary(indices, summary)
-        finally:
-            _is_summarizing = False
-
-        # UI log
-        if output_text is not None:
-            try:
-                output_text.insert("end", "[Synchronous summarization completed]\n")
-                output_text.see("end")
-            except Exception:
-                pass
-
-        return
+        applied = _summarize_now(lambda: _select_messages_to_summarize(max_messages, model_name),
+                                 summarizer_model, output_text)
+    elif model_name is not None:
+        applied = _summarize_now(lambda: _select_by_budget(model_name), summarizer_model, output_text)
+    else:
+        applied = None
+    if not auto:
+        return applied
 
     # ---------------------------
     # Asynchronous background path
     # ---------------------------
-    def _thread():
-        global _is_summarizing
-        _is_summarizing = True
+    if _is_summarizing or not _select_by_count(max_messages):
+        return applied
 
-        msgs = [conversation_messages[i] for i in indices]
-        summary = summarize_messages(msgs, summarizer_model)
-        _apply_summary(indices, summary)
+    # the job may wait behind interactive calls: it selects again when it
+    # runs and gives up if the history was cleared / loaded meanwhile
+    generation = history_generation()
 
-        _is_summarizing = False
+    def _job():
+        global _is_summarizing
+        try:
+            done = _summarize_selected(lambda: _select_by_count(max_messages), summarizer_model,
+                                       scheduled=False, generation=generation)
+        except Cancelled as e:
+            print(f"Automatic summarization {e}; history left as is")
+            return
+        finally:
+            _is_summarizing = False
+        if not done:
+            return
+        if on_done is not None:
+            on_done()
 
         # UI log
         if output_text is not None:
@@ -146,7 +245,30 @@ def trim_and_summarize_if_needed(max_messages, summarizer_model, output_text=Non
             except Exception:
                 pass
 
-    t = threading.Thread(target=_thread, daemon=True)
-    t.start()
+    # queued behind interactive requests instead of a thread of its own
+    _is_summarizing = True
+    get_scheduler().submit(_job, model=summarizer_model, priority=SUMMARIZATION, label="auto-summary")
+    return applied
 
 
+def _summarize_now(select, summarizer_model, output_text=None):
+    """Summarize what select() picks before the prompt is built. True if applied."""
+    with _sync_lock:
+        try:
+            # a background summary applied meanwhile drops the first try: select again
+            applied = (_summarize_selected(select, summarizer_model)
+                       or _summarize_selected(select, summarizer_model))
+        except Cancelled as e:
+            print(f"Summarization {e}; history left as is")
+            return None
+    if not applied:
+        return None
+
+    # UI log
+    if output_text is not None:
+        try:
+            output_text.insert("end", "[Synchronous summarization completed]\n")
+            output_text.see("end")
+        except Exception:
+            pass
+    return True
@@ -1,15 +1,25 @@
 import re
-from tkinter import messagebox
-import tkinter as tk
 
 conversation_messages = []
 loaded_history = ""
 
+# Bumped whenever earlier history is rewritten (summary, clear, load) so a
+# model context cached on the old history is not reused
+_history_generation = 0
+
+def history_rewritten():
+    global _history_generation
+    _history_generation += 1
+
+def history_generation() -> int:
+    return _history_generation
+
 def clear_conversation():
     ''' clear all conversation data.'''
     global conversation_messages, loaded_history
     conversation_messages.clear()
     loaded_history = ""
+    history_rewritten()
 
 
 def detect_code_block(text: str) -> bool:
@@ -35,5 +45,6 @@ def clear_conversation_data():
     global conversation_messages, loaded_history
     conversation_messages.clear()
     loaded_history = ""
+    history_rewritten()
 
 
@@ -48,6 +48,7 @@ def load_conversation(output_text):
 
         # Merge messages
         mem.conversation_messages.extend(loaded_msgs)
+        mem.history_rewritten()
 
         output_text.insert(
             "end",
@@ -0,0 +1,19 @@
+import pytest
+
+from llm.ollama_stub import start_stub_server
+
+
+@pytest.fixture
+def stub():
+    """Factory for stub Ollama servers: stub(**options) -> (server, base_url)."""
+    servers = []
+
+    def _start(**options):
+        server, url = start_stub_server(**options)
+        servers.append(server)
+        return server, url
+
+    yield _start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,36 @@
+import os
+
+from tools.rag import bm25_index
+from tools.rag.bm25_index import BM25Index
+
+
+def _bump_mtime(path, seconds):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + int(seconds * 1e9)))
+
+
+def test_queries_only_rescan_when_the_folder_changes(tmp_path, monkeypatch):
+    folder = tmp_path / "kb"
+    folder.mkdir()
+    (folder / "lighthouse.txt").write_text("the lighthouse keeper watched the sea")
+    index = BM25Index(str(folder), index_path=str(tmp_path / "bm25.json"))
+
+    scans = []
+    listdir = os.listdir
+    monkeypatch.setattr(bm25_index.os, "listdir", lambda p: scans.append(p) or listdir(p))
+
+    assert [f for _, f in index.search("lighthouse")] == ["lighthouse.txt"]
+    assert [f for _, f in index.search("keeper")] == ["lighthouse.txt"]
+    assert len(scans) == 1
+
+    (folder / "harbour.txt").write_text("boats in the harbour")
+    _bump_mtime(folder, 1)
+    assert [f for _, f in index.search("harbour")] == ["harbour.txt"]
+    assert len(scans) == 2
+
+    # an in-place edit doesn't move the folder mtime: picked up by the periodic rescan
+    (folder / "harbour.txt").write_text("ships in the harbour")
+    _bump_mtime(folder / "harbour.txt", 1)
+    monkeypatch.setattr(bm25_index, "FULL_RESCAN_INTERVAL", 0.0)
+    assert [f for _, f in index.search("ships")] == ["harbour.txt"]
+    assert len(scans) == 3
@@ -0,0 +1,123 @@
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from llm.cancellation import CancelToken, Cancelled
+from llm.ollama_client import OllamaClient
+from llm.scheduler import Scheduler
+
+MODEL = "mistral:7b"
+MESSAGES = [{"role": "user", "content": "Write a long story about a lighthouse keeper and the sea."}]
+
+# Cancel latency bounds: generous for a loaded CI box, far below one 0.5 s token
+RETURN_BOUND = 0.15
+SLOT_BOUND = 0.25
+
+
+def _consume(client, token, chunks):
+    for chunk in client.chat(MESSAGES, MODEL, stream=True, cancel=token):
+        chunks.append(chunk)
+
+
+def test_cancel_mid_stream_returns_and_frees_the_slot(stub):
+    server, url = stub(token_delay=0.5)
+    client = OllamaClient(url)
+    scheduler = Scheduler(max_concurrent=1)
+    token = CancelToken()
+    chunks = []
+
+    future = scheduler.submit(_consume, client, token, chunks, model=MODEL, cancel=token)
+    deadline = time.perf_counter() + 5
+    while not chunks and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert chunks, "stub never streamed a token"
+
+    token.cancel()
+    with pytest.raises(Cancelled):
+        future.result(timeout=2)
+    returned = time.perf_counter() - token.cancelled_at
+    started = scheduler.run(time.perf_counter, model=MODEL)
+    freed = started - token.cancelled_at
+
+    assert returned < RETURN_BOUND
+    assert freed < SLOT_BOUND
+    assert scheduler.stats()["running"] == 0
+
+
+def test_cancel_before_the_first_token(stub):
+    # the server is still "prefilling" (no headers yet) when Stop is pressed
+    server, url = stub(delay=2.0)
+    client = OllamaClient(url)
+    token = CancelToken()
+    start = time.perf_counter()
+
+    scheduler = Scheduler(max_concurrent=1)
+    future = scheduler.submit(_consume, client, token, [], model=MODEL, cancel=token)
+    time.sleep(0.2)
+    token.cancel()
+    with pytest.raises(Cancelled):
+        future.result(timeout=2)
+
+    assert time.perf_counter() - token.cancelled_at < RETURN_BOUND
+    assert time.perf_counter() - start < 1.0
+
+
+def test_cancel_while_queued_never_runs_the_job():
+    scheduler = Scheduler(max_concurrent=1)
+    blocker = CancelToken()
+    scheduler.submit(blocker.wait, 5, model=MODEL)
+    token = CancelToken()
+    ran = []
+
+    future = scheduler.submit(ran.append, True, model=MODEL, cancel=token)
+    assert scheduler.position(future) == 0
+    token.cancel()
+
+    with pytest.raises(CancelledError):
+        future.result(timeout=1)
+    blocker.cancel()
+    scheduler.run(time.perf_counter, model=MODEL)
+    assert ran == [] and scheduler.stats()["cancelled"] == 1
+
+
+def test_deadline_cancels_the_stream(stub):
+    server, url = stub(token_delay=0.5)
+    client = OllamaClient(url)
+    token = CancelToken(deadline=0.3)
+    chunks = []
+
+    with pytest.raises(Cancelled):
+        _consume(client, token, chunks)
+    assert token.reason == "deadline"
+    assert time.perf_counter() - token.cancelled_at < RETURN_BOUND
+
+
+class _Renderer:
+    start = time.perf_counter()
+    first_chunk_seconds = None
+    frames = 0
+
+
+class _Output:
+    def insert(self, *args):
+        pass
+
+    def see(self, *args):
+        pass
+
+
+@pytest.mark.parametrize("reply, saved", [
+    ("Once upon a time\n[stopped]", ["Once upon a time"]),
+    ("Once upon a time\n[timed out]", ["Once upon a time"]),
+    ("[stopped]", []),
+    ("[timed out]", []),
+    ("A full reply.", ["A full reply."]),
+])
+def test_stopped_replies_are_saved_without_the_marker(monkeypatch, reply, saved):
+    import llm.executor as executor
+    appended = []
+    monkeypatch.setattr(executor, "append_message", lambda role, text: appended.append(text))
+
+    executor.finish_model_reply(_Output(), reply, _Renderer())
+    assert appended == saved
@@ -0,0 +1,57 @@
+from knowledge_base.code.chunker import python_spans, chunk_file
+
+SOURCE = '''import os
+
+
+def foo():
+    return 1
+
+# comment for bar
+def bar():
+    return 2
+
+
+class K:
+    """doc"""
+
+    # about m1
+    @staticmethod
+    def m1():
+        pass
+
+    def m2(self):
+        pass
+'''
+
+
+def _chunks(text, max_chars):
+    return [text[s:e] for s, e in python_spans(text, max_chars)]
+
+
+def test_spans_cover_the_file_in_order():
+    spans = python_spans(SOURCE, 80)
+    assert spans[0][0] == 0 and spans[-1][1] == len(SOURCE)
+    assert all(a[1] == b[0] for a, b in zip(spans, spans[1:]))
+
+
+def test_comments_stay_with_the_definition_below():
+    for max_chars in (40, 80):
+        chunks = _chunks(SOURCE, max_chars)
+        bar = next(c for c in chunks if "def bar" in c)
+        assert "# comment for bar" in bar
+        assert sum("comment for bar" in c for c in chunks) == 1
+
+
+def test_big_class_splits_on_methods_with_their_comments_and_decorators():
+    chunks = _chunks(SOURCE, 80)
+    m1 = next(c for c in chunks if "def m1" in c)
+    assert "# about m1" in m1 and "@staticmethod" in m1
+    assert "def m2" not in m1
+
+
+def test_whole_file_fits_in_one_chunk():
+    assert chunk_file("x.py", SOURCE) == [SOURCE]
+
+
+def test_comment_only_file():
+    assert _chunks("# only\n# comments\n", 100) == ["# only\n# comments\n"]
@@ -0,0 +1,57 @@
+from llm.context_packer import (
+    merge_neighbours, drop_near_duplicates, drop_seen_in_conversation, pack_context,
+    estimate_tokens,
+)
+
+SHARED = "def helper(value):\n    return value * 2\n"
+
+
+def _hit(n, text, score, **extra):
+    return dict({"id": f"a.py:{n}", "file": "a.py", "text": text, "score": score}, **extra)
+
+
+def test_spanless_hits_merge_in_chunk_order_not_string_order():
+    # "a.py:10" sorts before "a.py:2" as a string; chunk 2 comes first in the file
+    first = _hit(2, "header line\n" + SHARED, 0.5)
+    second = _hit(10, SHARED + "tail line\n", 0.9)
+
+    merged = merge_neighbours([second, first])
+    assert len(merged) == 1
+    assert merged[0]["text"] == "header line\n" + SHARED + "tail line\n"
+    assert merged[0]["score"] == 0.9
+
+
+def test_hits_merge_by_span_and_keep_best_score_order():
+    hits = [
+        _hit(1, "bbbb", 0.7, start=4, end=8),
+        _hit(0, "aaaa", 0.6, start=0, end=4),
+        _hit(5, "zzzz", 0.8, start=40, end=44),
+        {"id": "b.py:0", "file": "b.py", "text": "other", "score": 0.95, "start": 0, "end": 5},
+    ]
+    merged = merge_neighbours(hits)
+    assert [(r["file"], r.get("start"), r["text"]) for r in merged] == [
+        ("b.py", 0, "other"),
+        ("a.py", 40, "zzzz"),
+        ("a.py", 0, "aaaabbbb"),
+    ]
+
+
+def test_near_duplicates_and_chat_content_are_dropped():
+    hits = [
+        {"text": "x", "embedding": [1.0, 0.0]},
+        {"text": "y", "embedding": [0.99, 0.01]},
+        {"text": "z", "embedding": [0.0, 1.0]},
+    ]
+    assert [r["text"] for r in drop_near_duplicates(hits)] == ["x", "z"]
+
+    seen = [{"role": "user", "content": SHARED}]
+    kept = drop_seen_in_conversation([_hit(0, SHARED, 0.9), _hit(1, "new code", 0.8)], seen)
+    assert [r["text"] for r in kept] == ["new code"]
+
+
+def test_pack_context_stays_within_the_budget():
+    hits = [_hit(i * 10, f"line {i}\n" * 200, 1.0 - i / 10, start=i * 10_000, end=i * 10_000 + 1400)
+            for i in range(5)]
+    context, stats = pack_context(hits, budget=500)
+    assert estimate_tokens(context) <= 500
+    assert stats["used"] >= 1 and stats["tokens_saved"] > 0
@@ -0,0 +1,48 @@
+import json
+
+from knowledge_base.code import indexer
+from knowledge_base.code.embedding_store import EmbeddingStore, store_paths
+
+
+def _setup(tmp_path, monkeypatch, fail_marker):
+    project = tmp_path / "proj"
+    project.mkdir()
+    base = tmp_path / "embeddings" / "index"
+    base.parent.mkdir()
+    monkeypatch.setattr(indexer, "PROJECT_ROOT", project)
+    monkeypatch.setattr(indexer, "INDEX_PATH", base)
+
+    def embed_texts(texts):
+        return [None if fail_marker in t else [1.0, float(len(t))] for t in texts]
+
+    monkeypatch.setattr(indexer, "embed_texts", embed_texts)
+    return project, base
+
+
+def _files_in_store(base):
+    with EmbeddingStore(base) as store:
+        return sorted({c["file"] for c in store.chunks})
+
+
+def test_partly_embedded_file_is_retried_and_its_chunks_deleted_with_it(tmp_path, monkeypatch):
+    project, base = _setup(tmp_path, monkeypatch, fail_marker="BROKEN")
+    (project / "good.py").write_text("def good():\n    return 1\n")
+    # two functions too big to share a chunk: the first embeds, the second fails
+    body = "    x = 1\n" * 150
+    (project / "half.py").write_text(f"def ok():\n{body}\n\ndef bad():\n{body}    return 'BROKEN'\n")
+
+    indexer.index_files(workers=1)
+    manifest = json.loads(store_paths(base)["manifest"].read_text())
+    half = str(project / "half.py")
+    assert manifest[half]["partial"] is True
+    assert _files_in_store(base) == [str(project / "good.py"), half]
+
+    # the next run retries it (the store keeps one copy of its chunks)
+    indexer.index_files(workers=1)
+    with EmbeddingStore(base) as store:
+        assert sum(c["file"] == half for c in store.chunks) == manifest[half]["chunks"]
+
+    (project / "half.py").unlink()
+    indexer.index_files(workers=1)
+    assert _files_in_store(base) == [str(project / "good.py")]
+    assert half not in json.loads(store_paths(base)["manifest"].read_text())
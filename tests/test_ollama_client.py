@@ -0,0 +1,152 @@
+import time
+
+import pytest
+
+from llm.ollama_client import OllamaClient, OllamaError, GenerationStream
+from llm.ollama_stub import fake_embedding, fake_reply
+
+
+# ============================================================
+#   RETRIES / BACK-OFF
+# ============================================================
+
+def test_retries_until_the_server_recovers(stub):
+    server, url = stub(fail_first=2)
+    client = OllamaClient(url, retries=3, backoff=0.05)
+
+    start = time.perf_counter()
+    vectors = client.embed(["hello"], "embed-model")
+    elapsed = time.perf_counter() - start
+
+    assert vectors == [fake_embedding("hello")]
+    assert server.request_count == 3
+    assert client.stats()["retries"] == 2
+    # exponential back-off: 0.05 s then 0.1 s before the third attempt
+    assert elapsed >= 0.15
+
+
+def test_gives_up_after_all_retries(stub):
+    server, url = stub(fail_first=10)
+    client = OllamaClient(url, retries=2, backoff=0.01)
+
+    with pytest.raises(OllamaError, match="after 3 attempts"):
+        client.embed(["hello"], "embed-model")
+    assert server.request_count == 3
+
+
+def test_client_errors_are_not_retried(stub):
+    server, url = stub()
+    client = OllamaClient(url, retries=3, backoff=0.01)
+
+    with pytest.raises(OllamaError, match="404"):
+        client._post("/api/unknown", {})
+    assert server.request_count == 1
+    assert client.stats()["retries"] == 0
+
+
+def test_unreachable_server_raises_ollama_error():
+    client = OllamaClient("http://127.0.0.1:9", retries=1, backoff=0.01, timeout=1)
+    with pytest.raises(OllamaError):
+        client.embed(["hello"], "embed-model")
+
+
+# ============================================================
+#   EMBED BATCHING
+# ============================================================
+
+def test_embed_sends_one_request_per_batch(stub):
+    server, url = stub(dim=16)
+    client = OllamaClient(url)
+    texts = [f"chunk {i}" for i in range(10)]
+
+    vectors = client.embed(texts, "embed-model", batch_size=4)
+
+    assert server.request_count == 3  # 4 + 4 + 2
+    assert vectors == [fake_embedding(t, 16) for t in texts]
+    assert client.stats()["embedded"] == 10
+
+
+def test_embed_of_nothing_makes_no_request(stub):
+    server, url = stub()
+    assert OllamaClient(url).embed([], "embed-model") == []
+    assert server.request_count == 0
+
+
+# ============================================================
+#   CHAT / GENERATE
+# ============================================================
+
+MESSAGES = [{"role": "user", "content": "tell me about the lighthouse keeper"}]
+TIMING_KEYS = {"prompt_eval_count", "prompt_eval_ms", "eval_count", "eval_ms",
+               "load_ms", "total_ms", "tokens_per_sec", "wall_ms"}
+
+
+def test_chat_without_streaming_returns_the_result(stub):
+    server, url = stub()
+    result = OllamaClient(url).chat(MESSAGES, "mistral:7b")
+
+    assert result["text"].strip() == fake_reply(MESSAGES[0]["content"], "mistral:7b")
+    assert result["done_reason"] == "stop"
+    assert TIMING_KEYS <= set(result)
+    assert result["eval_count"] == len(result["text"].split())
+    assert result["prompt_eval_count"] == len(MESSAGES[0]["content"]) // 4
+
+
+def test_streamed_chat_assembles_the_ndjson_chunks(stub):
+    server, url = stub()
+    client = OllamaClient(url)
+    expected = client.chat(MESSAGES, "mistral:7b")["text"]
+
+    stream = client.chat(MESSAGES, "mistral:7b", stream=True)
+    assert isinstance(stream, GenerationStream)
+    chunks = list(stream)
+
+    # one chunk per stub token, in order, and the final line carries the timings
+    assert len(chunks) == len(expected.split())
+    assert "".join(chunks).strip() == expected.strip()
+    assert stream.result["text"] == "".join(chunks)
+    assert stream.result["eval_count"] == len(chunks)
+    assert stream.result["eval_ms"] > 0 and stream.result["tokens_per_sec"] > 0
+    assert stream.first_chunk_seconds is not None
+    assert stream.first_chunk_seconds <= stream.result["wall_ms"] / 1000
+
+
+def test_streamed_and_plain_generate_agree(stub):
+    server, url = stub()
+    client = OllamaClient(url)
+
+    plain = client.generate("why is the sky blue", "mistral:7b")
+    stream = client.generate("why is the sky blue", "mistral:7b", stream=True)
+    text = "".join(stream)
+
+    assert text.strip() == plain["text"].strip()
+    assert stream.result["prompt_eval_count"] == plain["prompt_eval_count"]
+    assert plain["context"] and stream.result["context"] == plain["context"]
+
+
+def test_generate_continues_from_a_context(stub):
+    server, url = stub()
+    client = OllamaClient(url)
+
+    first = client.generate("first turn", "mistral:7b")
+    second = client.generate("second turn", "mistral:7b", context=first["context"])
+
+    assert second["context"][:len(first["context"])] == first["context"]
+    assert len(second["context"]) > len(first["context"])
+
+
+def test_streaming_stops_on_a_server_error_line():
+    class _Resp:
+        def iter_lines(self):
+            yield b'{"message": {"content": "partial "}, "done": false}'
+            yield b'{"error": "model crashed"}'
+
+        def close(self):
+            pass
+
+    stream = GenerationStream(_Resp(), time.perf_counter())
+    chunks = []
+    with pytest.raises(OllamaError, match="model crashed"):
+        for chunk in stream:
+            chunks.append(chunk)
+    assert chunks == ["partial "] and stream.result is None
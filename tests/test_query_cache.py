@@ -0,0 +1,36 @@
+import json
+import time
+
+from knowledge_base.code import query_cache
+from knowledge_base.code.query_cache import QueryEmbeddingCache
+
+
+def test_misses_are_written_in_one_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_FLUSH_SECONDS", 60.0)
+    path = tmp_path / "query_cache.json"
+    cache = QueryEmbeddingCache(path)
+
+    for i in range(20):
+        assert cache.get(f"question {i}", "embed") is None
+        cache.put(f"question {i}", "embed", [float(i), 0.5])
+    assert not path.exists() and cache.stats()["saves"] == 0
+
+    cache.flush()
+    cache.flush()  # nothing new: no second write
+    assert cache.stats()["saves"] == 1
+    assert len(json.loads(path.read_text())) == 20
+
+    reloaded = QueryEmbeddingCache(path)
+    assert reloaded.get("Question  7", "embed") == [7.0, 0.5]
+
+
+def test_unsaved_entries_are_flushed_by_the_timer(tmp_path, monkeypatch):
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_FLUSH_SECONDS", 0.05)
+    path = tmp_path / "query_cache.json"
+    cache = QueryEmbeddingCache(path)
+    cache.put("question", "embed", [1.0])
+
+    deadline = time.monotonic() + 2
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.stats()["saves"] == 1 and path.exists()
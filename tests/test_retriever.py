@@ -0,0 +1,41 @@
+from knowledge_base.code.embedding_store import StoreWriter, compact_store
+from knowledge_base.code.retriever import ResidentIndex
+
+
+def _write_store(base, files):
+    with StoreWriter(base) as w:
+        for file, vectors in files.items():
+            for i, vec in enumerate(vectors):
+                w.add(f"{file}:{i}", file, f"{file} chunk {i}", vec)
+
+
+def test_reload_across_a_compaction_closes_the_old_store(tmp_path):
+    base = tmp_path / "index"
+    _write_store(base, {"a.py": [[1.0, 0.0], [0.9, 0.1]], "b.py": [[0.0, 1.0]]})
+    resident = ResidentIndex(base)
+    first = resident.get()
+    assert len(first) == 3
+
+    with StoreWriter(base, append=True) as w:
+        w.remove_file("a.py")
+    compact_store(base)
+
+    top = resident.search([0.0, 1.0], top_k=5)
+    assert [chunk["file"] for _, chunk in top] == ["b.py"]
+    assert resident.stats()["reload_count"] == 1
+    assert first._vec_map is None and first._text_map is None
+
+
+def test_old_store_stays_open_until_in_flight_searches_finish(tmp_path):
+    base = tmp_path / "index"
+    _write_store(base, {"a.py": [[1.0, 0.0]]})
+    resident = ResidentIndex(base)
+    state = resident._acquire()  # a search that is still running
+    old = state[0]
+
+    _write_store(base, {"a.py": [[1.0, 0.0]], "b.py": [[0.0, 1.0]]})
+    assert len(resident.get()) == 2
+    assert old._vec_map is not None and old.text(0) == "a.py chunk 0"
+
+    resident._release(state)
+    assert old._vec_map is None
@@ -0,0 +1,63 @@
+import memory.conversation as mem
+import llm.generation as generation
+from llm.ollama_client import OllamaClient
+from llm.prompt_builder import build_messages_for_model
+from llm.session import ModelSession
+
+MODEL_NAME = "Fast (Mistral 7B)"
+
+
+def _turn(conversation, session, text):
+    conversation.append({"role": "user", "content": text, "is_code": False})
+    messages = build_messages_for_model(text, results=[], conversation=conversation)
+    stream = generation.stream_model_reply(messages, MODEL_NAME)
+    reply = "".join(stream)
+    conversation.append({"role": "assistant", "content": reply.strip(), "is_code": False})
+    return messages
+
+
+def _session_for(monkeypatch, url):
+    client = OllamaClient(url)
+    session = ModelSession(generation.MODELS[MODEL_NAME])
+    monkeypatch.setattr(generation, "get_client", lambda: client)
+    monkeypatch.setattr(generation, "get_session", lambda model: session)
+    monkeypatch.setattr(mem, "loaded_history", "")
+    return session
+
+
+def _cold(session):
+    # the estimate counts role labels the stub doesn't: a few tokens per message
+    return session.last_avoided < max(20, 0.05 * session._pending_tokens)
+
+
+def test_turns_share_the_history_prefix_and_report_server_prefill(stub, monkeypatch):
+    server, url = stub(prompt_cache=True)
+    session = _session_for(monkeypatch, url)
+    conversation = []
+
+    _turn(conversation, session, "tell me about the lighthouse " * 200)
+    assert _cold(session)
+    # the first request began with the retrieved context, so nothing is shared yet
+    _turn(conversation, session, "and the keeper?")
+    assert session.shared == 0 and _cold(session)
+
+    messages = _turn(conversation, session, "and the sea?")
+    # the history up to the previous turn is shared; the retrieved context
+    # is last and only this turn's is sent
+    assert session.shared == 2
+    assert sum(m["content"].startswith("Use the following context") for m in messages) == 1
+    assert session.last_avoided > 1000
+    assert session.stats()["prefilled_tokens"] < session.stats()["prompt_tokens"]
+
+
+def test_rewritten_history_starts_over(stub, monkeypatch):
+    server, url = stub(prompt_cache=True)
+    session = _session_for(monkeypatch, url)
+    conversation = []
+    for text in ("tell me about the lighthouse " * 200, "and the keeper?", "and the sea?"):
+        _turn(conversation, session, text)
+
+    # a summary replaces the oldest messages: nothing before it is reusable
+    conversation[:2] = [{"role": "summary", "content": "a keeper and a lighthouse", "is_code": False}]
+    _turn(conversation, session, "what happened next?")
+    assert session.shared == 0 and _cold(session)
@@ -0,0 +1,57 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from knowledge_base.code import retriever, sharded
+from knowledge_base.code.embedding_store import StoreWriter
+from knowledge_base.code.retriever import ResidentIndex
+from knowledge_base.code.scoring import ScoringEngine
+from knowledge_base.code.sharded import ShardedEngine
+
+
+@pytest.fixture
+def small_shards(monkeypatch):
+    monkeypatch.setattr(sharded, "SHARD_MIN_CHUNKS", 0)
+    monkeypatch.setattr(retriever, "SHARD_MIN_CHUNKS", 0)
+    monkeypatch.setattr(retriever, "SCORING_SHARDS", 2)
+    yield
+    sharded.shutdown_pool()
+
+
+def _write_store(base, rows, seed):
+    vectors = np.random.default_rng(seed).standard_normal((rows, 8)).tolist()
+    with StoreWriter(base) as w:
+        for i, vec in enumerate(vectors):
+            w.add(f"f.py:{i}", "f.py", f"chunk {i}", vec)
+
+
+def test_sharded_top_k_matches_the_single_matrix_engine(small_shards):
+    matrix = np.random.default_rng(3).standard_normal((500, 16)).astype(np.float32)
+    single = ScoringEngine([{"embedding": row.tolist(), "text": str(i)} for i, row in enumerate(matrix)])
+    engine = ShardedEngine.from_matrix(matrix, 2)
+    try:
+        for q in np.random.default_rng(4).standard_normal((5, 16)):
+            rows, _ = engine.top_rows(engine.normalize_query(q), 5)
+            expected = [int(c["text"]) for _, c in single.search(q.tolist(), 5)]
+            assert rows.tolist() == expected
+    finally:
+        engine.close()
+
+
+def test_reload_builds_shards_for_the_new_generation(tmp_path, small_shards):
+    base = tmp_path / "index"
+    _write_store(base, 300, seed=1)
+    resident = ResidentIndex(base)
+    assert resident.search([1.0] * 8, top_k=3)
+    old = resident._state[1]
+    old_name = old._shm.name
+    assert resident.stats()["shards"] == 2
+
+    _write_store(base, 400, seed=2)
+    assert len(resident.search([1.0] * 8, top_k=3)) == 3
+    new = resident._state[1]
+    assert new.generation == resident.get().generation != old.generation
+    # the retired block is gone once no search holds it
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=old_name)
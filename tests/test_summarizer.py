@@ -0,0 +1,101 @@
+import pytest
+
+import memory.conversation as mem
+import llm.summarizer as summarizer
+
+
+class _HeldScheduler:
+    """Keeps submitted jobs until the test runs them (a busy SUMMARIZATION queue)."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.jobs.append(fn)
+
+
+@pytest.fixture
+def conversation(monkeypatch):
+    held = _HeldScheduler()
+    monkeypatch.setattr(summarizer, "get_scheduler", lambda: held)
+    monkeypatch.setattr(summarizer, "summarize_messages",
+                        lambda msgs, model, scheduled=True: f"summary of {len(msgs)}")
+    monkeypatch.setattr(summarizer, "_is_summarizing", False)
+    mem.clear_conversation()
+    for i in range(6):
+        mem.append_message("user" if i % 2 == 0 else "assistant", f"message {i}")
+    yield held
+    mem.clear_conversation()
+
+
+def _auto(max_messages):
+    summarizer.trim_and_summarize_if_needed(max_messages, "summarizer", auto=True)
+
+
+def test_queued_summary_is_applied(conversation):
+    reported = []
+    summarizer.trim_and_summarize_if_needed(4, "summarizer", auto=True,
+                                            on_done=lambda: reported.append(True))
+    assert len(conversation.jobs) == 1 and not reported
+    conversation.jobs[0]()
+    assert reported == [True]
+    assert [m["content"] for m in mem.conversation_messages] == [
+        "summary of 2", "message 2", "message 3", "message 4", "message 5"]
+
+
+def test_queued_summary_skipped_after_clear(conversation):
+    _auto(4)
+    mem.clear_conversation()
+    mem.append_message("user", "fresh start")
+    conversation.jobs[0]()
+    assert [m["content"] for m in mem.conversation_messages] == ["fresh start"]
+    assert summarizer._is_summarizing is False
+
+
+def test_queued_summary_skipped_after_load(conversation):
+    _auto(4)
+    mem.conversation_messages.clear()
+    mem.conversation_messages.extend({"role": "user", "content": f"loaded {i}", "is_code": False}
+                                     for i in range(8))
+    mem.history_rewritten()
+    conversation.jobs[0]()
+    assert [m["content"] for m in mem.conversation_messages] == [f"loaded {i}" for i in range(8)]
+
+
+def test_over_budget_history_is_summarized_before_the_prompt_even_with_auto(conversation):
+    from llm.history_budget import history_tokens, plan_budget
+
+    code = "\n".join(f"line_{i} = {i}" for i in range(2000))
+    mem.conversation_messages.insert(0, {"role": "user", "content": code, "is_code": True})
+    model_name = "Fast (Mistral 7B)"
+    budget = plan_budget(model_name)["conversation"]
+    assert sum(history_tokens()) > budget
+
+    applied = summarizer.trim_and_summarize_if_needed(30, "summarizer", auto=True,
+                                                      model_name=model_name)
+
+    assert applied is True
+    assert sum(history_tokens()) <= budget
+    assert mem.conversation_messages[0]["role"] == "summary"
+    assert conversation.jobs == []  # nothing past max_messages left for the background
+
+
+def test_recent_turns_over_budget_are_cut_to_fit(conversation):
+    from llm.history_budget import plan_budget, recent_caps
+    from llm.prompt_builder import build_messages_for_model, estimate_tokens, _render
+
+    paste = "START\n" + "\n".join(f"log line {i}: nothing to see" for i in range(20000)) + "\nEND?"
+    mem.append_message("user", paste)
+    plan = plan_budget("Fast (Mistral 7B)")
+    assert estimate_tokens(paste) > plan["conversation"]
+
+    # summarizing can't help: the paste is one of the recent turns
+    summarizer.trim_and_summarize_if_needed(30, "summarizer", model_name="Fast (Mistral 7B)")
+    assert mem.conversation_messages[-1]["content"] == paste
+    assert list(recent_caps(plan["conversation"])) == [len(mem.conversation_messages) - 1]
+
+    messages = build_messages_for_model(paste, results=[], plan=plan)
+    conversation_part = [m for m in messages if not m["content"].startswith("Use the following context")]
+    assert sum(estimate_tokens(_render(m)) for m in conversation_part) <= plan["conversation"]
+    newest = messages[-1]["content"]
+    assert newest.startswith("START") and newest.endswith("END?") and "truncated" in newest
@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import math
+import time
+import heapq
+import hashlib
+import threading
+
+from tools.rag.rag_loader import COMPATIBLE_EXTENSIONS, read_text
+
+# Where inverted indexes are saved between runs (one file per searched folder)
+BM25_INDEX_DIR = os.path.join("knowledge_base", "embeddings")
+
+# BM25 tuning (standard defaults)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# A query re-scans the folder only when its mtime changed (a file was added,
+# removed or saved by rename), or at most this often (seconds) to catch
+# files edited in place, which don't touch the folder's mtime
+FULL_RESCAN_INTERVAL = 60.0
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Persistent inverted index over the text files in one folder.
+
+        postings: term -> {filename: term frequency}
+        docs:     filename -> {"size", "mtime_ns", "length", "terms"}
+
+    Only files whose size / mtime changed are re-read and re-tokenized, and
+    a query only walks the postings of its own terms.
+    """
+
+    def __init__(self, folder_path="knowledge_base", index_path=None):
+        self.folder_path = folder_path
+        if index_path is None:
+            folder_id = hashlib.sha1(os.path.abspath(folder_path).encode("utf-8")).hexdigest()[:10]
+            index_path = os.path.join(BM25_INDEX_DIR, f"bm25_{folder_id}.json")
+        self.index_path = index_path
+        self.postings = {}
+        self.docs = {}
+        self.total_length = 0
+        self._last_refresh = 0.0
+        self._folder_mtime = None
+        self._lock = threading.Lock()
+        self._load()
+
+    # ------------------------------------------------------------
+    #   persistence
+    # ------------------------------------------------------------
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("folder") != os.path.abspath(self.folder_path):
+                return  # built for another folder
+            self.postings = data["postings"]
+            self.docs = data["docs"]
+            self.total_length = sum(d["length"] for d in self.docs.values())
+        except Exception as e:
+            print(f"BM25 index unreadable, rebuilding: {e}")
+            self.postings, self.docs, self.total_length = {}, {}, 0
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "folder": os.path.abspath(self.folder_path),
+                "postings": self.postings,
+                "docs": self.docs,
+            }, f)
+        os.replace(tmp, self.index_path)
+
+    # ------------------------------------------------------------
+    #   updates
+    # ------------------------------------------------------------
+    def _remove_doc(self, filename):
+        doc = self.docs.pop(filename)
+        self.total_length -= doc["length"]
+        for term in doc["terms"]:
+            plist = self.postings.get(term)
+            if plist is None:
+                continue
+            plist.pop(filename, None)
+            if not plist:
+                del self.postings[term]
+
+    def _add_doc(self, filename, st, content):
+        counts = {}
+        tokens = tokenize(content)
+        for tok in tokens:
+            counts[tok] = counts.get(tok, 0) + 1
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[filename] = tf
+        self.docs[filename] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "length": len(tokens),
+            "terms": list(counts),
+        }
+        self.total_length += len(tokens)
+
+    def refresh(self, force=False):
+        """
+        Re-index files that were added, changed or deleted since last time.
+        Without 'force' that costs one stat of the folder unless its mtime
+        moved or FULL_RESCAN_INTERVAL passed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            try:
+                folder_mtime = os.stat(self.folder_path).st_mtime_ns
+            except OSError:
+                folder_mtime = None
+            if (not force and folder_mtime == self._folder_mtime
+                    and now - self._last_refresh < FULL_RESCAN_INTERVAL):
+                return
+            self._last_refresh = now
+            self._folder_mtime = folder_mtime
+
+            changed = False
+            seen = set()
+            for filename in os.listdir(self.folder_path):
+                if not filename.lower().endswith(COMPATIBLE_EXTENSIONS):
+                    continue
+                full_path = os.path.join(self.folder_path, filename)
+                try:
+                    st = os.stat(full_path)
+                except OSError:
+                    continue
+                if not os.path.isfile(full_path):
+                    continue
+                seen.add(filename)
+
+                doc = self.docs.get(filename)
+                if doc and doc["size"] == st.st_size and doc["mtime_ns"] == st.st_mtime_ns:
+                    continue
+
+                content = read_text(full_path)
+                if content is None:
+                    continue
+                if doc:
+                    self._remove_doc(filename)
+                self._add_doc(filename, st, content)
+                changed = True
+
+            for filename in [f for f in self.docs if f not in seen]:
+                self._remove_doc(filename)
+                changed = True
+
+            if changed:
+                self._save()
+
+    # ------------------------------------------------------------
+    #   search
+    # ------------------------------------------------------------
+    def search(self, query, limit=3):
+        """Return [(score, filename)] best first, scored with BM25."""
+        self.refresh()
+
+        with self._lock:
+            n_docs = len(self.docs)
+            if not n_docs:
+                return []
+            avg_len = self.total_length / n_docs or 1.0
+
+            scores = {}
+            for term in set(tokenize(query)):
+                plist = self.postings.get(term)
+                if not plist:
+                    continue
+                df = len(plist)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for filename, tf in plist.items():
+                    length = self.docs[filename]["length"]
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+                    scores[filename] = scores.get(filename, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda x: x[1])
+        return [(score, filename) for filename, score in ranked]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_bm25_index(folder_path="knowledge_base"):
+    """One shared index per folder, loaded from disk on first use."""
+    with _indexes_lock:
+        if folder_path not in _indexes:
+            _indexes[folder_path] = BM25Index(folder_path)
+        return _indexes[folder_path]
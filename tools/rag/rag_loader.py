@@ -1,25 +1,25 @@
 import os
 
+COMPATIBLE_EXTENSIONS = (".txt", ".md", ".py", ".json")
+
 def load_documents(folder_path = "knowledge_base"):
     """ 
     Loads all text like files from knowledge base folder
     Returns a list of dicts: {'filename': str, 'content':str}
     """
 
-    compatible_extensions = (".txt", ".md", ".py", ".json")
-
     documents = []
 
     for filename in os.listdir(folder_path):
-        if not filename.lower().endswith(compatible_extensions):
+        if not filename.lower().endswith(COMPATIBLE_EXTENSIONS):
             continue  # Inverted if for fewer nests
 
         full_path = os.path.join(folder_path, filename)
 
-        if not can_load_file(full_path):
+        # one read per file (used to open it once to test and again to read)
+        content = read_text(full_path)
+        if content is None:
             continue
-
-        content = read_file_content(full_path)
         
         documents.append({
             "filename" : filename,
@@ -28,6 +28,15 @@ def load_documents(folder_path = "knowledge_base"):
 
     return documents
 
+def read_text(filepath):
+    """Read a file once; returns None (and logs) if it can't be read."""
+    try:
+        with open(filepath, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception as e:
+        print(f"Failed to open {filepath}: {e}")
+        return None
+
 def can_load_file(filepath):
     try:
         with open(filepath, "r", encoding="utf-8") as f:
@@ -1,13 +1,34 @@
-from tools.rag.rag_loader import load_documents
+from tools.rag.rag_loader import load_documents, read_text
+from tools.rag.bm25_index import get_bm25_index
+import os
 
-def simple_search(query, limit=3):
+def simple_search(query, limit=3, mode="bm25", folder_path="knowledge_base"):
+    """
+    Returns the most relevant documents for the query.
+
+    mode="bm25"    -> BM25 over a persistent inverted index (bm25_index.py),
+                      only the returned files are read
+    mode="overlap" -> the original keyword-overlap scoring over every file
+    """
+    if mode == "overlap":
+        return overlap_search(query, limit, folder_path)
+
+    top_docs = []
+    for score, filename in get_bm25_index(folder_path).search(query, limit):
+        content = read_text(os.path.join(folder_path, filename))
+        if content is None:
+            continue
+        top_docs.append({"filename": filename, "content": content, "score": score})
+    return top_docs
+
+def overlap_search(query, limit=3, folder_path="knowledge_base"):
     """
     Returns the most relevant documents based on keyword overlap.
     Plan to make this more robust and use embeddings later, but not yet.
     """
 
     query_words = set(query.lower().split())
-    docs = load_documents()
+    docs = load_documents(folder_path)
 
     scored_docs = []
 